@@ -4,17 +4,23 @@ from pathlib import Path
 import json
 import sys
 import os
+import uuid
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from utils.llm.llm_manager import LLMManager, ModelProvider
+from utils.llm.tokenizer import get_token_counter
+from utils.llm.prompt_builder import PromptBuilder, PRIORITY_REQUIRED, PRIORITY_HIGH, PRIORITY_MEDIUM, PRIORITY_LOW
 from utils.rate_limiter import RateLimiter
 from utils.question_detector import QuestionDetector, QuestionType
 from utils.code_analyzer import CodeAnalyzer
 from utils.algorithm_simulator import AlgorithmSimulator
 from utils.analytics import get_analytics
 from utils.material_reader import get_material_reader
+from utils.response_cache import get_response_cache
+from utils.conversation_summarizer import ConversationSummarizer
+from utils.request_pipeline import StageTimer, precheck_message, template_reply, TRUNCATED_NOTE
 from dotenv import load_dotenv
 
 st.set_page_config(
@@ -98,6 +104,9 @@ if "uploaded_code" not in st.session_state:
 if "code_analysis" not in st.session_state:
     st.session_state.code_analysis = None
 
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = uuid.uuid4().hex
+
 # Initialize LLM Manager and Rate Limiter
 @st.cache_resource
 def init_llm_manager():
@@ -120,8 +129,8 @@ def init_rate_limiter():
 
 @st.cache_resource
 def init_question_detector():
-    """Initialize Question Detector"""
-    return QuestionDetector()
+    """Initialize Question Detector (local model if trained, keyword rules otherwise)"""
+    return QuestionDetector.from_env()
 
 @st.cache_resource
 def init_code_analyzer():
@@ -138,6 +147,20 @@ def init_material_reader():
     """Initialize Material Reader"""
     return get_material_reader()
 
+@st.cache_resource
+def init_conversation_summarizer(_llm_manager, recent_tokens: int):
+    """Initialize Conversation Summarizer (shared by all sessions), None if disabled"""
+    if _llm_manager is None or os.getenv("HISTORY_SUMMARIZATION", "true").lower() != "true":
+        return None
+    return ConversationSummarizer(_llm_manager, recent_tokens=recent_tokens)
+
+@st.cache_resource
+def init_response_cache():
+    """Initialize Response Cache (shared by all sessions), None if disabled"""
+    if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    return get_response_cache()
+
 # Load system prompt
 def load_system_prompt():
     """Load system prompt from file"""
@@ -170,7 +193,38 @@ question_detector = init_question_detector()
 code_analyzer = init_code_analyzer()
 algorithm_simulator = init_algorithm_simulator()
 material_reader = init_material_reader()
+response_cache = init_response_cache()
+# Token cap for the conversation turns sent verbatim with each request
+history_token_cap = int(os.getenv("HISTORY_TOKEN_CAP", "1500"))
+conversation_summarizer = init_conversation_summarizer(llm_manager, history_token_cap)
 system_prompt = load_system_prompt()
+# The base system prompt is the same for every request: cache it provider-side
+if llm_manager:
+    llm_manager.register_static_prefix(system_prompt)
+
+def format_error_message(error_msg):
+    """Turn a provider error message into a user-friendly chat reply"""
+    error_msg = error_msg or "Unknown error"
+    if 'quota' in error_msg.lower() or 'insufficient_quota' in error_msg.lower():
+        full_response = "⚠️ **Quota API habis**\n\n"
+        full_response += "Model yang dipilih sudah mencapai batas quota. "
+        full_response += "Silakan:\n"
+        full_response += "- Coba lagi nanti\n"
+        full_response += "- Hubungi admin untuk mengatur ulang API key\n"
+        full_response += "- Atau admin bisa mengubah model di halaman Admin"
+    elif 'rate limit' in error_msg.lower():
+        full_response = "⚠️ **Rate limit tercapai**\n\n"
+        full_response += "Terlalu banyak request dalam waktu singkat. Tunggu beberapa saat dan coba lagi."
+    else:
+        full_response = f"⚠️ **Terjadi kesalahan**\n\n{error_msg}\n\n"
+        full_response += "Silakan coba lagi atau hubungi admin."
+    return full_response
+
+def get_previous_answer():
+    """Previous assistant reply (without the model info footer), used as cache context"""
+    if len(st.session_state.messages) >= 2 and st.session_state.messages[-2]["role"] == "assistant":
+        return st.session_state.messages[-2]["content"].split("\n\n<sub>")[0]
+    return None
 
 # Load chat history from localStorage (simulated via session state)
 def load_chat_history():
@@ -370,13 +424,24 @@ message_count = len(st.session_state.messages)
 if message_count > 0:
     st.sidebar.caption(f"📊 {message_count} pesan dalam sesi ini")
     
-    # Context info
-    max_context = 10
-    context_count = min(message_count, max_context)
-    st.sidebar.caption(f"🧠 Mengingat {context_count} pesan terakhir")
+    # Context info (from the last request's prompt report)
+    prompt_report = st.session_state.get("last_prompt_report")
+    if prompt_report:
+        sections = {section["name"]: section for section in prompt_report["sections"]}
+        context_count = sections["history"]["items_included"] if "history" in sections else 0
+        memory_info = f"🧠 Mengingat {context_count} pesan terakhir"
+        if sections.get("summary", {}).get("status") == "included":
+            memory_info += " + ringkasan percakapan sebelumnya"
+        st.sidebar.caption(memory_info)
+    
+    # Where the last request spent its time (precheck, retrieval, prompt assembly, LLM, ...)
+    if st.session_state.get("last_stage_timings"):
+        st.sidebar.caption(f"⏱️ {st.session_state.last_stage_timings}")
 
 # Clear conversation button
 if st.sidebar.button("🗑️ Hapus Riwayat Chat", use_container_width=True):
+    if conversation_summarizer:
+        conversation_summarizer.reset(st.session_state.conversation_id)
     st.session_state.messages = []
     st.session_state.uploaded_code = None
     st.session_state.code_analysis = None
@@ -491,158 +556,236 @@ if prompt := st.chat_input("Tanyakan tentang algoritma..."):
     # Generate bot response
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
+        timer = StageTimer()
+        analytics_user_id = st.session_state.get("name", f"session_{id(st.session_state)}")
         
-        if llm_manager is None:
+        # Cheap checks first: empty, repeated and greeting messages are answered from templates
+        with timer.stage("precheck"):
+            quick_reply = precheck_message(
+                prompt,
+                st.session_state.messages[:-1],
+                has_uploaded_code=st.session_state.uploaded_code is not None
+            )
+        detection = None
+        
+        if quick_reply is None and llm_manager is None:
             full_response = "⚠️ Maaf, sistem LLM belum tersedia. Pastikan API key sudah dikonfigurasi di halaman Admin."
             message_placeholder.markdown(full_response)
-        else:
+        elif quick_reply is None:
             try:
                 # Show loading indicator
                 message_placeholder.markdown("💭 Sedang berpikir...")
                 
-                # DETECT QUESTION TYPE
-                has_uploaded_code = st.session_state.uploaded_code is not None
-                detection = question_detector.detect(prompt, has_uploaded_code)
-                response_strategy = question_detector.get_response_strategy(detection)
-                
-                # BUILD ENHANCED PROMPT
-                enhanced_system_prompt = system_prompt
-                
-                # Add learning materials if available
-                materials_text = material_reader.get_all_materials_text(max_chars=5000)
-                if materials_text:
-                    enhanced_system_prompt += f"\n\n{materials_text}"
-                    enhanced_system_prompt += "PENTING: Gunakan materi di atas sebagai referensi utama saat menjawab pertanyaan. Jika ada informasi relevan di materi, sebutkan dan gunakan sebagai acuan.\n\n"
-                
-                # Add response strategy guidance
-                enhanced_system_prompt += f"\n\n---\nSTRATEGI RESPONS:\n{response_strategy['guidance']}\n"
+                # DETECT QUESTION TYPE (homework is answered from a template, before any prompt assembly)
+                with timer.stage("classify"):
+                    has_uploaded_code = st.session_state.uploaded_code is not None
+                    detection = question_detector.detect(prompt, has_uploaded_code)
+                    response_strategy = question_detector.get_response_strategy(detection)
+                    quick_reply = template_reply(response_strategy)
+            except Exception as e:
+                full_response = f"⚠️ Terjadi kesalahan tidak terduga: {str(e)}"
+                message_placeholder.markdown(full_response)
+        
+        if quick_reply is not None:
+            full_response = quick_reply["response"]
+            message_placeholder.markdown(full_response)
+            get_analytics().log_chat(
+                analytics_user_id,
+                timer.total,
+                success=True,
+                provider="template",
+                model=quick_reply["kind"],
+                question_type=detection["type"].value if detection else None,
+                question=prompt,
+                stages=timer.stages
+            )
+        elif detection is not None:
+            try:
+                # Look up the response cache first: a hit needs no retrieval or prompt assembly
+                # (never for questions about uploaded code)
+                cache_namespace = None
+                cached = None
+                if response_cache and not has_uploaded_code and not detection["needs_code_analysis"]:
+                    with timer.stage("cache_lookup"):
+                        lookup_start = time.time()
+                        cache_namespace = response_cache.make_namespace(
+                            detection["type"].value,
+                            system_prompt,
+                            context=get_previous_answer()
+                        )
+                        # Reuse an answer only if its materials are unchanged and none was added since
+                        cached = response_cache.get(
+                            prompt,
+                            cache_namespace,
+                            is_valid=lambda meta: material_reader.documents_current(meta.get("materials", {}), meta.get("indexed"))
+                        )
+                    get_analytics().log_cache_event(hit=cached is not None)
                 
-                # Add code analysis if available
-                if st.session_state.code_analysis:
-                    analysis = st.session_state.code_analysis
-                    enhanced_system_prompt += f"\n\n---\nANALISIS KODE USER:\n"
-                    enhanced_system_prompt += f"Kode: {st.session_state.uploaded_code[:500]}...\n"
-                    enhanced_system_prompt += f"Valid: {analysis['is_valid']}\n"
-                    enhanced_system_prompt += f"Algoritma: {', '.join(analysis.get('algorithms', []))}\n"
-                    enhanced_system_prompt += f"Kompleksitas: {analysis['complexity_indicators'].get('estimated_time_complexity', 'N/A')}\n"
+                if cached:
+                    streamed_text = cached["response"]
+                    lookup_time = time.time() - lookup_start
+                    result = {
+                        "response": streamed_text,
+                        "model": cached["metadata"].get("model", "N/A"),
+                        "provider": cached["metadata"].get("provider", "N/A"),
+                        "error": False,
+                        "error_message": None,
+                        "from_cache": True,
+                        "time_to_first_token": lookup_time,
+                        "total_time": lookup_time
+                    }
+                else:
+                    # BUILD ENHANCED PROMPT (packed by priority into the model's token budget)
+                    # Add the material passages relevant to this question (BM25 retrieval)
+                    with timer.stage("retrieval"):
+                        materials = material_reader.get_relevant_materials(
+                            prompt,
+                            max_tokens=int(os.getenv("MATERIALS_TOKEN_BUDGET", "1200"))
+                        )
                     
-                    if analysis.get('learning_points'):
-                        enhanced_system_prompt += f"Learning Points:\n"
-                        for point in analysis['learning_points'][:3]:
-                            enhanced_system_prompt += f"- {point}\n"
+                    with timer.stage("prompt_assembly"):
+                        prompt_builder = llm_manager.create_prompt_builder()
+                        prompt_builder.set_prompt(prompt)
+                        prompt_builder.add_section("system", system_prompt, priority=PRIORITY_REQUIRED)
+                        prompt_builder.add_items(
+                            "materials",
+                            materials["passages"],
+                            priority=PRIORITY_MEDIUM,
+                            header="\n\n=== MATERI PEMBELAJARAN ===\n\n",
+                            footer="=== END MATERI ===\n\nPENTING: Gunakan materi di atas sebagai referensi utama saat menjawab pertanyaan. Jika ada informasi relevan di materi, sebutkan dan gunakan sebagai acuan.\n\n"
+                        )
+                        
+                        # Add response strategy guidance
+                        prompt_builder.add_section(
+                            "strategy",
+                            f"\n\n---\nSTRATEGI RESPONS:\n{response_strategy['guidance']}\n",
+                            priority=PRIORITY_REQUIRED
+                        )
+                        
+                        # Add code analysis if available
+                        if st.session_state.code_analysis:
+                            analysis = st.session_state.code_analysis
+                            analysis_text = f"\n\n---\nANALISIS KODE USER:\n"
+                            analysis_text += f"Valid: {analysis['is_valid']}\n"
+                            analysis_text += f"Algoritma: {', '.join(analysis.get('algorithms', []))}\n"
+                            analysis_text += f"Kompleksitas: {analysis['complexity_indicators'].get('estimated_time_complexity', 'N/A')}\n"
+                            
+                            if analysis.get('learning_points'):
+                                analysis_text += f"Learning Points:\n"
+                                for point in analysis['learning_points'][:3]:
+                                    analysis_text += f"- {point}\n"
+                            
+                            # Add guided questions
+                            guided_q = code_analyzer.get_guided_questions(analysis)
+                            if guided_q:
+                                analysis_text += f"\nPertanyaan Pemandu:\n"
+                                for q in guided_q[:3]:
+                                    analysis_text += f"- {q}\n"
+                            prompt_builder.add_section("code_analysis", analysis_text, priority=PRIORITY_HIGH)
+                            
+                            # The code itself is cut to whatever budget is left
+                            prompt_builder.add_section(
+                                "code",
+                                f"Kode:\n```python\n{st.session_state.uploaded_code}\n```\n",
+                                priority=PRIORITY_HIGH,
+                                truncate=True
+                            )
+                        
+                        # Previous turns (the current prompt is sent separately). Older turns
+                        # are replaced by the running summary; the builder keeps the newest
+                        # remaining turns that fit the history cap
+                        history_messages = [{"role": msg["role"], "content": msg["content"]} for msg in st.session_state.messages[:-1]]
+                        if conversation_summarizer:
+                            history = conversation_summarizer.get_context(st.session_state.conversation_id, history_messages)
+                            history_messages = history["messages"]
+                            if history["summary"]:
+                                prompt_builder.add_section(
+                                    "summary",
+                                    f"\n\n---\nRINGKASAN PERCAKAPAN SEBELUMNYA:\n{history['summary']}\n",
+                                    priority=PRIORITY_MEDIUM
+                                )
+                        prompt_builder.add_history(history_messages, priority=PRIORITY_LOW, max_tokens=history_token_cap)
+                        built_prompt = prompt_builder.build()
+                        enhanced_system_prompt = built_prompt["system_prompt"]
+                        conversation_history = built_prompt["conversation_history"]
+                        prompt_report = built_prompt["report"]
+                        st.session_state.last_prompt_report = prompt_report
                     
-                    # Add guided questions
-                    guided_q = code_analyzer.get_guided_questions(analysis)
-                    if guided_q:
-                        enhanced_system_prompt += f"\nPertanyaan Pemandu:\n"
-                        for q in guided_q[:3]:
-                            enhanced_system_prompt += f"- {q}\n"
-                
-                # HANDLE HOMEWORK REJECTION
-                if response_strategy["should_reject"]:
-                    full_response = """
-🚫 **Maaf, saya tidak bisa membantu mengerjakan tugas atau ujian secara langsung.**
-
-Ini adalah chatbot pembelajaran yang dirancang untuk **membimbing proses berpikir**, bukan memberikan jawaban siap pakai.
-
-**Yang bisa saya lakukan:**
-- Menjelaskan **konsep** yang mendasari tugas kamu
-- Membantu kamu **memahami algoritma** yang relevan
-- Memberikan **pertanyaan pemandu** untuk arahkan cara berpikir
-- Diskusi tentang **pendekatan** yang bisa dicoba
-
-**Coba tanyakan seperti ini:**
-- "Jelaskan konsep [topik] yang dipakai dalam tugas ini"
-- "Bagaimana cara kerja algoritma [nama algoritma]?"
-- "Apa pendekatan yang bisa saya pakai untuk soal seperti ini?"
-
-Mari belajar bersama! 🎓
-"""
-                    message_placeholder.markdown(full_response)
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
-                    st.stop()
-                
-                # Get conversation history for context (last 10 messages for better context)
-                conversation_history = []
-                max_context_messages = 10  # Increased from 5 to 10 for better learning experience
-                
-                # Get the last N messages (including current user prompt)
-                # If we have more than max_context messages, take the last N
-                # Otherwise, take all available messages
-                total_messages = len(st.session_state.messages)
-                if total_messages <= max_context_messages:
-                    # Take all messages
-                    context_messages = st.session_state.messages[:]
-                else:
-                    # Take last N messages
-                    context_messages = st.session_state.messages[-max_context_messages:]
-                
-                # Build conversation history for LLM
-                for msg in context_messages:
-                    conversation_history.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-
-                
-                # Generate response with enhanced prompt
-                start_time = time.time()
-                result = llm_manager.generate_response(
-                    prompt=prompt,
-                    system_prompt=enhanced_system_prompt,
-                    temperature=0.7,
-                    conversation_history=conversation_history
-                )
-                response_time = time.time() - start_time
+                    # Stream response with enhanced prompt
+                    streamed_text = ""
+                    result = None
+                    with timer.stage("llm"):
+                        for chunk in llm_manager.generate_streaming_response(
+                            prompt=prompt,
+                            system_prompt=enhanced_system_prompt,
+                            temperature=0.7,
+                            conversation_history=conversation_history,
+                            include_metadata=True
+                        ):
+                            if isinstance(chunk, dict):
+                                # Final event: provider, model, usage and timings
+                                result = chunk
+                                continue
+                            streamed_text += chunk
+                            message_placeholder.markdown(streamed_text + "▌")
+                    
+                    # Teach the offline token estimator from the provider's real count
+                    usage = result.get("usage") or {}
+                    if usage.get("prompt_tokens") and not result.get("cached") and result.get("model") == prompt_report["model"]:
+                        get_token_counter(result["model"]).calibrate(prompt_report["used_tokens"], usage["prompt_tokens"])
+                    
+                    if cache_namespace and not result["error"] and streamed_text:
+                        response_cache.put(prompt, cache_namespace, streamed_text, {
+                            "model": result.get("model"),
+                            "provider": result.get("provider"),
+                            "materials": materials["documents"],
+                            "indexed": materials["indexed"]
+                        })
                 
                 # Log analytics
                 analytics = get_analytics()
-                user_id = st.session_state.get("name", f"session_{id(st.session_state)}")
-                analytics.log_chat(user_id, response_time, success=not result["error"])
+                analytics.log_chat(
+                    analytics_user_id,
+                    result["total_time"],
+                    success=not result["error"],
+                    time_to_first_token=result.get("time_to_first_token"),
+                    provider="cache" if result.get("from_cache") or result.get("cached") else result.get("provider"),
+                    model=result.get("model"),
+                    question_type=detection["type"].value,
+                    question=prompt,
+                    stages=timer.stages
+                )
                 
-                if result["error"]:
-                    # Show user-friendly error message based on error type
-                    error_msg = result['error_message']
-                    if 'quota' in error_msg.lower() or 'insufficient_quota' in error_msg.lower():
-                        full_response = "⚠️ **Quota API habis**\n\n"
-                        full_response += "Model yang dipilih sudah mencapai batas quota. "
-                        full_response += "Silakan:\n"
-                        full_response += "- Coba lagi nanti\n"
-                        full_response += "- Hubungi admin untuk mengatur ulang API key\n"
-                        full_response += "- Atau admin bisa mengubah model di halaman Admin"
-                    elif 'rate limit' in error_msg.lower():
-                        full_response = "⚠️ **Rate limit tercapai**\n\n"
-                        full_response += "Terlalu banyak request dalam waktu singkat. Tunggu beberapa saat dan coba lagi."
-                    else:
-                        full_response = f"⚠️ **Terjadi kesalahan**\n\n{error_msg}\n\n"
-                        full_response += "Silakan coba lagi atau hubungi admin."
+                if result["error"] and not streamed_text:
+                    full_response = format_error_message(result["error_message"])
                 else:
-                    # Success - show response
-                    full_response = result["response"]
+                    # Success (or partial answer if the stream broke midway)
+                    full_response = streamed_text
+                    if result["error"]:
+                        full_response += f"\n\n{TRUNCATED_NOTE}: {result['error_message']}*"
                     
-                    # Show provider info with fallback indicator
-                    if result.get("used_fallback"):
+                    # Show provider info with fallback / cache indicator
+                    if result.get("from_cache") or result.get("cached"):
+                        provider_info = f"\n\n<sub>*⚡ Dari cache ({result.get('model', 'N/A')}) | Type: {detection['type'].value}*</sub>"
+                    elif result.get("used_fallback"):
                         provider_info = f"\n\n<sub>*⚠️ Primary model error, menggunakan fallback: {result.get('model', 'N/A')} ({result.get('provider', 'N/A')})*</sub>"
                     else:
-                        provider_info = f"\n\n<sub>*Model: {result.get('model', 'N/A')} | Type: {detection['type'].value}*</sub>"
+                        provider_info = f"\n\n<sub>*Model: {result.get('model', 'N/A')} | Type: {detection['type'].value} | Konteks: {PromptBuilder.describe(prompt_report)}*</sub>"
                     full_response += provider_info
                 
-                # Display with typing effect (simulated)
-                words = full_response.split()
-                displayed_text = ""
-                for i, word in enumerate(words):
-                    displayed_text += word + " "
-                    if i % 3 == 0:  # Update every 3 words for smooth effect
-                        message_placeholder.markdown(displayed_text + "▌")
-                        time.sleep(0.05)
-                
                 message_placeholder.markdown(full_response)
             
             except Exception as e:
                 full_response = f"⚠️ Terjadi kesalahan tidak terduga: {str(e)}"
                 message_placeholder.markdown(full_response)
+        
+        st.session_state.last_stage_timings = timer.describe()
 
     st.session_state.messages.append({"role": "assistant", "content": full_response})
+    
+    # Fold turns that left the recent window into the summary (background)
+    if conversation_summarizer:
+        conversation_summarizer.schedule(st.session_state.conversation_id, st.session_state.messages)
 
 # File upload handling
 if uploaded_file is not None:
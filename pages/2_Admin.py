@@ -17,6 +17,11 @@ import sys
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from utils.analytics import get_analytics
+from utils.response_cache import get_response_cache
+from utils.llm.prompt_cache import get_prompt_cache
+from utils.llm.context_cache import get_context_cache
+from utils.material_reader import get_material_reader
+from utils.material_ingest import get_ingestor
 from utils.theme_manager import ThemeManager
 
 
@@ -126,6 +131,7 @@ MENU = [
     "⚡ Rate Limit",
     "📄 System Prompt",
     "📊 Analytics",
+    "🗄️ Cache",
     "📚 Upload Materi",
     "🎓 Moodle Integration",
 ]
@@ -377,11 +383,20 @@ elif choice == "📊 Analytics":
     
     # Overview metrics
     st.subheader("📈 Overview")
-    m1, m2, m3, m4 = st.columns(4)
+    m1, m2, m3, m4, m5 = st.columns(5)
     m1.metric("Total Chats", stats["total_chats"])
     m2.metric("Total Users", stats["total_users"])
     m3.metric("Chats Today", stats["chats_today"])
     m4.metric("Avg Response Time", f"{stats['avg_response_time']:.2f}s")
+    m5.metric("Avg First Token", f"{stats.get('avg_time_to_first_token', 0):.2f}s")
+    st.caption(f"⚡ Response cache: {stats.get('cache_hits', 0)} hit ({stats.get('cache_hit_rate', 0):.0%} hit rate)")
+    writer_stats = analytics.get_writer_stats()
+    if writer_stats:
+        st.caption(
+            f"📝 Analytics writer: {writer_stats['written']} event ditulis, "
+            f"{writer_stats['queued']} antri, {writer_stats['dropped']} dibuang, "
+            f"{writer_stats['blocked']} kali antrian penuh"
+        )
     
     st.markdown("---")
     
@@ -441,6 +456,65 @@ elif choice == "📊 Analytics":
     else:
         st.info("Belum ada data analytics untuk ditampilkan")
     
+    # Latency percentiles (tail latency, not only averages)
+    st.markdown("---")
+    st.subheader("⏱️ Latency Percentiles (p50 / p95 / p99)")
+    
+    dimension_labels = {
+        "Semua": "all",
+        "Provider": "provider",
+        "Model": "model",
+        "Tipe Pertanyaan": "question_type",
+    }
+    metric_labels = {
+        "Response Time": "response_time",
+        "First Token": "time_to_first_token",
+        "Waktu per Tahap": "stage_time",
+    }
+    lc1, lc2, lc3 = st.columns(3)
+    dimension = dimension_labels[lc1.selectbox("Breakdown:", list(dimension_labels.keys()))]
+    metric = metric_labels[lc2.selectbox("Metrik:", list(metric_labels.keys()))]
+    if metric == "stage_time":
+        # Stage timings are only broken down by pipeline stage
+        dimension = "stage"
+    
+    latency = analytics.get_latency_percentiles(days=days, dimension=dimension, metric=metric)
+    labels = sorted({label for per_day in latency.values() for label in per_day})
+    
+    if labels:
+        selected_label = lc3.selectbox("Nilai:", labels) if dimension != "all" else "all"
+        
+        import pandas as pd
+        latency_dates = sorted(date for date, per_day in latency.items() if selected_label in per_day)
+        latency_df = pd.DataFrame(
+            {
+                "p50": [latency[d][selected_label]["p50"] for d in latency_dates],
+                "p95": [latency[d][selected_label]["p95"] for d in latency_dates],
+                "p99": [latency[d][selected_label]["p99"] for d in latency_dates],
+            },
+            index=latency_dates
+        )
+        st.line_chart(latency_df)
+        
+        # Whole-period percentiles per value of the selected breakdown (merged sketches)
+        period_summary = analytics.get_latency_summary(days=days, dimension=dimension, metric=metric)
+        # Stages such as classification take milliseconds (sketch floor: 1ms)
+        fmt = (lambda v: f"{v * 1000:.0f}ms") if metric == "stage_time" else (lambda v: f"{v:.2f}s")
+        latency_table = [
+            {
+                "Nilai": label,
+                "Chats": summary["count"],
+                "p50": fmt(summary["p50"]),
+                "p95": fmt(summary["p95"]),
+                "p99": fmt(summary["p99"]),
+                "Max": fmt(summary["max"]),
+            }
+            for label, summary in sorted(period_summary.items())
+        ]
+        st.dataframe(pd.DataFrame(latency_table), use_container_width=True, hide_index=True)
+    else:
+        st.info("Belum ada data latency untuk periode ini")
+    
     # Recent activity details
     st.markdown("---")
     st.subheader("🕒 Recent Activity (100 Chat Terakhir)")
@@ -454,6 +528,7 @@ elif choice == "📊 Analytics":
                 "Timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
                 "User": chat["user_id"][:30],
                 "Response Time": f"{chat['response_time']:.2f}s",
+                "First Token": f"{chat['time_to_first_token']:.2f}s" if chat.get("time_to_first_token") is not None else "-",
                 "Status": "✅ Success" if chat["success"] else "❌ Failed"
             })
         
@@ -509,6 +584,114 @@ elif choice == "📊 Analytics":
                 st.session_state.confirm_analytics_reset_time = datetime.now()
                 st.warning("⚠️ Klik sekali lagi dalam 10 detik untuk konfirmasi reset!")
 
+elif choice == "🗄️ Cache":
+    st.header("Cache Respons")
+    
+    # Persistent prompt cache (SQLite, shared across restarts)
+    st.subheader("💾 Prompt Cache (disk)")
+    try:
+        prompt_cache = get_prompt_cache()
+        cache_stats = prompt_cache.get_stats()
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Entries", f"{cache_stats['entries']} / {cache_stats['max_entries']}")
+        col2.metric("Ukuran", f"{cache_stats['size_bytes']/1024:.1f} KB")
+        col3.metric("Total Hits", cache_stats["total_hits"])
+        st.caption(f"Lokasi: `{cache_stats['db_path']}` | Aktif: {os.getenv('PROMPT_CACHE_ENABLED', 'true')}")
+        
+        entries = prompt_cache.list_entries(limit=50)
+        if entries:
+            import pandas as pd
+            df = pd.DataFrame([
+                {
+                    "Key": e["key"][:12],
+                    "Provider": e["provider"],
+                    "Model": e["model"],
+                    "Prompt": e["prompt_preview"],
+                    "Size (B)": e["size_bytes"],
+                    "Hits": e["hits"],
+                    "Dibuat": datetime.fromtimestamp(e["created_at"]).strftime("%Y-%m-%d %H:%M"),
+                    "Terakhir Dipakai": datetime.fromtimestamp(e["last_access"]).strftime("%Y-%m-%d %H:%M"),
+                }
+                for e in entries
+            ])
+            st.dataframe(df, use_container_width=True, hide_index=True)
+        else:
+            st.info("Prompt cache masih kosong")
+        
+        col1, col2, col3 = st.columns(3)
+        if col1.button("🧹 Hapus Entry Kadaluarsa", use_container_width=True):
+            removed = prompt_cache.purge_expired()
+            st.success(f"✅ {removed} entry kadaluarsa dihapus")
+            st.rerun()
+        purge_provider = col2.selectbox("Provider", ["Semua", "gemini", "openai"], label_visibility="collapsed")
+        if col3.button("🗑️ Purge Cache", type="primary", use_container_width=True):
+            removed = prompt_cache.purge(None if purge_provider == "Semua" else purge_provider)
+            st.success(f"✅ {removed} entry dihapus")
+            st.rerun()
+    except Exception as e:
+        st.error(f"❌ Error membaca prompt cache: {str(e)}")
+    
+    st.markdown("---")
+    
+    # In-memory semantic cache of this server process
+    st.subheader("⚡ Response Cache (memori)")
+    response_stats = get_response_cache().get_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Entries", response_stats["entries"])
+    col2.metric("Hits", response_stats["hits"])
+    col3.metric("Near-duplicate Hits", response_stats["near_hits"])
+    col4.metric("Hit Rate", f"{response_stats['hit_rate']*100:.1f}%")
+    if st.button("🗑️ Kosongkan Response Cache"):
+        get_response_cache().clear()
+        st.success("✅ Response cache dikosongkan")
+        st.rerun()
+    
+    st.markdown("---")
+    
+    # Provider-side caching of the static system prompt prefix
+    st.subheader("☁️ Context Cache (provider)")
+    context_cache = get_context_cache()
+    context_stats = context_cache.get_stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Prefix Statis", context_stats["prefixes"])
+    col2.metric("Handle Aktif", context_stats["handles"])
+    col3.metric("Token Prefix", sum(context_stats["prefix_tokens"]))
+    st.caption(f"Aktif: {os.getenv('CONTEXT_CACHE_ENABLED', 'true')} | TTL: {context_cache.ttl_seconds}s")
+    
+    if context_stats["usage"]:
+        import pandas as pd
+        st.dataframe(pd.DataFrame([
+            {
+                "Provider": provider,
+                "Request": totals["requests"],
+                "Prompt Tokens": totals["prompt_tokens"],
+                "Cached Tokens": totals["cached_tokens"],
+                "Cached (%)": f"{totals['cached_ratio']*100:.1f}%"
+            }
+            for provider, totals in context_stats["usage"].items()
+        ]), use_container_width=True, hide_index=True)
+    
+    handles = context_cache.list_handles()
+    if handles:
+        import pandas as pd
+        st.dataframe(pd.DataFrame([
+            {
+                "Provider": h["provider"],
+                "Model": h["model_name"],
+                "Handle": h["name"],
+                "Tokens": h["tokens"],
+                "Hits": h["hits"],
+                "Kadaluarsa": datetime.fromtimestamp(h["expires_at"]).strftime("%Y-%m-%d %H:%M"),
+                "Status": "expired" if h["expired"] else "aktif"
+            }
+            for h in handles
+        ]), use_container_width=True, hide_index=True)
+        if st.button("🗑️ Hapus Context Cache"):
+            removed = context_cache.purge()
+            st.success(f"✅ {removed} handle dihapus")
+            st.rerun()
+
 elif choice == "📚 Upload Materi":
     st.header("Upload Materi Pembelajaran")
     materials_dir = Path("data/materials")
@@ -520,6 +703,8 @@ elif choice == "📚 Upload Materi":
             st.write(p.name)
             if st.button(f"Hapus {p.name}", key=f"del_{p.name}"):
                 p.unlink()
+                get_material_reader().invalidate(p.name)
+                get_ingestor().start()
                 st.success(f"{p.name} dihapus")
                 st.rerun()
 
@@ -556,6 +741,10 @@ elif choice == "📚 Upload Materi":
             try:
                 with open(target_path, "wb") as f:
                     f.write(uploaded_material.getbuffer())
+                
+                # Only this document's extracted text is re-parsed (in the background)
+                get_material_reader().invalidate(uploaded_material.name)
+                get_ingestor().start()
 
                 st.success(f"✅ File **{uploaded_material.name}** berhasil diupload!")
                 st.info(f"📊 Ukuran file: {file_size/1024/1024:.2f} MB")
@@ -578,6 +767,48 @@ elif choice == "📚 Upload Materi":
             except Exception as e:
                 st.error(f"❌ Error menyimpan file: {str(e)}")
 
+    # Ingestion progress (extraction + index build run in the background)
+    st.markdown("---")
+    st.subheader("⚙️ Proses Materi")
+    ingestor = get_ingestor()
+    ingest_status = ingestor.get_status()
+    state_labels = {
+        "idle": "Belum dijalankan",
+        "extracting": "Mengekstrak teks PDF...",
+        "indexing": "Membangun index pencarian...",
+        "done": "Selesai",
+        "error": "Gagal",
+    }
+    st.write(f"Status: **{state_labels.get(ingest_status['state'], ingest_status['state'])}**")
+    if ingest_status.get("pages_total"):
+        st.progress(
+            min(ingest_status["pages_done"] / ingest_status["pages_total"], 1.0),
+            text=f"{ingest_status['pages_done']}/{ingest_status['pages_total']} halaman, "
+                 f"{ingest_status['files_done']}/{ingest_status['files_total']} file"
+        )
+    if ingest_status.get("finished_at") and ingest_status.get("started_at"):
+        st.caption(f"Durasi: {ingest_status['finished_at'] - ingest_status['started_at']:.1f}s")
+    for error in ingest_status.get("errors", []):
+        st.error(f"❌ {error}")
+    index_stats = get_material_reader().get_index().get_stats()
+    st.caption(
+        f"Index generasi {index_stats['generation']}: {index_stats['documents']} dokumen, "
+        f"{index_stats['chunks']} potongan, {index_stats['terms']} kata"
+    )
+    if ingest_status.get("changes"):
+        changes = ingest_status["changes"]
+        st.caption(
+            f"Perubahan terakhir: {len(changes['added'])} ditambah, "
+            f"{len(changes['updated'])} diperbarui, {len(changes['removed'])} dihapus"
+        )
+    
+    col1, col2 = st.columns(2)
+    if col1.button("🔄 Refresh Status", use_container_width=True):
+        st.rerun()
+    if col2.button("♻️ Proses Ulang Semua Materi", use_container_width=True, disabled=ingestor.is_running()):
+        ingestor.start(force=True)
+        st.rerun()
+    
     # Instructions
     with st.expander("ℹ️ Instruksi Upload Materi"):
         st.markdown("""
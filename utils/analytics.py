@@ -1,142 +1,625 @@
 """
 Analytics tracking for chatbot usage
 """
+import os
 import json
+import time
+import uuid
+import queue
+import atexit
+from collections import deque
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Any
 import threading
 
+from .latency_histogram import LatencyHistogram
+
+# Dimensions latency percentiles are broken down by ("all" = every chat)
+LATENCY_DIMENSIONS = ("all", "provider", "model", "question_type")
+
+
+class _Shutdown(threading.Event):
+    """Flush request that also stops the writer (queued by close() only)"""
+
+
+class AnalyticsWriter:
+    """
+    Background thread that batches analytics events off the request path
+    
+    Callers only pay for a put on a bounded queue. The writer groups events
+    and hands them to `write_fn` when `batch_size` events are waiting or
+    `flush_interval` seconds have passed, whichever comes first. When the
+    queue is full a caller waits at most `put_timeout` seconds (back-pressure)
+    before the event is dropped and counted.
+    """
+    
+    def __init__(
+        self,
+        write_fn,
+        max_queue: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        put_timeout: float = 0.01
+    ):
+        """
+        Initialize writer and start its thread
+        
+        Args:
+            write_fn: Callable receiving a list of events to persist
+            max_queue: Maximum events waiting to be written
+            batch_size: Flush as soon as this many events are waiting
+            flush_interval: Flush at least this often (seconds) while events are waiting
+            put_timeout: Longest a caller blocks on a full queue before dropping
+        """
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.flushes = 0
+        self.write_errors = 0
+        self.stats_lock = threading.Lock()
+        
+        self._closed = False
+        self.thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, event: Dict[str, Any]) -> bool:
+        """
+        Enqueue one event
+        
+        Args:
+            event: Event dict
+        
+        Returns:
+            True if queued, False if dropped (queue full or writer closed)
+        """
+        if self._closed:
+            with self.stats_lock:
+                self.dropped += 1
+            return False
+        
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self.stats_lock:
+                self.blocked += 1
+            try:
+                self.queue.put(event, timeout=self.put_timeout)
+            except queue.Full:
+                with self.stats_lock:
+                    self.dropped += 1
+                return False
+        
+        with self.stats_lock:
+            self.enqueued += 1
+        return True
+    
+    def _write(self, batch: List[Dict[str, Any]]):
+        """Persist a batch, counting failures instead of raising"""
+        if not batch:
+            return
+        try:
+            self.write_fn(batch)
+            with self.stats_lock:
+                self.written += len(batch)
+                self.flushes += 1
+        except Exception as e:
+            print(f"Error writing analytics batch: {e}")
+            with self.stats_lock:
+                self.write_errors += 1
+                self.dropped += len(batch)
+    
+    def _run(self):
+        """Writer loop: collect events until the batch is full or the interval expires"""
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            
+            if isinstance(item, threading.Event):
+                # Flush request (or shutdown): write everything collected so far
+                self._write(batch)
+                batch, deadline = [], None
+                item.set()
+                if isinstance(item, _Shutdown):
+                    return
+                continue
+            
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+            
+            if len(batch) >= self.batch_size or (deadline is not None and time.time() >= deadline):
+                self._write(batch)
+                batch, deadline = [], None
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Write all queued events now
+        
+        Args:
+            timeout: Seconds to wait for the writer
+        
+        Returns:
+            True if the flush completed in time
+        """
+        if not self.thread.is_alive():
+            return False
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+    
+    def close(self, timeout: float = 5.0):
+        """Flush remaining events and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        if self.thread.is_alive():
+            done = _Shutdown()
+            self.queue.put(done)
+            done.wait(timeout)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get writer counters
+        
+        Returns:
+            Dict with 'queued', 'enqueued', 'written', 'dropped', 'blocked',
+            'flushes', 'write_errors'
+        """
+        with self.stats_lock:
+            return {
+                "queued": self.queue.qsize(),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "blocked": self.blocked,
+                "flushes": self.flushes,
+                "write_errors": self.write_errors
+            }
+
 
 class Analytics:
-    """Track and analyze chatbot usage metrics"""
+    """
+    Track and analyze chatbot usage metrics
     
-    def __init__(self, log_dir: str = "logs"):
+    Every interaction is appended as one JSON line to an event log
+    (`analytics_events.jsonl`); nothing is ever rewritten, so logging is O(1)
+    and several Streamlit processes can log to the same file. Totals, unique
+    users (sets) and per-day rollups are kept in memory and brought up to date
+    by reading only the bytes appended since the last read. A periodic
+    snapshot of the aggregates avoids replaying the whole log on startup.
+    By default events are written in batches by an AnalyticsWriter thread,
+    so the chat request only pays for an enqueue.
+    """
+    
+    # Aggregates are snapshotted after this many newly applied events
+    SNAPSHOT_EVERY = 500
+    
+    def __init__(self, log_dir: str = "logs", background: bool = True, **writer_options):
+        """
+        Initialize analytics
+        
+        Args:
+            log_dir: Directory holding the event log and snapshot
+            background: Write events from a background thread (AnalyticsWriter)
+                instead of on the caller's thread
+            **writer_options: Passed to AnalyticsWriter (max_queue, batch_size, ...)
+        """
         self.log_dir = Path(log_dir)
         self.log_dir.mkdir(exist_ok=True)
-        self.analytics_file = self.log_dir / "analytics.json"
+        self.events_file = self.log_dir / "analytics_events.jsonl"
+        self.snapshot_file = self.log_dir / "analytics_snapshot.json"
+        self.legacy_file = self.log_dir / "analytics.json"
         self.lock = threading.Lock()
-        self._ensure_analytics_file()
+        
+        self._ensure_events_file()
+        self._reset_state()
+        self._load_snapshot()
+        self._refresh()
+        
+        self.writer = AnalyticsWriter(self._append, **writer_options) if background else None
     
-    def _ensure_analytics_file(self):
-        """Ensure analytics file exists with default structure"""
-        if not self.analytics_file.exists():
-            default_data = {
-                "total_chats": 0,
-                "total_users": 0,
-                "chats_history": [],
-                "response_times": [],
-                "daily_stats": {},
-                "start_time": datetime.now().isoformat()
+    def _ensure_events_file(self):
+        """Create the event log, importing the legacy analytics.json if present"""
+        if self.events_file.exists():
+            return
+        
+        events = [self._start_event()]
+        if self.legacy_file.exists():
+            try:
+                with open(self.legacy_file, 'r') as f:
+                    legacy = json.load(f)
+                events[0]["ts"] = legacy.get("start_time", events[0]["ts"])
+                events.append({"type": "import", "ts": datetime.now().isoformat(), "data": legacy})
+            except Exception as e:
+                print(f"Error importing legacy analytics: {e}")
+        
+        # O_EXCL: if another process created the log meanwhile, keep theirs
+        try:
+            fd = os.open(self.events_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return
+        try:
+            os.write(fd, "".join(json.dumps(e) + "\n" for e in events).encode("utf-8"))
+        finally:
+            os.close(fd)
+        if self.legacy_file.exists():
+            self.legacy_file.rename(self.legacy_file.with_suffix(".json.migrated"))
+    
+    @staticmethod
+    def _start_event() -> Dict[str, Any]:
+        """First line of a fresh event log"""
+        return {"type": "start", "ts": datetime.now().isoformat(), "log_id": uuid.uuid4().hex}
+    
+    def _reset_state(self):
+        """Empty in-memory aggregates"""
+        self.log_id = None
+        self.offset = 0
+        self.start_time = datetime.now().isoformat()
+        self.total_chats = 0
+        self.users_seen = set()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.chats_history = deque(maxlen=1000)
+        self.response_times = deque(maxlen=100)
+        self.daily_stats: Dict[str, Dict[str, Any]] = {}
+        # date -> "metric|dimension|value" -> histogram (fixed memory per key)
+        self.latency_sketches: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._events_since_snapshot = 0
+    
+    def _get_day(self, date: str) -> Dict[str, Any]:
+        """Per-day rollup, created on first use"""
+        if date not in self.daily_stats:
+            self.daily_stats[date] = {
+                "chats": 0,
+                "users": set(),
+                "total_response_time": 0.0,
+                "ttft_count": 0,
+                "total_ttft": 0.0,
+                "cache_hits": 0,
+                "cache_misses": 0
+            }
+        return self.daily_stats[date]
+    
+    def _record_latency(self, date: str, event: Dict[str, Any]):
+        """Record a chat's latencies into the per-day, per-dimension sketches"""
+        sketches = self.latency_sketches.setdefault(date, {})
+        for metric in ("response_time", "time_to_first_token"):
+            value = event.get(metric)
+            if value is None:
+                continue
+            for dimension in LATENCY_DIMENSIONS:
+                label = "all" if dimension == "all" else event.get(dimension)
+                if not label:
+                    continue
+                key = f"{metric}|{dimension}|{label}"
+                if key not in sketches:
+                    sketches[key] = LatencyHistogram()
+                sketches[key].record(value)
+        
+        # Per-stage timings of the request pipeline
+        for stage, value in (event.get("stages") or {}).items():
+            key = f"stage_time|stage|{stage}"
+            if key not in sketches:
+                sketches[key] = LatencyHistogram()
+            sketches[key].record(value)
+    
+    def _apply(self, event: Dict[str, Any]):
+        """Fold one event into the aggregates (lock held)"""
+        kind = event.get("type")
+        
+        if kind == "start":
+            self.log_id = event.get("log_id")
+            self.start_time = event.get("ts", self.start_time)
+        
+        elif kind == "chat":
+            daily = self._get_day(event["ts"][:10])
+            self.total_chats += 1
+            self.users_seen.add(event["user_id"])
+            self.chats_history.append({
+                "timestamp": event["ts"],
+                "user_id": event["user_id"],
+                "response_time": event["response_time"],
+                "time_to_first_token": event.get("time_to_first_token"),
+                "success": event.get("success", True)
+            })
+            self.response_times.append(event["response_time"])
+            daily["chats"] += 1
+            daily["users"].add(event["user_id"])
+            daily["total_response_time"] += event["response_time"]
+            if event.get("time_to_first_token") is not None:
+                daily["ttft_count"] += 1
+                daily["total_ttft"] += event["time_to_first_token"]
+            self._record_latency(event["ts"][:10], event)
+        
+        elif kind == "cache":
+            daily = self._get_day(event["ts"][:10])
+            counter = "cache_hits" if event.get("hit") else "cache_misses"
+            setattr(self, counter, getattr(self, counter) + 1)
+            daily[counter] += 1
+        
+        elif kind == "import":
+            self._apply_legacy(event.get("data", {}))
+    
+    def _apply_legacy(self, data: Dict[str, Any]):
+        """Fold the contents of an old analytics.json into the aggregates"""
+        self.total_chats += data.get("total_chats", 0)
+        self.users_seen.update(data.get("users_seen", []))
+        self.cache_hits += data.get("cache_hits", 0)
+        self.cache_misses += data.get("cache_misses", 0)
+        self.chats_history.extend(data.get("chats_history", []))
+        self.response_times.extend(data.get("response_times", []))
+        
+        for date, legacy_day in data.get("daily_stats", {}).items():
+            daily = self._get_day(date)
+            daily["chats"] += legacy_day.get("chats", 0)
+            daily["users"].update(legacy_day.get("users", []))
+            daily["total_response_time"] += legacy_day.get("total_response_time", 0)
+            daily["ttft_count"] += legacy_day.get("ttft_count", 0)
+            daily["total_ttft"] += legacy_day.get("total_ttft", 0)
+            daily["cache_hits"] += legacy_day.get("cache_hits", 0)
+            daily["cache_misses"] += legacy_day.get("cache_misses", 0)
+    
+    def _read_log_id(self) -> Optional[str]:
+        """log_id from the first line of the event log on disk"""
+        try:
+            with open(self.events_file, 'rb') as f:
+                return json.loads(f.readline()).get("log_id")
+        except Exception:
+            return None
+    
+    def _refresh(self):
+        """Apply events appended since the last read (by any process)"""
+        with self.lock:
+            try:
+                size = self.events_file.stat().st_size
+            except FileNotFoundError:
+                self._ensure_events_file()
+                size = self.events_file.stat().st_size
+            
+            # Log was reset (replaced) by someone else: rebuild from scratch
+            if size < self.offset or (self.offset and self._read_log_id() != self.log_id):
+                self._reset_state()
+            
+            if size == self.offset:
+                return
+            
+            with open(self.events_file, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+            
+            # Only consume complete lines; a concurrent append may be in flight
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    self._apply(json.loads(line))
+                    self._events_since_snapshot += 1
+                except Exception as e:
+                    print(f"Skipping malformed analytics event: {e}")
+            self.offset += end
+            
+            if self._events_since_snapshot >= self.SNAPSHOT_EVERY:
+                self._save_snapshot()
+    
+    def _save_snapshot(self):
+        """Persist aggregates and the log offset they cover (lock held)"""
+        snapshot = {
+            "log_id": self.log_id,
+            "offset": self.offset,
+            "start_time": self.start_time,
+            "total_chats": self.total_chats,
+            "users_seen": sorted(self.users_seen),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "chats_history": list(self.chats_history),
+            "response_times": list(self.response_times),
+            "daily_stats": {
+                date: dict(day, users=sorted(day["users"]))
+                for date, day in self.daily_stats.items()
+            },
+            "latency_sketches": {
+                date: {key: histogram.to_dict() for key, histogram in sketches.items()}
+                for date, sketches in self.latency_sketches.items()
+            }
+        }
+        try:
+            tmp_path = self.snapshot_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.snapshot_file)
+            self._events_since_snapshot = 0
+        except Exception as e:
+            print(f"Error saving analytics snapshot: {e}")
+    
+    def _load_snapshot(self):
+        """Start from the last snapshot if it belongs to the current event log"""
+        if not self.snapshot_file.exists():
+            return
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+            if snapshot.get("log_id") != self._read_log_id():
+                return
+            if snapshot.get("offset", 0) > self.events_file.stat().st_size:
+                return
+            
+            self.log_id = snapshot["log_id"]
+            self.offset = snapshot["offset"]
+            self.start_time = snapshot["start_time"]
+            self.total_chats = snapshot["total_chats"]
+            self.users_seen = set(snapshot["users_seen"])
+            self.cache_hits = snapshot["cache_hits"]
+            self.cache_misses = snapshot["cache_misses"]
+            self.chats_history.extend(snapshot["chats_history"])
+            self.response_times.extend(snapshot["response_times"])
+            self.daily_stats = {
+                date: dict(day, users=set(day["users"]))
+                for date, day in snapshot["daily_stats"].items()
+            }
+            self.latency_sketches = {
+                date: {key: LatencyHistogram.from_dict(data) for key, data in sketches.items()}
+                for date, sketches in snapshot.get("latency_sketches", {}).items()
             }
-            with open(self.analytics_file, 'w') as f:
-                json.dump(default_data, f, indent=2)
+        except Exception as e:
+            print(f"Error loading analytics snapshot: {e}")
+            self._reset_state()
+    
+    def _append(self, events: List[Dict[str, Any]]):
+        """
+        Append events to the log with a single O_APPEND write
+        
+        Args:
+            events: Events to append (each becomes one line)
+        """
+        payload = "".join(json.dumps(e) + "\n" for e in events).encode("utf-8")
+        fd = os.open(self.events_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+    
+    def _log(self, event: Dict[str, Any]):
+        """Hand an event to the background writer, or append it directly"""
+        if self.writer:
+            self.writer.submit(event)
+            return
+        try:
+            self._append([event])
+        except Exception as e:
+            print(f"Error logging analytics: {e}")
     
-    def log_chat(self, user_id: str, response_time: float, success: bool = True):
+    def flush(self):
+        """Write queued events to the log (no-op without a background writer)"""
+        if self.writer:
+            self.writer.flush()
+    
+    def get_writer_stats(self) -> Dict[str, Any]:
+        """Background writer counters (empty dict without a background writer)"""
+        return self.writer.get_stats() if self.writer else {}
+    
+    def log_chat(
+        self,
+        user_id: str,
+        response_time: float,
+        success: bool = True,
+        time_to_first_token: Optional[float] = None,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        question_type: Optional[str] = None,
+        question: Optional[str] = None,
+        stages: Optional[Dict[str, float]] = None
+    ):
         """
         Log a chat interaction
         
         Args:
             user_id: Identifier for the user (can be session_id or username)
-            response_time: Response time in seconds
+            response_time: Response time in seconds (until the full reply is received)
             success: Whether the response was successful
+            time_to_first_token: Seconds until the first streamed chunk arrived, if streamed
+            provider: Provider that answered ('gemini', 'openai', 'cache', ...)
+            model: Model that answered
+            question_type: Detected QuestionType value
+            question: Question text, kept so questions can be re-classified offline
+            stages: Seconds spent per request stage (precheck, classify, retrieval, ...)
         """
-        with self.lock:
-            try:
-                # Read current data
-                with open(self.analytics_file, 'r') as f:
-                    data = json.load(f)
-                
-                # Get today's date
+        self._log({
+            "type": "chat",
+            "ts": datetime.now().isoformat(),
+            "user_id": user_id,
+            "response_time": response_time,
+            "time_to_first_token": time_to_first_token,
+            "success": success,
+            "provider": provider,
+            "model": model,
+            "question_type": question_type,
+            "question": question,
+            "stages": stages
+        })
+    
+    def log_cache_event(self, hit: bool):
+        """
+        Log a response cache lookup
+        
+        Args:
+            hit: Whether the answer was served from the cache
+        """
+        self._log({"type": "cache", "ts": datetime.now().isoformat(), "hit": hit})
+    
+    def _day_summary(self, day: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """JSON-friendly view of a per-day rollup (users as list, averages filled in)"""
+        if not day:
+            return {"chats": 0, "users": [], "avg_response_time": 0}
+        return {
+            "chats": day["chats"],
+            "users": sorted(day["users"]),
+            "avg_response_time": day["total_response_time"] / day["chats"] if day["chats"] else 0,
+            "total_response_time": day["total_response_time"],
+            "avg_time_to_first_token": day["total_ttft"] / day["ttft_count"] if day["ttft_count"] else 0,
+            "ttft_count": day["ttft_count"],
+            "cache_hits": day["cache_hits"],
+            "cache_misses": day["cache_misses"]
+        }
+    
+    def get_stats(self) -> Dict:
+        """Get current analytics stats"""
+        try:
+            self.flush()
+            self._refresh()
+            
+            with self.lock:
                 today = datetime.now().strftime("%Y-%m-%d")
+                today_stats = self.daily_stats.get(today)
                 
-                # Update total chats
-                data["total_chats"] += 1
+                # Calculate average response time
+                response_times = list(self.response_times)
+                avg_response_time = sum(response_times) / len(response_times) if response_times else 0
                 
-                # Track unique users
-                if user_id not in data.get("users_seen", []):
-                    if "users_seen" not in data:
-                        data["users_seen"] = []
-                    data["users_seen"].append(user_id)
-                    data["total_users"] = len(data["users_seen"])
+                # Average time to first token over recent streamed chats
+                ttfts = [
+                    chat["time_to_first_token"]
+                    for chat in list(self.chats_history)[-100:]
+                    if chat.get("time_to_first_token") is not None
+                ]
+                avg_ttft = sum(ttfts) / len(ttfts) if ttfts else 0
                 
-                # Log chat history
-                data["chats_history"].append({
-                    "timestamp": datetime.now().isoformat(),
-                    "user_id": user_id,
-                    "response_time": response_time,
-                    "success": success
-                })
-                
-                # Keep only last 1000 chats in history
-                if len(data["chats_history"]) > 1000:
-                    data["chats_history"] = data["chats_history"][-1000:]
-                
-                # Track response times (keep last 100)
-                data["response_times"].append(response_time)
-                if len(data["response_times"]) > 100:
-                    data["response_times"] = data["response_times"][-100:]
-                
-                # Update daily stats
-                if "daily_stats" not in data:
-                    data["daily_stats"] = {}
-                
-                if today not in data["daily_stats"]:
-                    data["daily_stats"][today] = {
-                        "chats": 0,
-                        "users": [],
-                        "avg_response_time": 0,
-                        "total_response_time": 0
-                    }
+                # Response cache hit rate
+                cache_lookups = self.cache_hits + self.cache_misses
+                cache_hit_rate = self.cache_hits / cache_lookups if cache_lookups else 0
                 
-                daily = data["daily_stats"][today]
-                daily["chats"] += 1
-                daily["total_response_time"] += response_time
-                daily["avg_response_time"] = daily["total_response_time"] / daily["chats"]
+                # Calculate uptime
+                start_time = datetime.fromisoformat(self.start_time)
+                uptime_hours = (datetime.now() - start_time).total_seconds() / 3600
                 
-                if user_id not in daily["users"]:
-                    daily["users"].append(user_id)
-                
-                # Save updated data
-                with open(self.analytics_file, 'w') as f:
-                    json.dump(data, f, indent=2)
-                
-            except Exception as e:
-                print(f"Error logging analytics: {e}")
-    
-    def get_stats(self) -> Dict:
-        """Get current analytics stats"""
-        try:
-            with open(self.analytics_file, 'r') as f:
-                data = json.load(f)
-            
-            today = datetime.now().strftime("%Y-%m-%d")
-            
-            # Get today's stats
-            today_stats = data.get("daily_stats", {}).get(today, {
-                "chats": 0,
-                "users": [],
-                "avg_response_time": 0
-            })
-            
-            # Calculate average response time
-            response_times = data.get("response_times", [])
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-            
-            # Calculate uptime
-            start_time = datetime.fromisoformat(data.get("start_time", datetime.now().isoformat()))
-            uptime_hours = (datetime.now() - start_time).total_seconds() / 3600
-            
-            return {
-                "total_chats": data.get("total_chats", 0),
-                "total_users": data.get("total_users", 0),
-                "chats_today": today_stats.get("chats", 0),
-                "active_users_today": len(today_stats.get("users", [])),
-                "avg_response_time": avg_response_time,
-                "uptime_hours": uptime_hours,
-                "recent_chats": data.get("chats_history", [])[-10:],
-                "daily_stats": data.get("daily_stats", {})
-            }
+                return {
+                    "total_chats": self.total_chats,
+                    "total_users": len(self.users_seen),
+                    "chats_today": today_stats["chats"] if today_stats else 0,
+                    "active_users_today": len(today_stats["users"]) if today_stats else 0,
+                    "avg_response_time": avg_response_time,
+                    "avg_time_to_first_token": avg_ttft,
+                    "cache_hits": self.cache_hits,
+                    "cache_hit_rate": cache_hit_rate,
+                    "uptime_hours": uptime_hours,
+                    "recent_chats": list(self.chats_history)[-10:],
+                    "daily_stats": {date: self._day_summary(day) for date, day in self.daily_stats.items()}
+                }
         except Exception as e:
             print(f"Error getting stats: {e}")
             return {
@@ -145,6 +628,9 @@ class Analytics:
                 "chats_today": 0,
                 "active_users_today": 0,
                 "avg_response_time": 0,
+                "avg_time_to_first_token": 0,
+                "cache_hits": 0,
+                "cache_hit_rate": 0,
                 "uptime_hours": 0,
                 "recent_chats": [],
                 "daily_stats": {}
@@ -153,43 +639,103 @@ class Analytics:
     def get_daily_stats(self, days: int = 7) -> Dict[str, Dict]:
         """Get daily stats for the last N days"""
         try:
-            with open(self.analytics_file, 'r') as f:
-                data = json.load(f)
-            
-            daily_stats = data.get("daily_stats", {})
+            self.flush()
+            self._refresh()
             
             # Get last N days
-            result = {}
-            for i in range(days):
-                date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-                if date in daily_stats:
-                    result[date] = daily_stats[date]
-                else:
+            with self.lock:
+                result = {}
+                for i in range(days):
+                    date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
+                    result[date] = self._day_summary(self.daily_stats.get(date))
+                return result
+        except Exception as e:
+            print(f"Error getting daily stats: {e}")
+            return {}
+    
+    def get_latency_percentiles(
+        self,
+        days: int = 7,
+        dimension: str = "all",
+        metric: str = "response_time"
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Get latency percentiles per day
+        
+        Args:
+            days: Number of days back from today
+            dimension: 'all', 'provider', 'model' or 'question_type' ('stage' for stage_time)
+            metric: 'response_time', 'time_to_first_token' or 'stage_time'
+        
+        Returns:
+            Dict of date -> dimension value -> summary ('count', 'mean', 'p50',
+            'p95', 'p99', 'max'); days without data map to an empty dict
+        """
+        try:
+            self.flush()
+            self._refresh()
+            
+            prefix = f"{metric}|{dimension}|"
+            with self.lock:
+                result = {}
+                for i in range(days):
+                    date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
                     result[date] = {
-                        "chats": 0,
-                        "users": [],
-                        "avg_response_time": 0
+                        key[len(prefix):]: histogram.summary()
+                        for key, histogram in self.latency_sketches.get(date, {}).items()
+                        if key.startswith(prefix)
                     }
+                return result
+        except Exception as e:
+            print(f"Error getting latency percentiles: {e}")
+            return {}
+    
+    def get_latency_summary(
+        self,
+        days: int = 7,
+        dimension: str = "all",
+        metric: str = "response_time"
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get latency percentiles over a whole period (daily sketches merged)
+        
+        Args:
+            days: Number of days back from today
+            dimension: 'all', 'provider', 'model' or 'question_type' ('stage' for stage_time)
+            metric: 'response_time', 'time_to_first_token' or 'stage_time'
+        
+        Returns:
+            Dict of dimension value -> summary ('count', 'mean', 'p50', 'p95', 'p99', 'max')
+        """
+        try:
+            self.flush()
+            self._refresh()
             
-            return result
+            prefix = f"{metric}|{dimension}|"
+            merged: Dict[str, LatencyHistogram] = {}
+            with self.lock:
+                for i in range(days):
+                    date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
+                    for key, histogram in self.latency_sketches.get(date, {}).items():
+                        if key.startswith(prefix):
+                            merged.setdefault(key[len(prefix):], LatencyHistogram()).merge(histogram)
+            return {label: histogram.summary() for label, histogram in merged.items()}
         except Exception as e:
-            print(f"Error getting daily stats: {e}")
+            print(f"Error getting latency summary: {e}")
             return {}
     
     def reset_stats(self):
-        """Reset all analytics data"""
+        """Reset all analytics data (starts a new, empty event log)"""
+        self.flush()
         with self.lock:
-            default_data = {
-                "total_chats": 0,
-                "total_users": 0,
-                "users_seen": [],
-                "chats_history": [],
-                "response_times": [],
-                "daily_stats": {},
-                "start_time": datetime.now().isoformat()
-            }
-            with open(self.analytics_file, 'w') as f:
-                json.dump(default_data, f, indent=2)
+            tmp_path = self.events_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps(self._start_event()) + "\n")
+            os.replace(tmp_path, self.events_file)
+            if self.snapshot_file.exists():
+                self.snapshot_file.unlink()
+            self._reset_state()
+        self._refresh()
 
 
 # Global analytics instance
@@ -8,9 +8,170 @@ from typing import Dict, Any, List, Optional
 from pathlib import Path
 
 
+class _CodeVisitor(ast.NodeVisitor):
+    """
+    Collect everything CodeAnalyzer needs in one traversal
+    
+    Structure (imports, functions, classes, assignments), loop and
+    conditional counts, loop nesting depth and recursion are gathered
+    together, so analysis is linear in the size of the syntax tree.
+    """
+    
+    def __init__(self):
+        """Initialize visitor"""
+        self.structure = {
+            "imports": [],
+            "functions": [],
+            "classes": [],
+            "global_variables": [],
+            "has_main": False,
+            "docstrings": []
+        }
+        self.total_loops = 0
+        self.total_conditionals = 0
+        self.max_loop_depth = 0
+        self._loop_depth = 0
+        # Enclosing function definitions, innermost last: (name, func_info)
+        self._functions: List[tuple] = []
+    
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.structure["imports"].append(alias.name)
+    
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = node.module or ""
+        for alias in node.names:
+            self.structure["imports"].append(f"{module}.{alias.name}")
+    
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        func_info = {
+            "name": node.name,
+            "args": [arg.arg for arg in node.args.args],
+            "is_recursive": False,
+            "has_docstring": ast.get_docstring(node) is not None,
+            "line": node.lineno
+        }
+        self.structure["functions"].append(func_info)
+        if node.name == "main":
+            self.structure["has_main"] = True
+        
+        self._functions.append((node.name, func_info))
+        self.generic_visit(node)
+        self._functions.pop()
+    
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.structure["classes"].append({
+            "name": node.name,
+            "methods": [m.name for m in node.body if isinstance(m, ast.FunctionDef)],
+            "has_docstring": ast.get_docstring(node) is not None,
+            "line": node.lineno
+        })
+        self.generic_visit(node)
+    
+    def visit_Assign(self, node: ast.Assign):
+        if isinstance(node.targets[0], ast.Name):
+            var_name = node.targets[0].id
+            if not var_name.startswith('_'):  # Skip private vars
+                self.structure["global_variables"].append(var_name)
+        self.generic_visit(node)
+    
+    def visit_Call(self, node: ast.Call):
+        # A call to the name of an enclosing function makes that function recursive
+        if isinstance(node.func, ast.Name):
+            for name, func_info in self._functions:
+                if name == node.func.id:
+                    func_info["is_recursive"] = True
+        self.generic_visit(node)
+    
+    def visit_If(self, node: ast.If):
+        self.total_conditionals += 1
+        self.generic_visit(node)
+    
+    def _visit_loop(self, node: ast.AST):
+        self.total_loops += 1
+        self._loop_depth += 1
+        self.max_loop_depth = max(self.max_loop_depth, self._loop_depth)
+        self.generic_visit(node)
+        self._loop_depth -= 1
+    
+    visit_For = _visit_loop
+    visit_While = _visit_loop
+    
+    def _skip(self, node: ast.AST):
+        """Leaf nodes: nothing to collect (and NodeVisitor's Constant shim is slow)"""
+    
+    visit_Constant = _skip
+    visit_Name = _skip
+    
+    @property
+    def has_recursion(self) -> bool:
+        """Whether any function calls itself"""
+        return any(f["is_recursive"] for f in self.structure["functions"])
+
+
 class CodeAnalyzer:
     """Analyze Python code for learning purposes"""
     
+    # Algorithm patterns (matched against the lowercased code)
+    ALGORITHM_PATTERNS = {
+        "Binary Search": [
+            r'\bmid\s*=.*\(.*low.*\+.*high.*\)',
+            r'\bmiddle\s*=',
+            r'binary.*search',
+            r'while.*low.*<=.*high'
+        ],
+        "Linear Search": [
+            r'for.*in.*range.*len\(',
+            r'if.*==.*return',
+            r'linear.*search'
+        ],
+        "Bubble Sort": [
+            r'bubble.*sort',
+            r'for.*range.*len.*for.*range.*len',
+            r'if.*>.*swap'
+        ],
+        "Selection Sort": [
+            r'selection.*sort',
+            r'min.*index',
+            r'for.*range.*for.*range'
+        ],
+        "Insertion Sort": [
+            r'insertion.*sort',
+            r'while.*>.*0.*and',
+            r'key\s*='
+        ],
+        "Quick Sort": [
+            r'quick.*sort',
+            r'pivot',
+            r'partition'
+        ],
+        "Merge Sort": [
+            r'merge.*sort',
+            r'def.*merge\(',
+            r'mid.*=.*len.*//.*2'
+        ],
+        "Recursion": [],  # Handled separately (AST)
+        "Dynamic Programming": [
+            r'dp\s*=.*\[',
+            r'memo',
+            r'cache'
+        ],
+        "Stack": [
+            r'\.append\(',
+            r'\.pop\(\)',
+            r'stack\s*='
+        ],
+        "Queue": [
+            r'queue',
+            r'deque',
+            r'enqueue|dequeue'
+        ]
+    }
+    _COMPILED_PATTERNS = {
+        name: [re.compile(pattern) for pattern in patterns]
+        for name, patterns in ALGORITHM_PATTERNS.items()
+    }
+    
     def __init__(self):
         """Initialize analyzer"""
         pass
@@ -71,14 +232,18 @@ class CodeAnalyzer:
             tree = ast.parse(code)
             result["is_valid"] = True
             
+            # Structure, loops, conditionals and recursion in one traversal
+            visitor = _CodeVisitor()
+            visitor.visit(tree)
+            
             # Analyze structure
-            result["structure"] = self._analyze_structure(tree, code)
+            result["structure"] = visitor.structure
             
             # Detect algorithms
-            result["algorithms"] = self._detect_algorithms(code, tree)
+            result["algorithms"] = self._detect_algorithms(code, visitor)
             
             # Analyze complexity
-            result["complexity_indicators"] = self._analyze_complexity(tree, code)
+            result["complexity_indicators"] = self._analyze_complexity(visitor)
             
             # Generate learning points
             result["learning_points"] = self._generate_learning_points(result)
@@ -103,189 +268,41 @@ class CodeAnalyzer:
         
         return result
     
-    def _analyze_structure(self, tree: ast.AST, code: str) -> Dict[str, Any]:
-        """Analyze code structure"""
-        structure = {
-            "imports": [],
-            "functions": [],
-            "classes": [],
-            "global_variables": [],
-            "has_main": False,
-            "docstrings": []
-        }
-        
-        for node in ast.walk(tree):
-            # Imports
-            if isinstance(node, ast.Import):
-                for alias in node.names:
-                    structure["imports"].append(alias.name)
-            elif isinstance(node, ast.ImportFrom):
-                module = node.module or ""
-                for alias in node.names:
-                    structure["imports"].append(f"{module}.{alias.name}")
-            
-            # Functions
-            elif isinstance(node, ast.FunctionDef):
-                func_info = {
-                    "name": node.name,
-                    "args": [arg.arg for arg in node.args.args],
-                    "is_recursive": self._is_recursive(node),
-                    "has_docstring": ast.get_docstring(node) is not None,
-                    "line": node.lineno
-                }
-                structure["functions"].append(func_info)
-                
-                if node.name == "main":
-                    structure["has_main"] = True
-            
-            # Classes
-            elif isinstance(node, ast.ClassDef):
-                class_info = {
-                    "name": node.name,
-                    "methods": [m.name for m in node.body if isinstance(m, ast.FunctionDef)],
-                    "has_docstring": ast.get_docstring(node) is not None,
-                    "line": node.lineno
-                }
-                structure["classes"].append(class_info)
-            
-            # Global variables (assignments at module level)
-            elif isinstance(node, ast.Assign):
-                if isinstance(node.targets[0], ast.Name):
-                    var_name = node.targets[0].id
-                    if not var_name.startswith('_'):  # Skip private vars
-                        structure["global_variables"].append(var_name)
-        
-        return structure
-    
-    def _is_recursive(self, func_node: ast.FunctionDef) -> bool:
-        """Check if function is recursive"""
-        func_name = func_node.name
-        
-        for node in ast.walk(func_node):
-            if isinstance(node, ast.Call):
-                if isinstance(node.func, ast.Name) and node.func.id == func_name:
-                    return True
-        
-        return False
-    
-    def _detect_algorithms(self, code: str, tree: ast.AST) -> List[str]:
+    def _detect_algorithms(self, code: str, visitor: _CodeVisitor) -> List[str]:
         """Detect common algorithms in code"""
         algorithms = []
         code_lower = code.lower()
         
-        # Algorithm patterns
-        patterns = {
-            "Binary Search": [
-                r'\bmid\s*=.*\(.*low.*\+.*high.*\)',
-                r'\bmiddle\s*=',
-                r'binary.*search',
-                r'while.*low.*<=.*high'
-            ],
-            "Linear Search": [
-                r'for.*in.*range.*len\(',
-                r'if.*==.*return',
-                r'linear.*search'
-            ],
-            "Bubble Sort": [
-                r'bubble.*sort',
-                r'for.*range.*len.*for.*range.*len',
-                r'if.*>.*swap'
-            ],
-            "Selection Sort": [
-                r'selection.*sort',
-                r'min.*index',
-                r'for.*range.*for.*range'
-            ],
-            "Insertion Sort": [
-                r'insertion.*sort',
-                r'while.*>.*0.*and',
-                r'key\s*='
-            ],
-            "Quick Sort": [
-                r'quick.*sort',
-                r'pivot',
-                r'partition'
-            ],
-            "Merge Sort": [
-                r'merge.*sort',
-                r'def.*merge\(',
-                r'mid.*=.*len.*//.*2'
-            ],
-            "Recursion": [],  # Handled separately
-            "Dynamic Programming": [
-                r'dp\s*=.*\[',
-                r'memo',
-                r'cache'
-            ],
-            "Stack": [
-                r'\.append\(',
-                r'\.pop\(\)',
-                r'stack\s*='
-            ],
-            "Queue": [
-                r'queue',
-                r'deque',
-                r'enqueue|dequeue'
-            ]
-        }
-        
         # Check patterns
-        for algo_name, algo_patterns in patterns.items():
+        for algo_name, algo_patterns in self._COMPILED_PATTERNS.items():
             for pattern in algo_patterns:
-                if re.search(pattern, code_lower):
+                if pattern.search(code_lower):
                     if algo_name not in algorithms:
                         algorithms.append(algo_name)
                     break
         
         # Check for recursion via AST
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                if self._is_recursive(node):
-                    if "Recursion" not in algorithms:
-                        algorithms.append("Recursion")
+        if visitor.has_recursion:
+            algorithms.append("Recursion")
         
         # Check for loops
-        has_loop = any(isinstance(node, (ast.For, ast.While)) for node in ast.walk(tree))
+        has_loop = visitor.total_loops > 0
         if has_loop and not any(algo in algorithms for algo in ["Binary Search", "Linear Search", "Bubble Sort", "Selection Sort", "Insertion Sort"]):
             algorithms.append("Iterasi/Loop")
         
         return algorithms
     
-    def _analyze_complexity(self, tree: ast.AST, code: str) -> Dict[str, Any]:
+    def _analyze_complexity(self, visitor: _CodeVisitor) -> Dict[str, Any]:
         """Analyze code complexity indicators"""
         complexity = {
-            "nested_loops": 0,
+            "nested_loops": visitor.max_loop_depth,
             "recursion_depth": 0,
-            "cyclomatic_complexity": 1,  # Start with 1
-            "total_loops": 0,
-            "total_conditionals": 0,
-            "max_nesting_level": 0
+            "cyclomatic_complexity": 1 + visitor.total_conditionals + visitor.total_loops,
+            "total_loops": visitor.total_loops,
+            "total_conditionals": visitor.total_conditionals,
+            "max_nesting_level": visitor.max_loop_depth
         }
         
-        # Count nested loops
-        def count_nested_loops(node, depth=0):
-            max_depth = depth
-            for child in ast.iter_child_nodes(node):
-                if isinstance(child, (ast.For, ast.While)):
-                    complexity["total_loops"] += 1
-                    child_depth = count_nested_loops(child, depth + 1)
-                    max_depth = max(max_depth, child_depth)
-                else:
-                    child_depth = count_nested_loops(child, depth)
-                    max_depth = max(max_depth, child_depth)
-            return max_depth
-        
-        complexity["nested_loops"] = count_nested_loops(tree)
-        complexity["max_nesting_level"] = complexity["nested_loops"]
-        
-        # Count conditionals
-        for node in ast.walk(tree):
-            if isinstance(node, ast.If):
-                complexity["total_conditionals"] += 1
-                complexity["cyclomatic_complexity"] += 1
-            elif isinstance(node, (ast.For, ast.While)):
-                complexity["cyclomatic_complexity"] += 1
-        
         # Estimate time complexity category
         if complexity["nested_loops"] >= 3:
             complexity["estimated_time_complexity"] = "O(n³) or worse"
@@ -293,7 +310,7 @@ class CodeAnalyzer:
             complexity["estimated_time_complexity"] = "O(n²)"
         elif complexity["nested_loops"] == 1:
             complexity["estimated_time_complexity"] = "O(n)"
-        elif any(isinstance(node, ast.FunctionDef) and self._is_recursive(node) for node in ast.walk(tree)):
+        elif visitor.has_recursion:
             complexity["estimated_time_complexity"] = "O(log n) atau O(n) tergantung rekursi"
         else:
             complexity["estimated_time_complexity"] = "O(1)"
@@ -405,8 +422,101 @@ class CodeAnalyzer:
         return questions
 
 
+def _synthetic_code(target_bytes: int) -> str:
+    """Python source of roughly target_bytes (functions with loops, branches and recursion)"""
+    template = """
+def search_{i}(arr, target, low=0, high=None):
+    \"\"\"Binary search variant {i}\"\"\"
+    if high is None:
+        high = len(arr) - 1
+    if low > high:
+        return -1
+    mid = (low + high) // 2
+    if arr[mid] == target:
+        return mid
+    if arr[mid] < target:
+        return search_{i}(arr, target, mid + 1, high)
+    return search_{i}(arr, target, low, mid - 1)
+
+
+def sort_{i}(items):
+    result = list(items)
+    for a in range(len(result)):
+        for b in range(len(result) - a - 1):
+            if result[b] > result[b + 1]:
+                result[b], result[b + 1] = result[b + 1], result[b]
+    return result
+
+
+class Stack{i}:
+    def __init__(self):
+        self.items = []
+
+    def push(self, item):
+        self.items.append(item)
+
+    def pop(self):
+        while self.items and self.items[-1] is None:
+            self.items.pop()
+        return self.items.pop() if self.items else None
+"""
+    parts = []
+    size = 0
+    i = 0
+    while size < target_bytes:
+        part = template.format(i=i)
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def benchmark_analysis(sizes: tuple = (64 * 1024, 256 * 1024, 1024 * 1024)) -> List[Dict[str, Any]]:
+    """
+    Measure analyze_code on synthetic uploads of increasing size
+    
+    Args:
+        sizes: Source sizes in bytes
+    
+    Returns:
+        List of dicts with 'bytes', 'nodes', 'parse_s', 'analyze_s' (whole
+        analyze_code, parse included) and 'us_per_node' (analysis without
+        the parse)
+    """
+    import time
+    
+    analyzer = CodeAnalyzer()
+    results = []
+    for size in sizes:
+        code = _synthetic_code(size)
+        start = time.perf_counter()
+        tree = ast.parse(code)
+        parse_time = time.perf_counter() - start
+        nodes = sum(1 for _ in ast.walk(tree))
+        
+        start = time.perf_counter()
+        analyzer.analyze_code(code)
+        analyze_time = time.perf_counter() - start
+        results.append({
+            "bytes": len(code),
+            "nodes": nodes,
+            "parse_s": parse_time,
+            "analyze_s": analyze_time,
+            "us_per_node": max(analyze_time - parse_time, 0.0) / nodes * 1e6
+        })
+    return results
+
+
 # Example usage
 if __name__ == "__main__":
+    import sys
+    
+    if "--benchmark" in sys.argv:
+        print(f"{'bytes':>9} {'nodes':>8} {'parse (s)':>10} {'analyze (s)':>12} {'us/node':>8}")
+        for row in benchmark_analysis():
+            print(f"{row['bytes']:>9} {row['nodes']:>8} {row['parse_s']:>10.3f} {row['analyze_s']:>12.3f} {row['us_per_node']:>8.2f}")
+        sys.exit(0)
+    
     analyzer = CodeAnalyzer()
     
     # Test code
@@ -0,0 +1,216 @@
+"""
+Conversation Summarizer
+Folds older chat turns into a running summary in the background
+"""
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+
+from .llm.tokenizer import get_token_counter
+
+SUMMARY_SYSTEM_PROMPT = """Kamu merangkum percakapan antara mahasiswa dan tutor algoritma & pemrograman.
+Tulis ringkasan padat dalam bahasa Indonesia (maksimal {max_words} kata) yang mencakup:
+- topik dan konsep yang sudah dibahas
+- bagian yang sudah atau belum dipahami mahasiswa
+- kode, algoritma, atau contoh penting yang disebut
+- pertanyaan yang masih terbuka
+Jangan menambahkan informasi yang tidak ada di percakapan."""
+
+# Provider/model footer appended to assistant replies in the chat page
+_FOOTER_PATTERN = re.compile(r"\n*<sub>.*?</sub>\s*$", re.DOTALL)
+
+
+class ConversationSummarizer:
+    """
+    Keep long conversations within a fixed history budget
+    
+    After each reply, turns that no longer fit in the recent-history budget
+    are folded into a running summary by a background LLM call. Requests
+    then send that summary plus the recent turns verbatim, so their cost
+    stays flat however long the session gets. A request never waits for
+    summarization: it uses the newest summary that is ready.
+    """
+    
+    def __init__(
+        self,
+        llm_manager,
+        recent_tokens: int = 1500,
+        summary_words: int = 200,
+        min_fold_messages: int = 2,
+        max_conversations: int = 1000,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        """
+        Initialize summarizer
+        
+        Args:
+            llm_manager: LLMManager used for the summary calls
+            recent_tokens: Token cap for turns kept verbatim
+            summary_words: Target summary length
+            min_fold_messages: Fewest new messages worth a summary call
+            max_conversations: Conversations tracked (least recently used dropped)
+            count_tokens: Token counter (default: generic TokenCounter)
+        """
+        self.llm_manager = llm_manager
+        self.recent_tokens = recent_tokens
+        self.summary_words = summary_words
+        self.min_fold_messages = min_fold_messages
+        self.max_conversations = max_conversations
+        self.count_tokens = count_tokens or get_token_counter().count
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+        self.lock = threading.Lock()
+        # conversation id -> {'summary', 'count', 'fingerprint', 'running'}
+        self.conversations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"runs": 0, "failures": 0, "folded_messages": 0}
+    
+    @staticmethod
+    def _fingerprint(messages: List[Dict[str, str]]) -> str:
+        """Hash of a message prefix, to notice a cleared or different conversation"""
+        digest = hashlib.sha1()
+        for msg in messages:
+            digest.update(f"{msg.get('role')}\0{msg.get('content')}\0".encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _message_tokens(self, msg: Dict[str, str]) -> int:
+        """Cost of one turn (same framing as PromptBuilder's history)"""
+        return self.count_tokens(f"{msg.get('role', 'user')}: {msg.get('content', '')}\n")
+    
+    def _split_point(self, messages: List[Dict[str, str]]) -> int:
+        """Index of the first message kept verbatim (newest turns under recent_tokens)"""
+        used = 0
+        start = len(messages)
+        while start > 0 and used + self._message_tokens(messages[start - 1]) <= self.recent_tokens:
+            start -= 1
+            used += self._message_tokens(messages[start])
+        # Recent history starts with a student turn
+        while start < len(messages) and messages[start].get("role") == "assistant":
+            start += 1
+        return start
+    
+    def _valid_state(self, conversation_id: str, messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """Stored state if it still describes a prefix of messages (lock held)"""
+        state = self.conversations.get(conversation_id)
+        if not state or not state["count"]:
+            return state
+        if len(messages) < state["count"] or self._fingerprint(messages[:state["count"]]) != state["fingerprint"]:
+            return None
+        return state
+    
+    def get_context(self, conversation_id: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        Get the history to send with a request (never blocks)
+        
+        Args:
+            conversation_id: Stable id of the chat session
+            messages: Chronological previous turns
+        
+        Returns:
+            Dict with 'summary' (empty string if none yet), 'messages' (turns not
+            covered by the summary) and 'summarized' (number of turns folded)
+        """
+        with self.lock:
+            state = self._valid_state(conversation_id, messages)
+            if state:
+                self.conversations.move_to_end(conversation_id)
+        folded = state["count"] if state else 0
+        return {
+            "summary": state["summary"] if state else "",
+            "messages": list(messages[folded:]),
+            "summarized": folded
+        }
+    
+    def schedule(self, conversation_id: str, messages: List[Dict[str, str]]) -> bool:
+        """
+        Fold turns that left the recent window into the summary, in the background
+        
+        Args:
+            conversation_id: Stable id of the chat session
+            messages: Chronological turns including the latest reply
+        
+        Returns:
+            True if a summary run was started
+        """
+        split = self._split_point(messages)
+        with self.lock:
+            state = self._valid_state(conversation_id, messages)
+            if state and state["running"]:
+                return False
+            folded = state["count"] if state else 0
+            if split - folded < self.min_fold_messages:
+                return False
+            summary = state["summary"] if state else ""
+            self.conversations[conversation_id] = {
+                "summary": summary,
+                "count": folded,
+                "fingerprint": state["fingerprint"] if state else "",
+                "running": True
+            }
+            self.conversations.move_to_end(conversation_id)
+            while len(self.conversations) > self.max_conversations:
+                self.conversations.popitem(last=False)
+        
+        self.executor.submit(self._summarize, conversation_id, list(messages[:split]), folded, summary)
+        return True
+    
+    def _summarize(self, conversation_id: str, covered: List[Dict[str, str]], folded: int, previous_summary: str):
+        """Produce the summary of `covered` from the previous summary and the newly folded turns"""
+        lines = []
+        for msg in covered[folded:]:
+            speaker = "Mahasiswa" if msg.get("role") == "user" else "Tutor"
+            lines.append(f"{speaker}: {_FOOTER_PATTERN.sub('', msg.get('content', ''))}")
+        
+        prompt = ""
+        if previous_summary:
+            prompt += f"Ringkasan sebelumnya:\n{previous_summary}\n\n"
+        prompt += "Percakapan lanjutan:\n" + "\n\n".join(lines)
+        prompt += "\n\nTulis ringkasan terbaru yang mencakup seluruh percakapan di atas."
+        
+        try:
+            result = self.llm_manager.generate_response(
+                prompt=prompt,
+                system_prompt=SUMMARY_SYSTEM_PROMPT.format(max_words=self.summary_words),
+                temperature=0.2,
+                max_tokens=self.summary_words * 3
+            )
+            failed = result["error"] or not result["response"].strip()
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+            failed = True
+        
+        with self.lock:
+            self.stats["runs"] += 1
+            state = self.conversations.get(conversation_id)
+            if failed:
+                self.stats["failures"] += 1
+                if state:
+                    state["running"] = False
+                return
+            self.stats["folded_messages"] += len(covered) - folded
+            self.conversations[conversation_id] = {
+                "summary": result["response"].strip(),
+                "count": len(covered),
+                "fingerprint": self._fingerprint(covered),
+                "running": False
+            }
+    
+    def reset(self, conversation_id: str):
+        """Forget a conversation's summary (e.g. when the chat is cleared)"""
+        with self.lock:
+            self.conversations.pop(conversation_id, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get summarizer statistics
+        
+        Returns:
+            Dict with 'conversations', 'running', 'runs', 'failures' and 'folded_messages'
+        """
+        with self.lock:
+            return dict(
+                self.stats,
+                conversations=len(self.conversations),
+                running=sum(1 for state in self.conversations.values() if state["running"])
+            )
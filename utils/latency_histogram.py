@@ -0,0 +1,164 @@
+"""
+Latency Histogram
+Fixed-memory, mergeable log-bucketed histogram (HDR-histogram style) for latency percentiles
+"""
+import math
+import threading
+from typing import Dict, Any, Optional
+
+
+class LatencyHistogram:
+    """
+    Record latencies into logarithmic buckets and answer percentile queries
+    
+    Bucket i covers [min_value * growth^i, min_value * growth^(i+1)), so every
+    reported percentile is within (growth - 1) relative error of the true value.
+    Memory is fixed by the bucket count no matter how many samples are recorded,
+    and two histograms with the same layout can be merged by adding counts.
+    """
+    
+    def __init__(self, min_value: float = 0.001, max_value: float = 600.0, growth: float = 1.05):
+        """
+        Initialize histogram
+        
+        Args:
+            min_value: Smallest distinguishable latency in seconds (smaller values clamp to it)
+            max_value: Largest tracked latency in seconds (larger values clamp to it)
+            growth: Ratio between consecutive bucket bounds (1.05 = 5% precision)
+        """
+        self.min_value = min_value
+        self.max_value = max_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.num_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_growth)) + 1
+        self.counts = [0] * self.num_buckets
+        self.count = 0
+        self.total = 0.0
+        self.min_seen: Optional[float] = None
+        self.max_seen: Optional[float] = None
+        self.lock = threading.Lock()
+    
+    def _bucket_index(self, value: float) -> int:
+        """Map a value to its bucket index"""
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self._log_growth)
+        return min(index, self.num_buckets - 1)
+    
+    def _bucket_value(self, index: int) -> float:
+        """Representative value of a bucket (geometric midpoint of its bounds)"""
+        return self.min_value * (self.growth ** (index + 0.5))
+    
+    def record(self, value: float):
+        """
+        Record one latency sample
+        
+        Args:
+            value: Latency in seconds
+        """
+        with self.lock:
+            self.counts[self._bucket_index(value)] += 1
+            self.count += 1
+            self.total += value
+            self.min_seen = value if self.min_seen is None else min(self.min_seen, value)
+            self.max_seen = value if self.max_seen is None else max(self.max_seen, value)
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Estimate a percentile
+        
+        Args:
+            p: Percentile between 0 and 100
+        
+        Returns:
+            Estimated latency in seconds, or None if no samples
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            
+            rank = max(1, int(math.ceil(p / 100.0 * self.count)))
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    value = self._bucket_value(index)
+                    # Never report outside the observed range
+                    return min(max(value, self.min_seen), self.max_seen)
+            return self.max_seen
+    
+    def mean(self) -> Optional[float]:
+        """Average of all recorded samples, or None if empty"""
+        with self.lock:
+            return self.total / self.count if self.count else None
+    
+    def merge(self, other: "LatencyHistogram"):
+        """
+        Add another histogram's samples into this one
+        
+        Args:
+            other: Histogram with the same bucket layout
+        """
+        if (other.min_value, other.max_value, other.growth) != (self.min_value, self.max_value, self.growth):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+        
+        with other.lock:
+            counts = list(other.counts)
+            count, total = other.count, other.total
+            min_seen, max_seen = other.min_seen, other.max_seen
+        
+        with self.lock:
+            for index, bucket_count in enumerate(counts):
+                self.counts[index] += bucket_count
+            self.count += count
+            self.total += total
+            if min_seen is not None:
+                self.min_seen = min_seen if self.min_seen is None else min(self.min_seen, min_seen)
+            if max_seen is not None:
+                self.max_seen = max_seen if self.max_seen is None else max(self.max_seen, max_seen)
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        Get count, mean and common percentiles
+        
+        Returns:
+            Dict with 'count', 'mean', 'p50', 'p95', 'p99', 'max'
+        """
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max_seen
+        }
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a compact JSON-friendly dict (only non-empty buckets)"""
+        with self.lock:
+            return {
+                "min_value": self.min_value,
+                "max_value": self.max_value,
+                "growth": self.growth,
+                "buckets": {str(i): c for i, c in enumerate(self.counts) if c},
+                "count": self.count,
+                "total": self.total,
+                "min_seen": self.min_seen,
+                "max_seen": self.max_seen
+            }
+    
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "LatencyHistogram":
+        """Rebuild a histogram serialized with to_dict"""
+        histogram = LatencyHistogram(
+            min_value=data.get("min_value", 0.001),
+            max_value=data.get("max_value", 600.0),
+            growth=data.get("growth", 1.05)
+        )
+        for index, bucket_count in data.get("buckets", {}).items():
+            histogram.counts[int(index)] = bucket_count
+        histogram.count = data.get("count", 0)
+        histogram.total = data.get("total", 0.0)
+        histogram.min_seen = data.get("min_seen")
+        histogram.max_seen = data.get("max_seen")
+        return histogram
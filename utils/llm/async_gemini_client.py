@@ -0,0 +1,124 @@
+"""
+Async Gemini API Client Wrapper
+asyncio-native counterpart of GeminiClient using the SDK's *_async calls
+"""
+import asyncio
+from typing import Optional, Dict, Any, List
+
+from .gemini_client import GeminiClient
+
+
+class AsyncGeminiClient(GeminiClient):
+    """
+    Non-blocking Gemini client
+    
+    Shares configuration, request building and result parsing with GeminiClient;
+    only the network calls are awaited instead of blocking a thread.
+    """
+    
+    async def _prepare_request_async(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ):
+        """
+        GeminiClient._prepare_request off the event loop
+        
+        Preparing a request can create a CachedContent through the context
+        cache, a blocking SDK call, so it runs in a worker thread.
+        """
+        return await asyncio.to_thread(self._prepare_request, prompt, system_prompt, conversation_history)
+    
+    async def generate_response(
+        self, 
+        prompt: str, 
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate response from Gemini without blocking the event loop
+        
+        Args:
+            prompt: User's input prompt
+            system_prompt: System instruction for the model
+            temperature: Override default temperature
+            max_tokens: Override default max tokens
+            conversation_history: List of previous messages for context
+            
+        Returns:
+            Same dict as GeminiClient.generate_response
+        """
+        try:
+            model, contents = await self._prepare_request_async(prompt, system_prompt, conversation_history)
+            response = await model.generate_content_async(
+                contents,
+                generation_config=self._build_generation_config(temperature, max_tokens),
+                safety_settings=self.safety_settings
+            )
+            return self._response_to_result(response)
+        
+        except Exception as e:
+            return self._error_result(e)
+    
+    async def generate_streaming_response(
+        self, 
+        prompt: str, 
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        include_metadata: bool = False
+    ):
+        """
+        Stream response chunks from Gemini as an async generator
+        
+        Args:
+            Same as GeminiClient.generate_streaming_response
+            
+        Yields:
+            Chunks of text, then the final metadata dict if include_metadata
+        """
+        state = self._new_stream_state()
+        
+        try:
+            model, contents = await self._prepare_request_async(prompt, system_prompt, conversation_history)
+            response = await model.generate_content_async(
+                contents,
+                generation_config=self._build_generation_config(temperature, max_tokens),
+                safety_settings=self.safety_settings,
+                stream=True
+            )
+            
+            async for chunk in response:
+                text = self._consume_stream_chunk(state, chunk)
+                if text:
+                    yield text
+        
+        except Exception as e:
+            if not include_metadata:
+                yield f"\n\n[Error: {str(e)}]"
+                return
+            yield self._stream_error_event(state, e)
+            return
+        
+        final_event = self._stream_final_event(state)
+        if include_metadata:
+            yield final_event
+        elif final_event["error"]:
+            yield f"\n\n[Error: {final_event['error_message']}]"
+    
+    async def test_connection(self) -> bool:
+        """
+        Test if API connection is working
+        
+        Returns:
+            True if connection successful, False otherwise
+        """
+        try:
+            test_response = await self.generate_response("Hello, this is a test.")
+            return not test_response["error"]
+        except Exception:
+            return False
@@ -0,0 +1,399 @@
+"""
+Async LLM Manager - asyncio-native counterpart of LLMManager
+Lets many chat sessions share one event loop instead of holding a thread per generation
+"""
+import os
+import time
+import asyncio
+from typing import Optional, Dict, Any, List
+from dotenv import load_dotenv
+
+from .llm_manager import ModelProvider, providers_from_env
+from .async_gemini_client import AsyncGeminiClient
+from .async_openai_client import AsyncOpenAIClient
+
+
+class AsyncLLMManager:
+    """
+    Unified async interface for multiple LLM providers
+    Handles fallback, timeouts and cancellation as coroutines
+    """
+    
+    def __init__(
+        self,
+        primary_provider: ModelProvider = ModelProvider.GEMINI,
+        fallback_provider: Optional[ModelProvider] = None,
+        gemini_api_key: Optional[str] = None,
+        openai_api_key: Optional[str] = None,
+        gemini_model: str = "gemini-pro",
+        openai_model: str = "gpt-3.5-turbo",
+        timeout: Optional[float] = None,
+        first_token_timeout: Optional[float] = None,
+        clients: Optional[Dict[ModelProvider, Any]] = None
+    ):
+        """
+        Initialize Async LLM Manager
+        
+        Args:
+            primary_provider: Primary LLM provider to use
+            fallback_provider: Fallback provider if primary fails
+            gemini_api_key: Gemini API key (reads from env if None)
+            openai_api_key: OpenAI API key (reads from env if None)
+            gemini_model: Gemini model name
+            openai_model: OpenAI model name
+            timeout: Seconds allowed per provider call (None = no limit)
+            first_token_timeout: Seconds allowed until a stream yields its first chunk
+            clients: Pre-built clients keyed by provider (e.g. local fakes);
+                skips creating SDK clients when given
+        """
+        load_dotenv()
+        
+        self.primary_provider = primary_provider
+        self.fallback_provider = fallback_provider
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        
+        if clients is not None:
+            self.clients = dict(clients)
+        else:
+            self.clients = {}
+            
+            try:
+                self.clients[ModelProvider.GEMINI] = AsyncGeminiClient(
+                    api_key=gemini_api_key,
+                    model_name=gemini_model
+                )
+            except Exception as e:
+                print(f"Warning: Could not initialize async Gemini client: {e}")
+            
+            try:
+                self.clients[ModelProvider.OPENAI] = AsyncOpenAIClient(
+                    api_key=openai_api_key,
+                    model_name=openai_model
+                )
+            except Exception as e:
+                print(f"Warning: Could not initialize async OpenAI client: {e}")
+        
+        if not self.clients:
+            raise ValueError("No LLM providers could be initialized. Check API keys.")
+    
+    def _candidate_providers(self, provider: Optional[ModelProvider]) -> List[ModelProvider]:
+        """Primary (or override) provider followed by the fallback, if available"""
+        target_provider = provider or self.primary_provider
+        candidates = [target_provider]
+        if self.fallback_provider and self.fallback_provider != target_provider:
+            candidates.append(self.fallback_provider)
+        return [p for p in candidates if p in self.clients]
+    
+    def _timeout_result(self, client: Any, seconds: float) -> Dict[str, Any]:
+        """Result dict for a provider call that exceeded its time budget"""
+        return {
+            "response": None,
+            "model": getattr(client, "model_name", "unknown"),
+            "error": True,
+            "error_message": f"Timed out after {seconds:.1f}s",
+            "finish_reason": "TIMEOUT"
+        }
+    
+    async def generate_response(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        provider: Optional[ModelProvider] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate response using specified or primary provider with fallback
+        
+        Args:
+            prompt: User's input prompt
+            system_prompt: System instruction for the model
+            temperature: Temperature for generation
+            max_tokens: Maximum tokens to generate
+            provider: Override primary provider
+            conversation_history: Previous conversation messages
+            timeout: Override the per-provider timeout for this call
+        
+        Returns:
+            Dict with response and metadata (same shape as LLMManager.generate_response)
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        candidates = self._candidate_providers(provider)
+        
+        for index, current_provider in enumerate(candidates):
+            client = self.clients[current_provider]
+            
+            try:
+                result = await asyncio.wait_for(
+                    client.generate_response(
+                        prompt=prompt,
+                        system_prompt=system_prompt,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        conversation_history=conversation_history
+                    ),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                result = self._timeout_result(client, timeout)
+            
+            result["provider"] = current_provider.value
+            if index > 0:
+                result["used_fallback"] = True
+            
+            if not result["error"] or index + 1 == len(candidates):
+                return result
+            
+            print(f"Provider ({current_provider.value}) failed, trying fallback...")
+        
+        # All providers failed
+        return {
+            "response": None,
+            "model": "none",
+            "provider": "none",
+            "error": True,
+            "error_message": "All providers failed or unavailable",
+            "finish_reason": "ALL_FAILED"
+        }
+    
+    async def generate_streaming_response(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        provider: Optional[ModelProvider] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        include_metadata: bool = False,
+        timeout: Optional[float] = None,
+        first_token_timeout: Optional[float] = None
+    ):
+        """
+        Stream response chunks with fallback, as an async generator
+        
+        A provider that errors or misses the first-token deadline is abandoned
+        (its stream is closed) and the fallback is tried, as long as no text has
+        been yielded yet. Cancelling the consumer closes the active stream.
+        
+        Args:
+            prompt: User's input prompt
+            system_prompt: System instruction for the model
+            temperature: Temperature for generation
+            max_tokens: Maximum tokens to generate
+            provider: Override primary provider
+            conversation_history: Previous conversation messages
+            include_metadata: If True, yield a final dict like LLMManager's streaming metadata
+            timeout: Override the total time budget per provider
+            first_token_timeout: Override the first-chunk deadline per provider
+        
+        Yields:
+            Chunks of text as they are generated
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        first_token_timeout = first_token_timeout if first_token_timeout is not None else self.first_token_timeout
+        candidates = self._candidate_providers(provider)
+        
+        start_time = time.time()
+        result = None
+        
+        for index, current_provider in enumerate(candidates):
+            client = self.clients[current_provider]
+            provider_start = time.time()
+            chunks = []
+            first_token_time = None
+            metadata = None
+            
+            stream = client.generate_streaming_response(
+                prompt=prompt,
+                system_prompt=system_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                conversation_history=conversation_history,
+                include_metadata=True
+            )
+            
+            try:
+                while True:
+                    # Deadline for the next chunk: first-token budget, then the total budget
+                    deadlines = []
+                    if timeout is not None:
+                        deadlines.append(provider_start + timeout)
+                    if first_token_timeout is not None and not chunks:
+                        deadlines.append(provider_start + first_token_timeout)
+                    wait = max(0.0, min(deadlines) - time.time()) if deadlines else None
+                    
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=wait)
+                    except StopAsyncIteration:
+                        break
+                    
+                    if isinstance(chunk, dict):
+                        metadata = chunk
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    chunks.append(chunk)
+                    yield chunk
+            
+            except asyncio.TimeoutError:
+                metadata = self._timeout_result(client, time.time() - provider_start)
+            
+            finally:
+                await stream.aclose()
+            
+            result = dict(metadata or {
+                "model": getattr(client, "model_name", "unknown"),
+                "error": False,
+                "error_message": None,
+                "finish_reason": None
+            })
+            result["response"] = "".join(chunks) if chunks else None
+            result["provider"] = current_provider.value
+            result["used_fallback"] = index > 0
+            result["time_to_first_token"] = first_token_time
+            result["total_time"] = time.time() - start_time
+            
+            # Only fall back if nothing reached the caller yet
+            if not result["error"] or chunks:
+                break
+            
+            if index + 1 < len(candidates):
+                print(f"Provider ({current_provider.value}) failed before streaming, trying fallback...")
+        
+        if result is None:
+            result = {
+                "response": None,
+                "model": "none",
+                "provider": "none",
+                "error": True,
+                "error_message": "All providers failed or unavailable",
+                "finish_reason": "ALL_FAILED",
+                "used_fallback": False,
+                "time_to_first_token": None,
+                "total_time": time.time() - start_time
+            }
+        
+        if include_metadata:
+            yield result
+        elif result["error"] and not result["response"]:
+            yield f"[Error: {result['error_message']}]"
+    
+    def get_available_providers(self) -> List[str]:
+        """
+        Get list of available providers
+        
+        Returns:
+            List of provider names
+        """
+        return [provider.value for provider in self.clients.keys()]
+    
+    async def test_provider(self, provider: ModelProvider) -> bool:
+        """
+        Test if a provider is working
+        
+        Args:
+            provider: Provider to test
+        
+        Returns:
+            True if provider is working, False otherwise
+        """
+        if provider not in self.clients:
+            return False
+        
+        return await self.clients[provider].test_connection()
+    
+    async def test_all_providers(self) -> Dict[str, bool]:
+        """
+        Test all available providers concurrently
+        
+        Returns:
+            Dict mapping provider names to their status
+        """
+        providers = list(self.clients.keys())
+        statuses = await asyncio.gather(*(self.test_provider(p) for p in providers))
+        return {provider.value: status for provider, status in zip(providers, statuses)}
+    
+    @staticmethod
+    def from_env() -> "AsyncLLMManager":
+        """
+        Create AsyncLLMManager from environment variables
+        
+        Environment variables:
+            Same as LLMManager.from_env, plus
+            - LLM_TIMEOUT_SECONDS: Per-provider time budget (default: no limit)
+            - LLM_FIRST_TOKEN_TIMEOUT_SECONDS: Per-provider first-chunk deadline for streaming
+        
+        Returns:
+            Configured AsyncLLMManager instance
+        """
+        load_dotenv()
+        
+        primary, fallback = providers_from_env()
+        timeout = os.getenv("LLM_TIMEOUT_SECONDS")
+        first_token_timeout = os.getenv("LLM_FIRST_TOKEN_TIMEOUT_SECONDS")
+        
+        return AsyncLLMManager(
+            primary_provider=primary,
+            fallback_provider=fallback,
+            gemini_model=os.getenv("GEMINI_MODEL", "gemini-pro"),
+            openai_model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            timeout=float(timeout) if timeout else None,
+            first_token_timeout=float(first_token_timeout) if first_token_timeout else None
+        )
+
+
+# Example usage against a local fake provider (no network)
+if __name__ == "__main__":
+    class FakeAsyncClient:
+        """Minimal stand-in implementing the async client interface"""
+        
+        def __init__(self, name: str, delay: float, fail: bool = False):
+            self.model_name = name
+            self.delay = delay
+            self.fail = fail
+        
+        async def generate_response(self, prompt, **kwargs):
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                return {"response": None, "model": self.model_name, "error": True,
+                        "error_message": "fake failure", "finish_reason": "ERROR"}
+            return {"response": f"echo: {prompt}", "model": self.model_name, "error": False,
+                    "error_message": None, "finish_reason": "STOP"}
+        
+        async def generate_streaming_response(self, prompt, include_metadata=False, **kwargs):
+            for word in f"echo: {prompt}".split():
+                await asyncio.sleep(self.delay)
+                yield word + " "
+            if include_metadata:
+                yield {"model": self.model_name, "error": False,
+                       "error_message": None, "finish_reason": "STOP"}
+        
+        async def test_connection(self):
+            return not self.fail
+    
+    async def main():
+        manager = AsyncLLMManager(
+            primary_provider=ModelProvider.GEMINI,
+            fallback_provider=ModelProvider.OPENAI,
+            timeout=0.5,
+            first_token_timeout=0.2,
+            clients={
+                ModelProvider.GEMINI: FakeAsyncClient("slow-fake", delay=1.0),
+                ModelProvider.OPENAI: FakeAsyncClient("fast-fake", delay=0.01),
+            }
+        )
+        
+        # 20 concurrent sessions on one event loop
+        results = await asyncio.gather(*(
+            manager.generate_response(f"pertanyaan {i}") for i in range(20)
+        ))
+        print(f"Complete: {sum(not r['error'] for r in results)}/20 ok, "
+              f"fallback used: {sum(bool(r.get('used_fallback')) for r in results)}")
+        
+        async for chunk in manager.generate_streaming_response("apa itu binary search", include_metadata=True):
+            print(chunk)
+    
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""
+Async OpenAI API Client Wrapper
+asyncio-native counterpart of OpenAIClient using AsyncOpenAI
+"""
+from typing import Optional, Dict, Any, List
+from openai import AsyncOpenAI
+
+from .openai_client import OpenAIClient
+
+
+class AsyncOpenAIClient(OpenAIClient):
+    """
+    Non-blocking OpenAI client
+    
+    Shares configuration, message building and result parsing with OpenAIClient;
+    only the network calls are awaited instead of blocking a thread.
+    """
+    
+    def __init__(self, api_key: Optional[str] = None, model_name: str = "gpt-3.5-turbo"):
+        """
+        Initialize async OpenAI client
+        
+        Args:
+            api_key: OpenAI API key. If None, reads from environment
+            model_name: Model to use (default: gpt-3.5-turbo)
+        """
+        super().__init__(api_key=api_key, model_name=model_name)
+        self.client = AsyncOpenAI(api_key=self.api_key)
+    
+    async def generate_response(
+        self, 
+        prompt: str, 
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate response from OpenAI without blocking the event loop
+        
+        Args:
+            prompt: User's input prompt
+            system_prompt: System instruction for the model
+            temperature: Override default temperature
+            max_tokens: Override default max tokens
+            conversation_history: List of previous messages
+            
+        Returns:
+            Same dict as OpenAIClient.generate_response
+        """
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt, system_prompt, conversation_history),
+                temperature=temperature if temperature is not None else self.default_temperature,
+                max_tokens=max_tokens if max_tokens is not None else self.default_max_tokens,
+                top_p=self.default_top_p
+            )
+            return self._completion_to_result(response)
+        
+        except Exception as e:
+            error_message, error_reason = self._describe_error(e)
+            return {
+                "response": None,
+                "model": self.model_name,
+                "error": True,
+                "error_message": error_message,
+                "finish_reason": error_reason
+            }
+    
+    async def generate_streaming_response(
+        self, 
+        prompt: str, 
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        include_metadata: bool = False
+    ):
+        """
+        Stream response chunks from OpenAI as an async generator
+        
+        Args:
+            Same as OpenAIClient.generate_streaming_response
+            
+        Yields:
+            Chunks of text, then the final metadata dict if include_metadata
+        """
+        state = self._new_stream_state()
+        stream = None
+        
+        try:
+            stream = await self.client.chat.completions.create(
+                **self._build_stream_request(
+                    prompt, system_prompt, temperature, max_tokens,
+                    conversation_history, include_metadata
+                )
+            )
+            
+            async for chunk in stream:
+                text = self._consume_stream_chunk(state, chunk)
+                if text:
+                    yield text
+        
+        except Exception as e:
+            if not include_metadata:
+                yield f"\n\n[Error: {str(e)}]"
+                return
+            yield self._stream_error_event(state, e)
+            return
+        
+        finally:
+            # Release the HTTP connection when the consumer stops early or is cancelled
+            if stream is not None:
+                await stream.close()
+        
+        final_event = self._stream_final_event(state)
+        if include_metadata:
+            yield final_event
+        elif final_event["error"]:
+            yield f"\n\n[Error: {final_event['error_message']}]"
+    
+    async def test_connection(self) -> bool:
+        """
+        Test if API connection is working
+        
+        Returns:
+            True if connection successful, False otherwise
+        """
+        try:
+            test_response = await self.generate_response("Hello, this is a test.")
+            return not test_response["error"]
+        except Exception:
+            return False
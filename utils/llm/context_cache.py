@@ -0,0 +1,283 @@
+"""
+Context Cache
+Stable system-prompt prefixes and the provider-side caches holding them
+"""
+import os
+import time
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+from .tokenizer import get_token_counter
+
+# Smallest prefix (tokens) Gemini accepts for explicit context caching, by model prefix
+GEMINI_MIN_CACHE_TOKENS = {
+    "gemini-1.5": 32768,
+    "gemini-2.5-pro": 4096,
+    "gemini": 1024,
+}
+
+
+def gemini_min_cache_tokens(model_name: str) -> int:
+    """Minimum cacheable prefix of a Gemini model (longest matching prefix wins)"""
+    matches = [prefix for prefix in GEMINI_MIN_CACHE_TOKENS if model_name.startswith(prefix)]
+    return GEMINI_MIN_CACHE_TOKENS[max(matches, key=len)] if matches else 4096
+
+
+class ContextCache:
+    """
+    Track stable prompt prefixes and provider cache handles
+    
+    A prefix is either registered up front (e.g. the contents of
+    data/system_prompt.txt) or detected as the paragraph-aligned common
+    start of consecutive system prompts. Clients split every system prompt
+    into that static prefix and the per-request rest:
+    
+    - Gemini: the prefix is stored once as CachedContent; requests reference
+      the handle and only send the rest. Handles are renewed before expiry.
+    - OpenAI: the prefix is sent as a byte-identical first message so the
+      provider's automatic prefix caching applies.
+    
+    Prompt and cached token counts from the responses' usage metadata are
+    accumulated per provider to verify that caching actually happens.
+    """
+    
+    def __init__(
+        self,
+        ttl_seconds: int = 3600,
+        min_prefix_tokens: int = 256,
+        refresh_margin: int = 120,
+        retry_after: int = 600,
+        max_prefixes: int = 8
+    ):
+        """
+        Initialize context cache
+        
+        Args:
+            ttl_seconds: Lifetime of provider cache handles
+            min_prefix_tokens: Shortest common start treated as a detected prefix
+            refresh_margin: Renew a handle this many seconds before it expires
+            retry_after: Seconds before retrying a prefix whose handle could not be created
+            max_prefixes: Prefixes tracked (oldest dropped)
+        """
+        self.ttl_seconds = ttl_seconds
+        self.min_prefix_tokens = min_prefix_tokens
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.max_prefixes = max_prefixes
+        self.lock = threading.Lock()
+        self.prefixes: List[str] = []
+        self._last_system_prompt: Optional[str] = None
+        # (provider, model, prefix hash) -> handle dict
+        self.handles: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._failures: Dict[Tuple[str, str, str], float] = {}
+        self.usage: Dict[str, Dict[str, int]] = {}
+    
+    @staticmethod
+    def _hash(prefix: str) -> str:
+        """Short content hash of a prefix"""
+        return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+    
+    def _add_prefix(self, prefix: str):
+        """Remember a prefix, most recent last (lock held)"""
+        if prefix in self.prefixes:
+            self.prefixes.remove(prefix)
+        self.prefixes.append(prefix)
+        del self.prefixes[:-self.max_prefixes]
+    
+    def register_prefix(self, prefix: str):
+        """
+        Declare a known static prefix of upcoming system prompts
+        
+        Args:
+            prefix: Text every matching system prompt starts with
+        """
+        if prefix:
+            with self.lock:
+                self._add_prefix(prefix)
+    
+    def split(self, system_prompt: Optional[str]) -> Tuple[str, str]:
+        """
+        Split a system prompt into its static prefix and the rest
+        
+        Args:
+            system_prompt: Full system prompt
+        
+        Returns:
+            (prefix, rest); prefix is empty when none applies
+        """
+        if not system_prompt:
+            return "", system_prompt or ""
+        
+        with self.lock:
+            known = [prefix for prefix in self.prefixes if system_prompt.startswith(prefix)]
+            if not known and self._last_system_prompt:
+                detected = self._common_prefix(self._last_system_prompt, system_prompt)
+                if detected:
+                    self._add_prefix(detected)
+                    known = [detected]
+            self._last_system_prompt = system_prompt
+        
+        if not known:
+            return "", system_prompt
+        prefix = max(known, key=len)
+        return prefix, system_prompt[len(prefix):]
+    
+    def _common_prefix(self, first: str, second: str) -> Optional[str]:
+        """Common start of two prompts cut at a paragraph break, if long enough"""
+        length = len(os.path.commonprefix([first, second]))
+        if length == len(first) == len(second):
+            return None
+        cut = first.rfind("\n\n", 0, length + 1)
+        if cut <= 0:
+            return None
+        prefix = first[:cut]
+        if get_token_counter().count(prefix) < self.min_prefix_tokens:
+            return None
+        return prefix
+    
+    def get_handle(
+        self,
+        provider: str,
+        model_name: str,
+        prefix: str,
+        create: Callable[[str, int], Optional[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get a live provider cache handle for a prefix, creating or renewing it
+        
+        Args:
+            provider: Provider name
+            model_name: Model the handle belongs to
+            prefix: Static prefix to cache
+            create: Called as create(prefix, ttl_seconds); returns a dict with
+                'name', 'expires_at' (epoch seconds) and optional 'tokens' and
+                'model', None when the prefix is not eligible, or raises
+        
+        Returns:
+            Handle dict, or None if the prefix cannot be cached right now
+        """
+        key = (provider, model_name, self._hash(prefix))
+        now = time.time()
+        with self.lock:
+            handle = self.handles.get(key)
+            if handle and handle["expires_at"] - now > self.refresh_margin:
+                handle["hits"] += 1
+                return handle
+            if now - self._failures.get(key, 0) < self.retry_after:
+                return None
+        
+        try:
+            created = create(prefix, self.ttl_seconds)
+        except Exception as e:
+            print(f"Context cache creation failed ({provider}/{model_name}): {e}")
+            created = None
+        
+        with self.lock:
+            if not created:
+                self._failures[key] = now
+                self.handles.pop(key, None)
+                return None
+            self._failures.pop(key, None)
+            handle = dict(created, provider=provider, model_name=model_name, created_at=now, hits=1)
+            self.handles[key] = handle
+            return handle
+    
+    def record_usage(self, provider: str, usage: Optional[Dict[str, int]]):
+        """
+        Accumulate token usage reported by a provider
+        
+        Args:
+            provider: Provider name
+            usage: Dict with 'prompt_tokens' and 'cached_tokens'
+        """
+        if not usage:
+            return
+        with self.lock:
+            totals = self.usage.setdefault(provider, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            totals["requests"] += 1
+            totals["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            totals["cached_tokens"] += usage.get("cached_tokens") or 0
+    
+    def list_handles(self) -> List[Dict[str, Any]]:
+        """
+        List provider cache handles
+        
+        Returns:
+            List of dicts with 'provider', 'model_name', 'name', 'tokens', 'hits',
+            'created_at', 'expires_at' and 'expired'
+        """
+        now = time.time()
+        with self.lock:
+            return [
+                {
+                    "provider": handle["provider"],
+                    "model_name": handle["model_name"],
+                    "name": handle["name"],
+                    "tokens": handle.get("tokens"),
+                    "hits": handle["hits"],
+                    "created_at": handle["created_at"],
+                    "expires_at": handle["expires_at"],
+                    "expired": handle["expires_at"] <= now
+                }
+                for handle in self.handles.values()
+            ]
+    
+    def purge(self) -> int:
+        """
+        Delete every provider cache handle (and the provider-side cache, where possible)
+        
+        Returns:
+            Number of handles removed
+        """
+        with self.lock:
+            handles = list(self.handles.values())
+            self.handles.clear()
+            self._failures.clear()
+        for handle in handles:
+            resource = handle.get("resource")
+            if resource is not None and handle["expires_at"] > time.time():
+                try:
+                    resource.delete()
+                except Exception as e:
+                    print(f"Could not delete provider cache {handle['name']}: {e}")
+        return len(handles)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get context cache statistics
+        
+        Returns:
+            Dict with 'prefixes' (count and token sizes), 'handles' (live count)
+            and 'usage' per provider: requests, prompt_tokens, cached_tokens
+            and cached_ratio
+        """
+        now = time.time()
+        counter = get_token_counter()
+        with self.lock:
+            usage = {
+                provider: dict(
+                    totals,
+                    cached_ratio=totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+                )
+                for provider, totals in self.usage.items()
+            }
+            return {
+                "prefixes": len(self.prefixes),
+                "prefix_tokens": [counter.count(prefix) for prefix in self.prefixes],
+                "handles": sum(1 for handle in self.handles.values() if handle["expires_at"] > now),
+                "usage": usage
+            }
+
+
+# Global instance
+_context_cache_instance = None
+
+def get_context_cache() -> ContextCache:
+    """Get or create global context cache instance"""
+    global _context_cache_instance
+    if _context_cache_instance is None:
+        _context_cache_instance = ContextCache(
+            ttl_seconds=int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+        )
+    return _context_cache_instance
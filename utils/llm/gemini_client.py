@@ -3,16 +3,26 @@ Gemini API Client Wrapper
 Handles communication with Google Gemini API
 """
 import os
+import time
+import datetime
+import threading
+from collections import OrderedDict
 from typing import Optional, Dict, Any, List
 import google.generativeai as genai
 from google.api_core import exceptions as google_exceptions
 
+from .tokenizer import get_token_counter
+from .context_cache import gemini_min_cache_tokens
+from .prompt_cache import cached_response, cached_streaming_response
+
 
 class GeminiClient:
     """
     Wrapper for Google Gemini API with error handling and safety settings
     """
     
+    provider_name = "gemini"
+    
     def __init__(self, api_key: Optional[str] = None, model_name: str = "gemini-pro"):
         """
         Initialize Gemini client
@@ -28,7 +38,13 @@ class GeminiClient:
         
         genai.configure(api_key=self.api_key)
         self.model_name = model_name
+        self.prompt_cache = None  # Optional PromptCache, attached by LLMManager
+        self.context_cache = None  # Optional ContextCache, attached by LLMManager
         self.model = genai.GenerativeModel(model_name)
+        # Static instruction (context cache prefix) -> model bound to it (most recent last)
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._models_lock = threading.Lock()
+        self.max_cached_models = 16
         
         # Safety settings - prevent harmful content
         self.safety_settings = [
@@ -58,6 +74,7 @@ class GeminiClient:
             "max_output_tokens": 2048,
         }
     
+    @cached_response
     def generate_response(
         self, 
         prompt: str, 
@@ -81,101 +98,261 @@ class GeminiClient:
         """
         try:
             # Build generation config
-            gen_config = self.generation_config.copy()
-            if temperature is not None:
-                gen_config["temperature"] = temperature
-            if max_tokens is not None:
-                gen_config["max_output_tokens"] = max_tokens
-            
-            # Build full prompt with conversation history
-            full_prompt = ""
-            
-            # Add system prompt at the beginning
-            if system_prompt:
-                full_prompt = f"{system_prompt}\n\n"
-            
-            # Add conversation history for context
-            if conversation_history:
-                full_prompt += "=== CONVERSATION HISTORY ===\n"
-                for msg in conversation_history:
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                    if role == "user":
-                        full_prompt += f"User: {content}\n"
-                    elif role == "assistant":
-                        full_prompt += f"Assistant: {content}\n"
-                full_prompt += "=== END OF HISTORY ===\n\n"
+            gen_config = self._build_generation_config(temperature, max_tokens)
             
-            # Add current prompt
-            full_prompt += f"User: {prompt}\nAssistant:"
-            
-            # Generate content
-            response = self.model.generate_content(
-                full_prompt,
+            # System prompt as system instruction, history as structured turns
+            model, contents = self._prepare_request(prompt, system_prompt, conversation_history)
+            response = model.generate_content(
+                contents,
                 generation_config=gen_config,
                 safety_settings=self.safety_settings
             )
             
-            # Extract text from response
-            if response.text:
-                return {
-                    "response": response.text,
-                    "model": self.model_name,
-                    "error": False,
-                    "error_message": None,
-                    "finish_reason": response.candidates[0].finish_reason if response.candidates else None
-                }
-            else:
-                # Check if blocked by safety
-                if response.prompt_feedback:
-                    return {
-                        "response": None,
-                        "model": self.model_name,
-                        "error": True,
-                        "error_message": f"Content blocked: {response.prompt_feedback}",
-                        "finish_reason": "SAFETY"
-                    }
-                else:
-                    return {
-                        "response": None,
-                        "model": self.model_name,
-                        "error": True,
-                        "error_message": "No response generated",
-                        "finish_reason": "OTHER"
-                    }
+            return self._response_to_result(response)
         
-        except google_exceptions.ResourceExhausted as e:
-            return {
-                "response": None,
-                "model": self.model_name,
-                "error": True,
-                "error_message": f"API quota exceeded: {str(e)}",
-                "finish_reason": "QUOTA_EXCEEDED"
-            }
+        except Exception as e:
+            return self._error_result(e)
+    
+    def _response_to_result(self, response) -> Dict[str, Any]:
+        """
+        Convert a complete Gemini response into the standard result dict
         
-        except google_exceptions.InvalidArgument as e:
+        Args:
+            response: Non-streaming GenerateContentResponse
+            
+        Returns:
+            Dict with 'response', 'model', 'error', 'error_message', 'finish_reason'
+        """
+        # Extract text from response
+        if response.text:
+            usage = self._extract_usage(response)
+            if self.context_cache:
+                self.context_cache.record_usage(self.provider_name, usage)
             return {
-                "response": None,
+                "response": response.text,
                 "model": self.model_name,
-                "error": True,
-                "error_message": f"Invalid request: {str(e)}",
-                "finish_reason": "INVALID_REQUEST"
+                "error": False,
+                "error_message": None,
+                "finish_reason": response.candidates[0].finish_reason if response.candidates else None,
+                "usage": usage
             }
         
-        except Exception as e:
+        # Check if blocked by safety
+        if response.prompt_feedback:
             return {
                 "response": None,
                 "model": self.model_name,
                 "error": True,
-                "error_message": f"Unexpected error: {str(e)}",
-                "finish_reason": "ERROR"
+                "error_message": f"Content blocked: {response.prompt_feedback}",
+                "finish_reason": "SAFETY"
             }
+        
+        return {
+            "response": None,
+            "model": self.model_name,
+            "error": True,
+            "error_message": "No response generated",
+            "finish_reason": "OTHER"
+        }
+    
+    def _error_result(self, error: Exception) -> Dict[str, Any]:
+        """Build the standard error result dict for an exception"""
+        error_message, error_reason = self._describe_error(error)
+        return {
+            "response": None,
+            "model": self.model_name,
+            "error": True,
+            "error_message": error_message,
+            "finish_reason": error_reason
+        }
+    
+    def _supports_system_instruction(self) -> bool:
+        """Whether the model accepts a system_instruction (gemini-1.0 models reject it)"""
+        return not self.model_name.startswith(("gemini-pro", "gemini-1.0"))
+    
+    def _get_model(self, system_prompt: Optional[str] = None, static: bool = False):
+        """
+        Get a model bound to a system instruction
+        
+        Only static instructions (the context cache's prefixes) are kept, so
+        every request sharing that prefix reuses one configured model. Full
+        per-request prompts (materials, strategy, summary) never repeat and
+        get a fresh model.
+        
+        Args:
+            system_prompt: System instruction for the model
+            static: Whether the instruction is a static prefix worth keeping
+            
+        Returns:
+            genai.GenerativeModel
+        """
+        if not system_prompt or not self._supports_system_instruction():
+            return self.model
+        if not static:
+            return genai.GenerativeModel(self.model_name, system_instruction=system_prompt)
+        
+        with self._models_lock:
+            model = self._models.get(system_prompt)
+            if model is None:
+                model = genai.GenerativeModel(self.model_name, system_instruction=system_prompt)
+                self._models[system_prompt] = model
+                if len(self._models) > self.max_cached_models:
+                    self._models.popitem(last=False)
+            else:
+                self._models.move_to_end(system_prompt)
+            return model
+    
+    def _build_contents(
+        self,
+        prompt: Optional[str],
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Convert conversation history and current prompt into Gemini contents
+        
+        Turns become alternating 'user' / 'model' contents (consecutive messages
+        of one role are merged). For models without system instructions the
+        system prompt is sent as the first part of the first user turn.
+        
+        Args:
+            prompt: User's input prompt (None to build only the history)
+            system_prompt: System instruction for the model
+            conversation_history: List of previous messages for context
+            
+        Returns:
+            List of {"role": ..., "parts": [...]} dicts
+        """
+        contents: List[Dict[str, Any]] = []
+        messages = list(conversation_history or [])
+        if prompt is not None:
+            messages.append({"role": "user", "content": prompt})
+        
+        for msg in messages:
+            content = msg.get("content", "")
+            if not content:
+                continue
+            role = "model" if msg.get("role") == "assistant" else "user"
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"].append(content)
+            else:
+                contents.append({"role": role, "parts": [content]})
+        
+        # Gemini expects the conversation to open with a user turn
+        if contents and contents[0]["role"] == "model":
+            contents.insert(0, {"role": "user", "parts": ["(Lanjutan percakapan sebelumnya)"]})
+        
+        if system_prompt and not self._supports_system_instruction():
+            if contents and contents[0]["role"] == "user":
+                contents[0]["parts"].insert(0, system_prompt)
+            else:
+                contents.insert(0, {"role": "user", "parts": [system_prompt]})
+        
+        return contents
+    
+    def _prepare_request(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ):
+        """
+        Pick the model and contents for a request
+        
+        When the system prompt starts with a static prefix, only the rest of
+        the system prompt is sent, ahead of the current prompt. The prefix goes
+        through a live CachedContent when there is one, otherwise through a
+        reused model with the prefix as system instruction (e.g. when it is
+        below the model's minimum cacheable size).
+        
+        Args:
+            prompt: User's input prompt
+            system_prompt: System instruction for the model
+            conversation_history: List of previous messages for context
+            
+        Returns:
+            Tuple of (genai.GenerativeModel, contents)
+        """
+        if self.context_cache and system_prompt and self._supports_system_instruction():
+            prefix, rest = self.context_cache.split(system_prompt)
+            if prefix:
+                handle = self.context_cache.get_handle(
+                    self.provider_name, self.model_name, prefix, self._create_cached_content
+                )
+                model = handle["model"] if handle else self._get_model(prefix, static=True)
+                contents = self._build_contents(prompt, None, conversation_history)
+                if rest.strip():
+                    contents[-1]["parts"].insert(0, rest.strip())
+                return model, contents
+        
+        return self._get_model(system_prompt), self._build_contents(prompt, system_prompt, conversation_history)
     
+    def _create_cached_content(self, prefix: str, ttl_seconds: int) -> Optional[Dict[str, Any]]:
+        """
+        Store a static prefix as Gemini CachedContent (ContextCache callback)
+        
+        Args:
+            prefix: System instruction to cache
+            ttl_seconds: Cache lifetime
+            
+        Returns:
+            Handle dict with 'name', 'expires_at', 'tokens', 'model' (bound to
+            the cache) and 'resource', or None if the prefix is below the
+            model's minimum cacheable size
+        """
+        if get_token_counter(self.model_name).count(prefix) < gemini_min_cache_tokens(self.model_name):
+            return None
+        
+        from google.generativeai import caching
+        
+        model_path = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+        cached = caching.CachedContent.create(
+            model=model_path,
+            system_instruction=prefix,
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+        usage = getattr(cached, "usage_metadata", None)
+        expire_time = getattr(cached, "expire_time", None)
+        return {
+            "name": cached.name,
+            "expires_at": expire_time.timestamp() if expire_time else time.time() + ttl_seconds,
+            "tokens": getattr(usage, "total_token_count", None),
+            "model": genai.GenerativeModel.from_cached_content(cached_content=cached),
+            "resource": cached
+        }
+    
+    def start_chat(
+        self,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ):
+        """
+        Open a Gemini chat session for incremental multi-turn use
+        
+        The session keeps the history on the client side and sends it as
+        structured contents with every send_message(); the system prompt is
+        bound once as the model's system instruction.
+        
+        Args:
+            system_prompt: System instruction for the model
+            conversation_history: Previous messages to seed the session with
+            
+        Returns:
+            genai.ChatSession
+        """
+        return self._get_model(system_prompt).start_chat(
+            history=self._build_contents(None, system_prompt, conversation_history)
+        )
+    
+    @cached_streaming_response
     def generate_streaming_response(
         self, 
         prompt: str, 
         system_prompt: Optional[str] = None,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        include_metadata: bool = False
     ):
         """
         Generate streaming response from Gemini (for real-time display)
@@ -184,24 +361,25 @@ class GeminiClient:
             prompt: User's input prompt
             system_prompt: System instruction for the model
             temperature: Override default temperature
+            max_tokens: Override default max tokens
+            conversation_history: List of previous messages for context
+            include_metadata: If True, yield a final dict with 'model', 'error',
+                'error_message', 'finish_reason', 'usage' and 'safety' after the
+                text chunks (errors are then reported there instead of as text)
             
         Yields:
             Chunks of text as they are generated
         """
+        state = self._new_stream_state()
+        
         try:
             # Build generation config
-            gen_config = self.generation_config.copy()
-            if temperature is not None:
-                gen_config["temperature"] = temperature
-            
-            # Combine system prompt with user prompt if provided
-            full_prompt = prompt
-            if system_prompt:
-                full_prompt = f"{system_prompt}\n\n{prompt}"
+            gen_config = self._build_generation_config(temperature, max_tokens)
             
-            # Generate content with streaming
-            response = self.model.generate_content(
-                full_prompt,
+            # Same request layout as generate_response so streaming keeps the context
+            model, contents = self._prepare_request(prompt, system_prompt, conversation_history)
+            response = model.generate_content(
+                contents,
                 generation_config=gen_config,
                 safety_settings=self.safety_settings,
                 stream=True
@@ -209,15 +387,173 @@ class GeminiClient:
             
             # Yield chunks as they arrive
             for chunk in response:
-                if chunk.text:
-                    yield chunk.text
+                text = self._consume_stream_chunk(state, chunk)
+                if text:
+                    yield text
         
         except Exception as e:
-            yield f"\n\n[Error: {str(e)}]"
+            if not include_metadata:
+                yield f"\n\n[Error: {str(e)}]"
+                return
+            yield self._stream_error_event(state, e)
+            return
+        
+        final_event = self._stream_final_event(state)
+        if include_metadata:
+            yield final_event
+        elif final_event["error"]:
+            yield f"\n\n[Error: {final_event['error_message']}]"
+    
+    def _new_stream_state(self) -> Dict[str, Any]:
+        """Create the bookkeeping dict filled while consuming a stream"""
+        return {
+            "finish_reason": None,
+            "usage": None,
+            "safety": {"blocked": False, "block_reason": None, "ratings": []},
+            "has_text": False
+        }
+    
+    def _consume_stream_chunk(self, state: Dict[str, Any], chunk) -> Optional[str]:
+        """
+        Record metadata from one stream chunk
+        
+        Args:
+            state: Dict from _new_stream_state
+            chunk: Streamed GenerateContentResponse chunk
+            
+        Returns:
+            Text of the chunk, or None if it carried no text
+        """
+        # Usage metadata is cumulative, the last chunk carries the totals
+        state["usage"] = self._extract_usage(chunk) or state["usage"]
+        
+        safety = state["safety"]
+        block_reason = self._get_block_reason(chunk)
+        if block_reason:
+            safety["blocked"] = True
+            safety["block_reason"] = block_reason
+        
+        if chunk.candidates:
+            candidate = chunk.candidates[0]
+            state["finish_reason"] = self._enum_name(candidate.finish_reason)
+            if candidate.safety_ratings:
+                safety["ratings"] = [
+                    {
+                        "category": self._enum_name(rating.category),
+                        "probability": self._enum_name(rating.probability)
+                    }
+                    for rating in candidate.safety_ratings
+                ]
+        
+        if chunk.parts and chunk.text:
+            state["has_text"] = True
+            return chunk.text
+        return None
+    
+    def _stream_final_event(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the final metadata event once a stream has been fully consumed"""
+        safety = state["safety"]
+        if state["finish_reason"] == "SAFETY":
+            safety["blocked"] = True
+            safety["block_reason"] = safety["block_reason"] or "SAFETY"
+        
+        if self.context_cache:
+            self.context_cache.record_usage(self.provider_name, state["usage"])
+        
+        if not state["has_text"]:
+            return {
+                "model": self.model_name,
+                "error": True,
+                "error_message": f"Content blocked: {safety['block_reason']}" if safety["blocked"] else "No response generated",
+                "finish_reason": "SAFETY" if safety["blocked"] else "OTHER",
+                "usage": state["usage"],
+                "safety": safety
+            }
+        
+        return {
+            "model": self.model_name,
+            "error": False,
+            "error_message": None,
+            "finish_reason": state["finish_reason"],
+            "usage": state["usage"],
+            "safety": safety
+        }
+    
+    def _stream_error_event(self, state: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        """Build the final metadata event for a stream that raised"""
+        error_message, error_reason = self._describe_error(error)
+        return {
+            "model": self.model_name,
+            "error": True,
+            "error_message": error_message,
+            "finish_reason": error_reason,
+            "usage": state["usage"],
+            "safety": state["safety"]
+        }
+    
+    def _build_generation_config(
+        self,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Copy the default generation config with per-request overrides"""
+        gen_config = self.generation_config.copy()
+        if temperature is not None:
+            gen_config["temperature"] = temperature
+        if max_tokens is not None:
+            gen_config["max_output_tokens"] = max_tokens
+        return gen_config
+    
+    def _extract_usage(self, response) -> Optional[Dict[str, int]]:
+        """
+        Read token usage from a Gemini response or stream chunk
+        
+        Returns:
+            Dict with prompt/completion/total/cached tokens (OpenAI naming), or None
+        """
+        usage_metadata = getattr(response, "usage_metadata", None)
+        if not usage_metadata or not usage_metadata.total_token_count:
+            return None
+        return {
+            "prompt_tokens": usage_metadata.prompt_token_count,
+            "completion_tokens": usage_metadata.candidates_token_count,
+            "total_tokens": usage_metadata.total_token_count,
+            "cached_tokens": getattr(usage_metadata, "cached_content_token_count", 0) or 0
+        }
+    
+    def _get_block_reason(self, response) -> Optional[str]:
+        """Return the prompt block reason name if Gemini refused the prompt"""
+        prompt_feedback = getattr(response, "prompt_feedback", None)
+        if prompt_feedback and prompt_feedback.block_reason:
+            return self._enum_name(prompt_feedback.block_reason)
+        return None
+    
+    @staticmethod
+    def _enum_name(value) -> Optional[str]:
+        """Convert SDK enum values to plain strings for logging"""
+        if value is None:
+            return None
+        return getattr(value, "name", str(value))
+    
+    def _describe_error(self, error: Exception):
+        """
+        Map an exception to the (error_message, finish_reason) pair used in result dicts
+        
+        Args:
+            error: Exception raised by the Gemini SDK
+            
+        Returns:
+            Tuple of error message and finish reason
+        """
+        if isinstance(error, google_exceptions.ResourceExhausted):
+            return f"API quota exceeded: {str(error)}", "QUOTA_EXCEEDED"
+        if isinstance(error, google_exceptions.InvalidArgument):
+            return f"Invalid request: {str(error)}", "INVALID_REQUEST"
+        return f"Unexpected error: {str(error)}", "ERROR"
     
     def count_tokens(self, text: str) -> int:
         """
-        Count tokens in text (approximate)
+        Count tokens in text (offline, calibrated estimate)
         
         Args:
             text: Text to count tokens for
@@ -225,12 +561,7 @@ class GeminiClient:
         Returns:
             Approximate token count
         """
-        try:
-            result = self.model.count_tokens(text)
-            return result.total_tokens
-        except Exception:
-            # Fallback: rough estimate (1 token ≈ 4 chars)
-            return len(text) // 4
+        return get_token_counter(self.model_name).count(text)
     
     def test_connection(self) -> bool:
         """
@@ -3,12 +3,23 @@ LLM Manager - Unified interface for managing multiple LLM providers
 Provides abstraction layer for easy model switching
 """
 import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import Optional, Dict, Any, List
 from enum import Enum
 from dotenv import load_dotenv
 
 from .gemini_client import GeminiClient
 from .openai_client import OpenAIClient
+from .prompt_cache import PromptCache, get_prompt_cache
+from .prompt_builder import PromptBuilder, get_context_window
+from .context_cache import ContextCache, get_context_cache
+from ..latency_histogram import LatencyHistogram
+
+# Sentinel put on the queue when a hedged stream worker finishes
+_STREAM_DONE = object()
 
 
 class ModelProvider(Enum):
@@ -17,6 +28,30 @@ class ModelProvider(Enum):
     OPENAI = "openai"
 
 
+def providers_from_env():
+    """
+    Resolve primary and fallback providers from environment variables
+    
+    Returns:
+        Tuple of (primary ModelProvider, fallback ModelProvider or None)
+    """
+    active_model = os.getenv("ACTIVE_MODEL", "gemini").lower()
+    
+    # Determine primary and fallback providers
+    # Check for Gemini key (try both GEMINI_API_KEY and GOOGLE_API_KEY)
+    has_gemini_key = bool(os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
+    has_openai_key = bool(os.getenv("OPENAI_API_KEY"))
+    
+    if active_model == "openai":
+        primary = ModelProvider.OPENAI
+        fallback = ModelProvider.GEMINI if has_gemini_key else None
+    else:  # default to gemini
+        primary = ModelProvider.GEMINI
+        fallback = ModelProvider.OPENAI if has_openai_key else None
+    
+    return primary, fallback
+
+
 class LLMManager:
     """
     Unified interface for managing multiple LLM providers
@@ -30,7 +65,15 @@ class LLMManager:
         gemini_api_key: Optional[str] = None,
         openai_api_key: Optional[str] = None,
         gemini_model: str = "gemini-pro",
-        openai_model: str = "gpt-3.5-turbo"
+        openai_model: str = "gpt-3.5-turbo",
+        hedging: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_default_delay: float = 10.0,
+        hedge_default_first_token_delay: float = 3.0,
+        hedge_min_delay: float = 0.5,
+        hedge_min_samples: int = 20,
+        prompt_cache: Optional[PromptCache] = None,
+        context_cache: Optional[ContextCache] = None
     ):
         """
         Initialize LLM Manager
@@ -42,12 +85,40 @@ class LLMManager:
             openai_api_key: OpenAI API key (reads from env if None)
             gemini_model: Gemini model name
             openai_model: OpenAI model name
+            hedging: Fire the fallback in parallel when the primary is slower than
+                its latency budget, instead of waiting for it to fail
+            hedge_percentile: Percentile of the primary's observed latency used as budget
+            hedge_default_delay: Budget (seconds) for complete responses until enough samples exist
+            hedge_default_first_token_delay: Budget (seconds) for the first streamed chunk
+                until enough samples exist
+            hedge_min_delay: Lower bound for the budget, so hedging never doubles every call
+            hedge_min_samples: Samples needed before the histogram drives the budget
+            prompt_cache: Persistent exact-match cache attached to every client
+                (None = no caching)
+            context_cache: Tracks static system prompt prefixes and the provider-side
+                caches holding them, attached to every client (None = disabled)
         """
         load_dotenv()
         
         self.primary_provider = primary_provider
         self.fallback_provider = fallback_provider
         
+        # Hedging configuration
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_default_first_token_delay = hedge_default_first_token_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        
+        # Per-provider latency histograms ('complete' = full reply, 'first_token' = streaming)
+        self.latency = {
+            p: {"complete": LatencyHistogram(), "first_token": LatencyHistogram()}
+            for p in ModelProvider
+        }
+        
         # Initialize clients
         self.clients = {}
         
@@ -71,6 +142,12 @@ class LLMManager:
         
         if not self.clients:
             raise ValueError("No LLM providers could be initialized. Check API keys.")
+        
+        self.prompt_cache = prompt_cache
+        self.context_cache = context_cache
+        for client in self.clients.values():
+            client.prompt_cache = prompt_cache
+            client.context_cache = context_cache
     
     def generate_response(
         self,
@@ -98,27 +175,20 @@ class LLMManager:
         # Determine which provider to use
         target_provider = provider or self.primary_provider
         
+        request_kwargs = {
+            "prompt": prompt,
+            "system_prompt": system_prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "conversation_history": conversation_history
+        }
+        
+        if self._can_hedge(target_provider):
+            return self._generate_hedged(target_provider, request_kwargs)
+        
         # Try primary provider
         if target_provider in self.clients:
-            client = self.clients[target_provider]
-            
-            # Call appropriate client
-            if target_provider == ModelProvider.OPENAI:
-                result = client.generate_response(
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    conversation_history=conversation_history
-                )
-            else:  # Gemini
-                result = client.generate_response(
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    conversation_history=conversation_history  # Now Gemini also gets history!
-                )
+            result = self._call_provider(target_provider, request_kwargs)
             
             # If successful, return
             if not result["error"]:
@@ -135,24 +205,7 @@ class LLMManager:
         
         # Try fallback provider
         if self.fallback_provider and self.fallback_provider in self.clients:
-            fallback_client = self.clients[self.fallback_provider]
-            
-            if self.fallback_provider == ModelProvider.OPENAI:
-                result = fallback_client.generate_response(
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    conversation_history=conversation_history
-                )
-            else:  # Gemini
-                result = fallback_client.generate_response(
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    conversation_history=conversation_history  # Fallback also gets history!
-                )
+            result = self._call_provider(self.fallback_provider, request_kwargs)
             
             result["provider"] = self.fallback_provider.value
             result["used_fallback"] = True
@@ -173,48 +226,391 @@ class LLMManager:
         prompt: str,
         system_prompt: Optional[str] = None,
         temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
         provider: Optional[ModelProvider] = None,
-        conversation_history: Optional[List[Dict[str, str]]] = None
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        include_metadata: bool = False
     ):
         """
-        Generate streaming response
+        Generate streaming response with fallback
+        
+        The fallback provider is only tried when the primary fails before
+        producing any text; once chunks have been shown they cannot be replaced.
         
         Args:
             prompt: User's input prompt
             system_prompt: System instruction for the model
             temperature: Temperature for generation
+            max_tokens: Maximum tokens to generate
             provider: Override primary provider
-            conversation_history: Previous conversation (for OpenAI)
+            conversation_history: Previous conversation messages
+            include_metadata: If True, yield a final dict shaped like the result of
+                generate_response plus 'time_to_first_token' and 'total_time'
             
         Yields:
             Chunks of text as they are generated
         """
         target_provider = provider or self.primary_provider
         
-        if target_provider not in self.clients:
-            yield "[Error: Provider not available]"
+        if self._can_hedge(target_provider):
+            yield from self._stream_hedged(
+                target_provider,
+                {
+                    "prompt": prompt,
+                    "system_prompt": system_prompt,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                    "conversation_history": conversation_history,
+                    "include_metadata": True
+                },
+                include_metadata
+            )
             return
         
-        client = self.clients[target_provider]
+        candidates = [target_provider]
+        if self.fallback_provider and self.fallback_provider != target_provider:
+            candidates.append(self.fallback_provider)
+        candidates = [p for p in candidates if p in self.clients]
         
-        try:
-            if target_provider == ModelProvider.OPENAI:
-                for chunk in client.generate_streaming_response(
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    temperature=temperature,
-                    conversation_history=conversation_history
-                ):
-                    yield chunk
-            else:  # Gemini
-                for chunk in client.generate_streaming_response(
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    temperature=temperature
-                ):
+        stream_kwargs = {
+            "prompt": prompt,
+            "system_prompt": system_prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "conversation_history": conversation_history,
+            "include_metadata": True
+        }
+        
+        start_time = time.time()
+        result = None
+        
+        for index, current_provider in enumerate(candidates):
+            client = self.clients[current_provider]
+            chunks = []
+            first_token_time = None
+            provider_first_token = None
+            metadata = None
+            # Histograms get this provider's own latency, not the failed attempt before it
+            provider_start = time.time()
+            
+            try:
+                for chunk in client.generate_streaming_response(**stream_kwargs):
+                    if isinstance(chunk, dict):
+                        metadata = chunk
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        provider_first_token = time.time() - provider_start
+                    chunks.append(chunk)
                     yield chunk
+            except Exception as e:
+                metadata = {
+                    "model": getattr(client, "model_name", "unknown"),
+                    "error": True,
+                    "error_message": f"Unexpected error: {str(e)}",
+                    "finish_reason": "ERROR"
+                }
+            
+            result = dict(metadata or {
+                "model": getattr(client, "model_name", "unknown"),
+                "error": False,
+                "error_message": None,
+                "finish_reason": None
+            })
+            result["response"] = "".join(chunks) if chunks else None
+            result["provider"] = current_provider.value
+            result["used_fallback"] = index > 0
+            result["time_to_first_token"] = first_token_time
+            result["total_time"] = time.time() - start_time
+            
+            if not result["error"]:
+                self._record_latency(current_provider, "first_token", provider_first_token)
+                self._record_latency(current_provider, "complete", time.time() - provider_start)
+            
+            # Only fall back if nothing reached the user yet
+            if not result["error"] or chunks:
+                break
+            
+            if index + 1 < len(candidates):
+                print(f"Provider ({current_provider.value}) failed before streaming, trying fallback...")
+        
+        if result is None:
+            result = {
+                "response": None,
+                "model": "none",
+                "provider": "none",
+                "error": True,
+                "error_message": "All providers failed or unavailable",
+                "finish_reason": "ALL_FAILED",
+                "used_fallback": False,
+                "time_to_first_token": None,
+                "total_time": time.time() - start_time
+            }
+        
+        if include_metadata:
+            yield result
+        elif result["error"] and not result["response"]:
+            yield f"[Error: {result['error_message']}]"
+    
+    def _call_provider(self, provider: ModelProvider, request_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Call one provider's blocking generate_response and record its latency"""
+        start_time = time.time()
+        result = self.clients[provider].generate_response(**request_kwargs)
+        if not result["error"]:
+            self._record_latency(provider, "complete", time.time() - start_time)
+        return result
+    
+    def _record_latency(self, provider: ModelProvider, kind: str, seconds: Optional[float]):
+        """Add a successful call's latency to the provider histogram"""
+        if seconds is not None:
+            self.latency[provider][kind].record(seconds)
+    
+    def _can_hedge(self, target_provider: ModelProvider) -> bool:
+        """Hedging needs both the target and a different fallback provider"""
+        return (
+            self.hedging
+            and target_provider in self.clients
+            and self.fallback_provider is not None
+            and self.fallback_provider != target_provider
+            and self.fallback_provider in self.clients
+        )
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily create the worker pool used for hedged requests"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+            return self._executor
+    
+    def get_hedge_delay(self, provider: ModelProvider, kind: str = "complete") -> float:
+        """
+        Latency budget before the fallback is fired for a provider
+        
+        Args:
+            provider: Provider whose histogram drives the budget
+            kind: 'complete' for full replies, 'first_token' for streaming
+            
+        Returns:
+            Seconds to wait for the primary before hedging
+        """
+        histogram = self.latency[provider][kind]
+        if histogram.count < self.hedge_min_samples:
+            if kind == "first_token":
+                return self.hedge_default_first_token_delay
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, histogram.percentile(self.hedge_percentile))
+    
+    def get_latency_stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Get latency percentiles per provider
+        
+        Returns:
+            Dict mapping provider name -> {'complete': summary, 'first_token': summary}
+        """
+        return {
+            provider.value: {kind: histogram.summary() for kind, histogram in kinds.items()}
+            for provider, kinds in self.latency.items()
+            if provider in self.clients
+        }
+    
+    def _generate_hedged(self, primary: ModelProvider, request_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Race primary and fallback for a complete response
+        
+        The primary runs alone for its latency budget; if it has not answered by
+        then the fallback is started too and the first successful answer wins.
+        SDK calls cannot be interrupted, so the losing call is abandoned and its
+        result discarded.
+        """
+        executor = self._get_executor()
+        budget = self.get_hedge_delay(primary, "complete")
+        
+        futures = {executor.submit(self._call_provider, primary, request_kwargs): primary}
+        done, _ = wait(futures, timeout=budget)
+        hedged = not done
+        
+        if hedged:
+            print(f"Primary provider ({primary.value}) slower than {budget:.2f}s, hedging with fallback...")
+            futures[executor.submit(self._call_provider, self.fallback_provider, request_kwargs)] = self.fallback_provider
+        
+        pending = set(futures)
+        last_result = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                current_provider = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {
+                        "response": None,
+                        "model": "unknown",
+                        "error": True,
+                        "error_message": f"Unexpected error: {str(e)}",
+                        "finish_reason": "ERROR"
+                    }
+                result["provider"] = current_provider.value
+                result["hedged"] = hedged
+                if current_provider != primary:
+                    result["used_fallback"] = True
+                
+                if not result["error"]:
+                    for other in pending:
+                        other.cancel()
+                    return result
+                last_result = result
+            
+            # Primary failed before its budget ran out: fall back right away
+            if not pending and self.fallback_provider not in futures.values():
+                print(f"Primary provider ({primary.value}) failed, trying fallback...")
+                future = executor.submit(self._call_provider, self.fallback_provider, request_kwargs)
+                futures[future] = self.fallback_provider
+                pending = {future}
+        
+        return last_result
+    
+    def _pump_stream(
+        self,
+        provider: ModelProvider,
+        stream_kwargs: Dict[str, Any],
+        out_queue: "queue.Queue",
+        cancel_event: threading.Event
+    ):
+        """Worker: copy one provider's stream onto a shared queue until done or cancelled"""
+        stream = self.clients[provider].generate_streaming_response(**stream_kwargs)
+        try:
+            for chunk in stream:
+                if cancel_event.is_set():
+                    break
+                out_queue.put((provider, chunk))
         except Exception as e:
-            yield f"\n\n[Error: {str(e)}]"
+            out_queue.put((provider, {
+                "model": getattr(self.clients[provider], "model_name", "unknown"),
+                "error": True,
+                "error_message": f"Unexpected error: {str(e)}",
+                "finish_reason": "ERROR"
+            }))
+        finally:
+            # Closing the generator releases the provider's HTTP stream
+            stream.close()
+            out_queue.put((provider, _STREAM_DONE))
+    
+    def _stream_hedged(self, primary: ModelProvider, stream_kwargs: Dict[str, Any], include_metadata: bool):
+        """
+        Race primary and fallback streams on time to first token
+        
+        The primary streams alone for its first-token budget; if no text has
+        arrived by then the fallback is started too. The first provider to emit
+        text wins and the other stream is cancelled.
+        """
+        executor = self._get_executor()
+        budget = self.get_hedge_delay(primary, "first_token")
+        out_queue = queue.Queue()
+        cancel_events = {}
+        # Start of each provider's stream: histograms get its own latency, not the hedge wait
+        provider_starts = {}
+        finished = set()
+        failures = {}
+        
+        def start(current_provider):
+            provider_starts[current_provider] = time.time()
+            cancel_events[current_provider] = threading.Event()
+            executor.submit(self._pump_stream, current_provider, stream_kwargs, out_queue, cancel_events[current_provider])
+        
+        start_time = time.time()
+        start(primary)
+        hedged = False
+        winner = None
+        chunks = []
+        first_token_time = None
+        provider_first_token = None
+        metadata = None
+        
+        try:
+            while True:
+                if not hedged and winner is None:
+                    wait_time = max(0.0, start_time + budget - time.time())
+                else:
+                    wait_time = None
+                
+                try:
+                    current_provider, item = out_queue.get(timeout=wait_time)
+                except queue.Empty:
+                    hedged = True
+                    if self.fallback_provider in cancel_events:
+                        continue
+                    # Primary missed its first-token budget: hedge
+                    print(f"Primary provider ({primary.value}) no first token after {budget:.2f}s, hedging with fallback...")
+                    start(self.fallback_provider)
+                    continue
+                
+                if item is _STREAM_DONE:
+                    finished.add(current_provider)
+                    if winner is not None:
+                        if current_provider == winner:
+                            break
+                        continue
+                    
+                    # Neither has produced text yet: start the fallback if the primary gave up early
+                    if self.fallback_provider not in cancel_events:
+                        print(f"Primary provider ({primary.value}) failed before streaming, trying fallback...")
+                        hedged = True
+                        start(self.fallback_provider)
+                    elif finished >= set(cancel_events):
+                        break
+                    continue
+                
+                if winner is not None and current_provider != winner:
+                    continue
+                
+                if isinstance(item, dict):
+                    if winner is None:
+                        failures[current_provider] = item
+                    else:
+                        metadata = item
+                    continue
+                
+                if winner is None:
+                    winner = current_provider
+                    first_token_time = time.time() - start_time
+                    provider_first_token = time.time() - provider_starts[winner]
+                    for other, event in cancel_events.items():
+                        if other != winner:
+                            event.set()
+                chunks.append(item)
+                yield item
+            
+        finally:
+            # Also reached when the caller stops reading early: stop both workers
+            for event in cancel_events.values():
+                event.set()
+        
+        if winner is None:
+            # Both failed; report the fallback's error if it ran, else the primary's
+            winner = self.fallback_provider if self.fallback_provider in failures else primary
+            metadata = failures.get(winner)
+        
+        result = dict(metadata or {
+            "model": getattr(self.clients[winner], "model_name", "unknown"),
+            "error": not chunks,
+            "error_message": None if chunks else "No response generated",
+            "finish_reason": None
+        })
+        result["response"] = "".join(chunks) if chunks else None
+        result["provider"] = winner.value
+        result["used_fallback"] = winner != primary
+        result["hedged"] = hedged
+        result["time_to_first_token"] = first_token_time
+        result["total_time"] = time.time() - start_time
+        
+        if not result["error"]:
+            self._record_latency(winner, "first_token", provider_first_token)
+            self._record_latency(winner, "complete", time.time() - provider_starts[winner])
+        
+        if include_metadata:
+            yield result
+        elif result["error"] and not result["response"]:
+            yield f"[Error: {result['error_message']}]"
     
     def get_available_providers(self) -> List[str]:
         """
@@ -225,6 +621,38 @@ class LLMManager:
         """
         return [provider.value for provider in self.clients.keys()]
     
+    def create_prompt_builder(self, max_prompt_tokens: Optional[int] = None) -> PromptBuilder:
+        """
+        Create a prompt builder sized for the configured models
+        
+        The budget uses the smallest context window among the primary and
+        fallback models, so a request that falls back still fits.
+        
+        Args:
+            max_prompt_tokens: Upper bound on input tokens (default: PROMPT_TOKEN_BUDGET env var)
+            
+        Returns:
+            Empty PromptBuilder for the primary model
+        """
+        primary = self.clients.get(self.primary_provider) or next(iter(self.clients.values()))
+        windows = [get_context_window(getattr(client, "model_name", "")) for client in self.clients.values()]
+        return PromptBuilder(
+            getattr(primary, "model_name", "unknown"),
+            context_window=min(windows),
+            max_prompt_tokens=max_prompt_tokens
+        )
+    
+    def register_static_prefix(self, prefix: str):
+        """
+        Declare the static start of upcoming system prompts (e.g. the base system
+        prompt) so it is cached provider-side from the first request on
+        
+        Args:
+            prefix: Text the system prompts start with
+        """
+        if self.context_cache:
+            self.context_cache.register_prefix(prefix)
+    
     def test_provider(self, provider: ModelProvider) -> bool:
         """
         Test if a provider is working
@@ -263,29 +691,29 @@ class LLMManager:
             - OPENAI_API_KEY: OpenAI API key
             - GEMINI_MODEL: Gemini model name (default: gemini-pro)
             - OPENAI_MODEL: OpenAI model name (default: gpt-3.5-turbo)
+            - LLM_HEDGING: 'true' to race the fallback when the primary is slow
+            - LLM_HEDGE_PERCENTILE: Latency percentile used as hedge budget (default: 95)
+            - LLM_HEDGE_DEFAULT_DELAY: Budget for full replies before enough samples (default: 10)
+            - LLM_HEDGE_DEFAULT_FIRST_TOKEN_DELAY: Budget for first streamed chunk (default: 3)
+            - PROMPT_CACHE_ENABLED: 'true' to serve identical requests from the on-disk prompt cache
+            - CONTEXT_CACHE_ENABLED: 'true' to cache static system prompt prefixes provider-side
             
         Returns:
             Configured LLMManager instance
         """
         load_dotenv()
         
-        active_model = os.getenv("ACTIVE_MODEL", "gemini").lower()
-        
-        # Determine primary and fallback providers
-        # Check for Gemini key (try both GEMINI_API_KEY and GOOGLE_API_KEY)
-        has_gemini_key = bool(os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
-        has_openai_key = bool(os.getenv("OPENAI_API_KEY"))
-        
-        if active_model == "openai":
-            primary = ModelProvider.OPENAI
-            fallback = ModelProvider.GEMINI if has_gemini_key else None
-        else:  # default to gemini
-            primary = ModelProvider.GEMINI
-            fallback = ModelProvider.OPENAI if has_openai_key else None
+        primary, fallback = providers_from_env()
         
         return LLMManager(
             primary_provider=primary,
             fallback_provider=fallback,
             gemini_model=os.getenv("GEMINI_MODEL", "gemini-pro"),
-            openai_model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+            openai_model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            hedging=os.getenv("LLM_HEDGING", "false").lower() == "true",
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+            hedge_default_delay=float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "10")),
+            hedge_default_first_token_delay=float(os.getenv("LLM_HEDGE_DEFAULT_FIRST_TOKEN_DELAY", "3")),
+            prompt_cache=get_prompt_cache() if os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true" else None,
+            context_cache=get_context_cache() if os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true" else None
         )
@@ -6,12 +6,17 @@ import os
 from typing import Optional, Dict, Any, List
 from openai import OpenAI, OpenAIError, RateLimitError, APIError, APIConnectionError
 
+from .tokenizer import get_token_counter
+from .prompt_cache import cached_response, cached_streaming_response
+
 
 class OpenAIClient:
     """
     Wrapper for OpenAI API with error handling and configuration
     """
     
+    provider_name = "openai"
+    
     def __init__(self, api_key: Optional[str] = None, model_name: str = "gpt-3.5-turbo"):
         """
         Initialize OpenAI client
@@ -26,12 +31,15 @@ class OpenAIClient:
         
         self.client = OpenAI(api_key=self.api_key)
         self.model_name = model_name
+        self.prompt_cache = None  # Optional PromptCache, attached by LLMManager
+        self.context_cache = None  # Optional ContextCache, attached by LLMManager
         
         # Default parameters
         self.default_temperature = 0.7
         self.default_max_tokens = 2048
         self.default_top_p = 0.95
     
+    @cached_response
     def generate_response(
         self, 
         prompt: str, 
@@ -54,19 +62,7 @@ class OpenAIClient:
             Dict with 'response' (str), 'model' (str), 'error' (bool), 'error_message' (str)
         """
         try:
-            # Build messages array
-            messages = []
-            
-            # Add system prompt if provided
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            
-            # Add conversation history if provided
-            if conversation_history:
-                messages.extend(conversation_history)
-            
-            # Add current user prompt
-            messages.append({"role": "user", "content": prompt})
+            messages = self._build_messages(prompt, system_prompt, conversation_history)
             
             # Set parameters
             temp = temperature if temperature is not None else self.default_temperature
@@ -81,83 +77,117 @@ class OpenAIClient:
                 top_p=self.default_top_p
             )
             
-            # Extract response
-            if response.choices and len(response.choices) > 0:
-                content = response.choices[0].message.content
-                finish_reason = response.choices[0].finish_reason
-                
-                return {
-                    "response": content,
-                    "model": self.model_name,
-                    "error": False,
-                    "error_message": None,
-                    "finish_reason": finish_reason,
-                    "usage": {
-                        "prompt_tokens": response.usage.prompt_tokens,
-                        "completion_tokens": response.usage.completion_tokens,
-                        "total_tokens": response.usage.total_tokens
-                    }
-                }
-            else:
-                return {
-                    "response": None,
-                    "model": self.model_name,
-                    "error": True,
-                    "error_message": "No response generated",
-                    "finish_reason": "NO_RESPONSE"
-                }
-        
-        except RateLimitError as e:
-            return {
-                "response": None,
-                "model": self.model_name,
-                "error": True,
-                "error_message": f"Rate limit exceeded: {str(e)}",
-                "finish_reason": "RATE_LIMIT"
-            }
+            return self._completion_to_result(response)
         
-        except APIConnectionError as e:
+        except Exception as e:
+            error_message, error_reason = self._describe_error(e)
             return {
                 "response": None,
                 "model": self.model_name,
                 "error": True,
-                "error_message": f"Connection error: {str(e)}",
-                "finish_reason": "CONNECTION_ERROR"
+                "error_message": error_message,
+                "finish_reason": error_reason
             }
+    
+    def _build_messages(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Build the chat messages array
         
-        except APIError as e:
-            return {
-                "response": None,
-                "model": self.model_name,
-                "error": True,
-                "error_message": f"API error: {str(e)}",
-                "finish_reason": "API_ERROR"
-            }
+        When the system prompt starts with a known static prefix, the prefix
+        is sent alone as the first message and the per-request rest after the
+        history, so consecutive requests share a byte-identical prefix
+        (static prefix + earlier turns) for OpenAI's automatic prompt caching.
         
-        except OpenAIError as e:
-            return {
-                "response": None,
-                "model": self.model_name,
-                "error": True,
-                "error_message": f"OpenAI error: {str(e)}",
-                "finish_reason": "OPENAI_ERROR"
-            }
+        Args:
+            prompt: User's input prompt
+            system_prompt: System instruction for the model
+            conversation_history: List of previous messages
+            
+        Returns:
+            Messages in OpenAI chat format
+        """
+        messages = []
+        prefix, rest = "", system_prompt
+        if self.context_cache and system_prompt:
+            prefix, rest = self.context_cache.split(system_prompt)
         
-        except Exception as e:
+        # Add system prompt if provided
+        if prefix:
+            messages.append({"role": "system", "content": prefix})
+        elif system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        
+        # Add conversation history if provided
+        if conversation_history:
+            messages.extend(conversation_history)
+        
+        # Per-request instructions (materials, strategy) after the cacheable part
+        if prefix and rest.strip():
+            messages.append({"role": "system", "content": rest.strip()})
+        
+        # Add current user prompt
+        messages.append({"role": "user", "content": prompt})
+        
+        return messages
+    
+    def _completion_to_result(self, response) -> Dict[str, Any]:
+        """
+        Convert a chat completion into the standard result dict
+        
+        Args:
+            response: Non-streaming ChatCompletion
+            
+        Returns:
+            Dict with 'response', 'model', 'error', 'error_message', 'finish_reason', 'usage'
+        """
+        if response.choices and len(response.choices) > 0:
+            usage = self._extract_usage(response)
+            if self.context_cache:
+                self.context_cache.record_usage(self.provider_name, usage)
             return {
-                "response": None,
+                "response": response.choices[0].message.content,
                 "model": self.model_name,
-                "error": True,
-                "error_message": f"Unexpected error: {str(e)}",
-                "finish_reason": "ERROR"
+                "error": False,
+                "error_message": None,
+                "finish_reason": response.choices[0].finish_reason,
+                "usage": usage
             }
+        
+        return {
+            "response": None,
+            "model": self.model_name,
+            "error": True,
+            "error_message": "No response generated",
+            "finish_reason": "NO_RESPONSE"
+        }
+    
+    def _extract_usage(self, response) -> Optional[Dict[str, int]]:
+        """Read token usage from a completion or final stream chunk"""
+        usage = getattr(response, "usage", None)
+        if not usage:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0
+        }
     
+    @cached_streaming_response
     def generate_streaming_response(
         self, 
         prompt: str, 
         system_prompt: Optional[str] = None,
         temperature: Optional[float] = None,
-        conversation_history: Optional[List[Dict[str, str]]] = None
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        include_metadata: bool = False
     ):
         """
         Generate streaming response from OpenAI (for real-time display)
@@ -166,59 +196,155 @@ class OpenAIClient:
             prompt: User's input prompt
             system_prompt: System instruction for the model
             temperature: Override default temperature
+            max_tokens: Override default max tokens
             conversation_history: List of previous messages
+            include_metadata: If True, yield a final dict with 'model', 'error',
+                'error_message', 'finish_reason' and 'usage' after the text chunks
+                (errors are then reported there instead of as text)
             
         Yields:
             Chunks of text as they are generated
         """
+        state = self._new_stream_state()
+        
         try:
-            # Build messages array
-            messages = []
-            
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            
-            if conversation_history:
-                messages.extend(conversation_history)
-            
-            messages.append({"role": "user", "content": prompt})
-            
-            # Set parameters
-            temp = temperature if temperature is not None else self.default_temperature
-            
             # Call OpenAI API with streaming
             stream = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=temp,
-                max_tokens=self.default_max_tokens,
-                stream=True
+                **self._build_stream_request(
+                    prompt, system_prompt, temperature, max_tokens,
+                    conversation_history, include_metadata
+                )
             )
             
             # Yield chunks as they arrive
             for chunk in stream:
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        yield delta.content
+                text = self._consume_stream_chunk(state, chunk)
+                if text:
+                    yield text
         
         except Exception as e:
-            yield f"\n\n[Error: {str(e)}]"
+            if not include_metadata:
+                yield f"\n\n[Error: {str(e)}]"
+                return
+            yield self._stream_error_event(state, e)
+            return
+        
+        final_event = self._stream_final_event(state)
+        if include_metadata:
+            yield final_event
+        elif final_event["error"]:
+            yield f"\n\n[Error: {final_event['error_message']}]"
+    
+    def _build_stream_request(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        conversation_history: Optional[List[Dict[str, str]]],
+        include_metadata: bool
+    ) -> Dict[str, Any]:
+        """Build keyword arguments for a streaming chat completion request"""
+        request = {
+            "model": self.model_name,
+            "messages": self._build_messages(prompt, system_prompt, conversation_history),
+            "temperature": temperature if temperature is not None else self.default_temperature,
+            "max_tokens": max_tokens if max_tokens is not None else self.default_max_tokens,
+            "top_p": self.default_top_p,
+            "stream": True
+        }
+        if include_metadata:
+            # Ask for a final usage chunk so streamed replies can be logged like blocking ones
+            request["stream_options"] = {"include_usage": True}
+        return request
+    
+    def _new_stream_state(self) -> Dict[str, Any]:
+        """Create the bookkeeping dict filled while consuming a stream"""
+        return {"finish_reason": None, "usage": None, "has_text": False}
+    
+    def _consume_stream_chunk(self, state: Dict[str, Any], chunk) -> Optional[str]:
+        """
+        Record metadata from one stream chunk
+        
+        Returns:
+            Text delta of the chunk, or None if it carried no text
+        """
+        state["usage"] = self._extract_usage(chunk) or state["usage"]
+        if chunk.choices and len(chunk.choices) > 0:
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                state["finish_reason"] = choice.finish_reason
+            if choice.delta.content:
+                state["has_text"] = True
+                return choice.delta.content
+        return None
+    
+    def _stream_final_event(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the final metadata event once a stream has been fully consumed"""
+        if self.context_cache:
+            self.context_cache.record_usage(self.provider_name, state["usage"])
+        
+        if not state["has_text"]:
+            blocked = state["finish_reason"] == "content_filter"
+            return {
+                "model": self.model_name,
+                "error": True,
+                "error_message": "Content blocked: content_filter" if blocked else "No response generated",
+                "finish_reason": state["finish_reason"] or "OTHER",
+                "usage": state["usage"]
+            }
+        
+        return {
+            "model": self.model_name,
+            "error": False,
+            "error_message": None,
+            "finish_reason": state["finish_reason"],
+            "usage": state["usage"]
+        }
+    
+    def _stream_error_event(self, state: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        """Build the final metadata event for a stream that raised"""
+        error_message, error_reason = self._describe_error(error)
+        return {
+            "model": self.model_name,
+            "error": True,
+            "error_message": error_message,
+            "finish_reason": error_reason,
+            "usage": state["usage"]
+        }
+    
+    def _describe_error(self, error: Exception):
+        """
+        Map an exception to the (error_message, finish_reason) pair used in result dicts
+        
+        Args:
+            error: Exception raised by the OpenAI SDK
+            
+        Returns:
+            Tuple of error message and finish reason
+        """
+        if isinstance(error, RateLimitError):
+            return f"Rate limit exceeded: {str(error)}", "RATE_LIMIT"
+        if isinstance(error, APIConnectionError):
+            return f"Connection error: {str(error)}", "CONNECTION_ERROR"
+        if isinstance(error, APIError):
+            return f"API error: {str(error)}", "API_ERROR"
+        if isinstance(error, OpenAIError):
+            return f"OpenAI error: {str(error)}", "OPENAI_ERROR"
+        return f"Unexpected error: {str(error)}", "ERROR"
     
     def count_tokens(self, text: str, model: Optional[str] = None) -> int:
         """
-        Count tokens in text (approximate for GPT models)
+        Count tokens in text (exact with tiktoken installed, calibrated estimate otherwise)
         
         Args:
             text: Text to count tokens for
             model: Model name (uses self.model_name if not provided)
             
         Returns:
-            Approximate token count
+            Token count
         """
-        # Rough estimate: 1 token ≈ 4 characters for English
-        # For more accurate counting, use tiktoken library
-        return len(text) // 4
+        return get_token_counter(model or self.model_name).count(text)
     
     def test_connection(self) -> bool:
         """
@@ -0,0 +1,351 @@
+"""
+Prompt Builder
+Packs system prompt sections and conversation history into a per-model token budget
+"""
+import os
+from typing import Optional, Dict, Any, List, Callable
+
+from .tokenizer import get_token_counter
+
+# Context window (tokens) per model family, matched by longest name prefix
+MODEL_CONTEXT_WINDOWS = {
+    "gemini-pro": 30720,
+    "gemini-1.0-pro": 30720,
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+    "gemini-2.0-flash": 1048576,
+    "gemini-2.5": 1048576,
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Section priorities: lower numbers are packed first
+PRIORITY_REQUIRED = 0
+PRIORITY_HIGH = 10
+PRIORITY_MEDIUM = 20
+PRIORITY_LOW = 30
+
+
+def get_context_window(model_name: str) -> int:
+    """
+    Get the context window of a model
+    
+    Args:
+        model_name: Model name (e.g. 'gemini-1.5-flash-latest', 'gpt-4o-mini')
+    
+    Returns:
+        Context window in tokens (DEFAULT_CONTEXT_WINDOW for unknown models)
+    """
+    name = (model_name or "").lower()
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if name.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+class PromptBuilder:
+    """
+    Assemble a request from prioritized sections within a token budget
+    
+    Sections are packed by priority (required sections always go in), and
+    the result reports per section whether it was included, truncated or
+    dropped. The system prompt keeps the order in which sections were added,
+    whatever their priority; conversation history is packed newest first and
+    returned in chronological order.
+    """
+    
+    def __init__(
+        self,
+        model_name: str,
+        context_window: Optional[int] = None,
+        max_prompt_tokens: Optional[int] = None,
+        reserved_output_tokens: int = 1024,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        """
+        Initialize builder
+        
+        Args:
+            model_name: Target model, used to look up its context window
+            context_window: Override the looked-up context window (e.g. the smallest
+                window among primary and fallback models)
+            max_prompt_tokens: Upper bound on input tokens (default: PROMPT_TOKEN_BUDGET
+                env var, else the whole context window)
+            reserved_output_tokens: Tokens kept free for the reply
+            count_tokens: Token counter (default: the model family's cached TokenCounter)
+        """
+        if max_prompt_tokens is None and os.getenv("PROMPT_TOKEN_BUDGET"):
+            max_prompt_tokens = int(os.getenv("PROMPT_TOKEN_BUDGET"))
+        
+        self.model_name = model_name
+        self.context_window = context_window or get_context_window(model_name)
+        budget = self.context_window - reserved_output_tokens
+        self.budget = min(budget, max_prompt_tokens) if max_prompt_tokens else budget
+        self.count_tokens = count_tokens or get_token_counter(model_name).count
+        self.sections: List[Dict[str, Any]] = []
+        self.history: Optional[Dict[str, Any]] = None
+        self.prompt = ""
+    
+    def set_prompt(self, prompt: str):
+        """
+        Set the user's current message (always included)
+        
+        Args:
+            prompt: User's input prompt
+        """
+        self.prompt = prompt
+    
+    def add_section(
+        self,
+        name: str,
+        text: str,
+        priority: int = PRIORITY_MEDIUM,
+        truncate: bool = False,
+        min_tokens: int = 50
+    ):
+        """
+        Add a system prompt section
+        
+        Args:
+            name: Section name used in the report
+            text: Section text (empty sections are ignored)
+            priority: Packing priority (PRIORITY_REQUIRED is never dropped)
+            truncate: Cut the section to the remaining budget instead of dropping it
+            min_tokens: Smallest truncated size worth keeping
+        """
+        if text:
+            self.sections.append({
+                "name": name, "text": text, "items": None, "priority": priority,
+                "truncate": truncate, "min_tokens": min_tokens
+            })
+    
+    def add_items(
+        self,
+        name: str,
+        items: List[str],
+        priority: int = PRIORITY_MEDIUM,
+        header: str = "",
+        footer: str = ""
+    ):
+        """
+        Add a section made of independent items (e.g. material passages), best first
+        
+        Items are packed in order while they fit; header and footer are only
+        emitted when at least one item is included.
+        
+        Args:
+            name: Section name used in the report
+            items: Item texts, most important first
+            priority: Packing priority
+            header: Text placed before the items
+            footer: Text placed after the items
+        """
+        if items:
+            self.sections.append({
+                "name": name, "text": None, "items": list(items), "priority": priority,
+                "header": header, "footer": footer
+            })
+    
+    def add_history(
+        self,
+        messages: List[Dict[str, str]],
+        priority: int = PRIORITY_LOW,
+        max_tokens: Optional[int] = None
+    ):
+        """
+        Add previous conversation turns
+        
+        Args:
+            messages: Chronological list of {"role": ..., "content": ...}
+                (without the current prompt)
+            priority: Packing priority
+            max_tokens: Cap on history tokens, whatever budget is left
+        """
+        self.history = {"messages": list(messages), "priority": priority, "max_tokens": max_tokens}
+    
+    def _truncate(self, text: str, max_tokens: int, total_tokens: Optional[int] = None) -> str:
+        """
+        Longest prefix of text (cut at a line or word boundary) within max_tokens
+        
+        The cut is estimated from the text's chars-per-token ratio and refined
+        a couple of times, so a large upload costs a few counts rather than one
+        per step of a binary search.
+        
+        Args:
+            text: Text to cut
+            max_tokens: Budget including the truncation marker
+            total_tokens: Token count of the whole text, if already known
+        
+        Returns:
+            Prefix followed by a truncation marker
+        """
+        marker = "\n[...]\n"
+        max_tokens -= self.count_tokens(marker)
+        if max_tokens <= 0:
+            return marker
+        total_tokens = total_tokens or self.count_tokens(text)
+        
+        length = min(len(text), len(text) * max_tokens // max(total_tokens, 1))
+        tokens = self.count_tokens(text[:length])
+        for _ in range(2):
+            if tokens <= max_tokens and (tokens >= max_tokens * 0.98 or length == len(text)):
+                break
+            # Rescale by the ratio observed on the prefix itself
+            length = min(len(text), length * max_tokens // max(tokens, 1))
+            tokens = self.count_tokens(text[:length])
+        while tokens > max_tokens and length > 0:
+            length = length * 9 // 10
+            tokens = self.count_tokens(text[:length])
+        
+        cut = text[:length]
+        boundary = max(cut.rfind("\n"), cut.rfind(" "))
+        if boundary > length // 2:
+            cut = cut[:boundary]
+        return cut.rstrip() + marker
+    
+    def build(self) -> Dict[str, Any]:
+        """
+        Pack everything into the budget
+        
+        Returns:
+            Dict with:
+                - system_prompt: Joined system sections (in insertion order)
+                - conversation_history: Included turns, chronological
+                - prompt: Current user message
+                - report: Dict with 'model', 'budget', 'used_tokens', 'over_budget'
+                  and 'sections' (name, priority, tokens, original_tokens, status
+                  'included' / 'truncated' / 'dropped', plus item counts for item
+                  sections and the history)
+        """
+        remaining = self.budget - self.count_tokens(self.prompt)
+        packed: Dict[int, str] = {}
+        report: Dict[int, Dict[str, Any]] = {}
+        history_messages: List[Dict[str, str]] = []
+        
+        entries = list(enumerate(self.sections))
+        if self.history is not None:
+            entries.append((len(self.sections), {"name": "history", "priority": self.history["priority"]}))
+        
+        for index, section in sorted(entries, key=lambda entry: (entry[1]["priority"], entry[0])):
+            if index == len(self.sections):
+                remaining = self._pack_history(remaining, history_messages, report, index)
+                continue
+            
+            entry = {"name": section["name"], "priority": section["priority"]}
+            if section["items"] is not None:
+                frame = section["header"] + section["footer"]
+                frame_tokens = self.count_tokens(frame) if frame else 0
+                included = []
+                used = frame_tokens
+                for item in section["items"]:
+                    tokens = self.count_tokens(item)
+                    if used + tokens <= remaining or section["priority"] == PRIORITY_REQUIRED:
+                        included.append(item)
+                        used += tokens
+                entry.update(
+                    original_tokens=frame_tokens + sum(self.count_tokens(item) for item in section["items"]),
+                    items=len(section["items"]),
+                    items_included=len(included)
+                )
+                if included:
+                    packed[index] = section["header"] + "".join(included) + section["footer"]
+                    entry.update(tokens=used, status="included" if len(included) == len(section["items"]) else "truncated")
+                    remaining -= used
+                else:
+                    entry.update(tokens=0, status="dropped")
+            else:
+                tokens = self.count_tokens(section["text"])
+                entry["original_tokens"] = tokens
+                if tokens <= remaining or section["priority"] == PRIORITY_REQUIRED:
+                    packed[index] = section["text"]
+                    entry.update(tokens=tokens, status="included")
+                    remaining -= tokens
+                elif section["truncate"] and remaining >= section["min_tokens"]:
+                    text = self._truncate(section["text"], remaining, total_tokens=tokens)
+                    packed[index] = text
+                    entry.update(tokens=self.count_tokens(text), status="truncated")
+                    remaining -= entry["tokens"]
+                else:
+                    entry.update(tokens=0, status="dropped")
+            report[index] = entry
+        
+        sections_report = [report[index] for index in sorted(report)]
+        used_tokens = self.budget - remaining
+        return {
+            "system_prompt": "".join(packed[index] for index in sorted(packed)),
+            "conversation_history": history_messages,
+            "prompt": self.prompt,
+            "report": {
+                "model": self.model_name,
+                "budget": self.budget,
+                "used_tokens": used_tokens,
+                "over_budget": used_tokens > self.budget,
+                "sections": sections_report
+            }
+        }
+    
+    def _pack_history(
+        self,
+        remaining: int,
+        history_messages: List[Dict[str, str]],
+        report: Dict[int, Dict[str, Any]],
+        index: int
+    ) -> int:
+        """Pack the newest turns that fit into history_messages; returns the remaining budget"""
+        messages = self.history["messages"]
+        limit = remaining
+        if self.history["max_tokens"] is not None:
+            limit = min(limit, self.history["max_tokens"])
+        costs = [self.count_tokens(f"{msg.get('role', 'user')}: {msg.get('content', '')}\n") for msg in messages]
+        used = 0
+        start = len(messages)
+        while start > 0 and used + costs[start - 1] <= limit:
+            start -= 1
+            used += costs[start]
+        # Never start the history with a dangling assistant reply
+        while start < len(messages) and messages[start].get("role") == "assistant":
+            used -= costs[start]
+            start += 1
+        
+        history_messages.extend(
+            {"role": msg["role"], "content": msg["content"]} for msg in messages[start:]
+        )
+        included = len(messages) - start
+        report[index] = {
+            "name": "history",
+            "priority": self.history["priority"],
+            "tokens": used,
+            "original_tokens": sum(costs),
+            "items": len(messages),
+            "items_included": included,
+            "status": "included" if included == len(messages) else ("truncated" if included else "dropped")
+        }
+        return remaining - used
+    
+    @staticmethod
+    def describe(report: Dict[str, Any]) -> str:
+        """
+        One-line summary of a build report
+        
+        Args:
+            report: The 'report' dict returned by build()
+        
+        Returns:
+            e.g. "1830/6000 token; dipangkas: materials (2/5), history (4/12)"
+        """
+        summary = f"{report['used_tokens']}/{report['budget']} token"
+        trimmed = []
+        for section in report["sections"]:
+            if section["status"] == "included":
+                continue
+            if "items" in section:
+                trimmed.append(f"{section['name']} ({section['items_included']}/{section['items']})")
+            else:
+                trimmed.append(f"{section['name']} ({section['status']})")
+        if trimmed:
+            summary += "; dipangkas: " + ", ".join(trimmed)
+        return summary
@@ -0,0 +1,353 @@
+"""
+Prompt Cache
+Content-addressed, SQLite-backed cache of complete LLM requests that survives restarts
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+
+class PromptCache:
+    """
+    Persistent exact-match cache keyed on the full assembled request
+    
+    The key is a SHA-256 of provider, model, temperature, max tokens, system
+    prompt, conversation history and prompt, so only byte-identical requests
+    hit. Entries are stored in a local SQLite database (WAL mode, safe to share
+    between Streamlit processes) with TTL expiry and least-recently-used eviction.
+    """
+    
+    def __init__(
+        self,
+        db_path: str = "data/cache/prompt_cache.sqlite3",
+        max_entries: int = 2000,
+        ttl_seconds: float = 7 * 24 * 3600
+    ):
+        """
+        Initialize prompt cache
+        
+        Args:
+            db_path: SQLite database file
+            max_entries: Maximum number of cached responses
+            ttl_seconds: Seconds before an entry expires
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS prompt_cache (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_preview TEXT,
+                    result_json TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_cache_access ON prompt_cache(last_access)")
+            self.conn.commit()
+    
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: str,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """
+        Build the content address of a request
+        
+        Returns:
+            Hex SHA-256 of the canonical JSON form of the request
+        """
+        request = {
+            "provider": provider,
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "system_prompt": system_prompt or "",
+            "history": [
+                {"role": m.get("role"), "content": m.get("content")}
+                for m in (conversation_history or [])
+            ],
+            "prompt": prompt
+        }
+        canonical = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result
+        
+        Args:
+            key: Key from make_key
+        
+        Returns:
+            Stored result dict, or None on a miss / expired entry
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result_json, created_at FROM prompt_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            if now - row["created_at"] > self.ttl_seconds:
+                self.conn.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            
+            self.conn.execute(
+                "UPDATE prompt_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+            return json.loads(row["result_json"])
+    
+    def put(self, key: str, provider: str, model: str, prompt: str, result: Dict[str, Any]):
+        """
+        Store a successful result and evict the least recently used overflow
+        
+        Args:
+            key: Key from make_key
+            provider: Provider name
+            model: Model name
+            prompt: User prompt (first 200 chars kept for the admin view)
+            result: Result dict to store
+        """
+        result_json = json.dumps(result, ensure_ascii=False, default=str)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO prompt_cache
+                    (key, provider, model, prompt_preview, result_json, size_bytes, created_at, last_access, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+                """,
+                (key, provider, model, prompt[:200], result_json, len(result_json.encode("utf-8")), now, now)
+            )
+            self.conn.execute(
+                """
+                DELETE FROM prompt_cache WHERE key IN (
+                    SELECT key FROM prompt_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+            self.conn.commit()
+    
+    def purge(self, provider: Optional[str] = None) -> int:
+        """
+        Delete cached entries
+        
+        Args:
+            provider: Only delete this provider's entries (None = everything)
+        
+        Returns:
+            Number of deleted entries
+        """
+        with self.lock:
+            if provider:
+                cursor = self.conn.execute("DELETE FROM prompt_cache WHERE provider = ?", (provider,))
+            else:
+                cursor = self.conn.execute("DELETE FROM prompt_cache")
+            self.conn.commit()
+            return cursor.rowcount
+    
+    def purge_expired(self) -> int:
+        """
+        Delete entries older than the TTL
+        
+        Returns:
+            Number of deleted entries
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "DELETE FROM prompt_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self.conn.commit()
+            return cursor.rowcount
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+        
+        Returns:
+            Dict with 'entries', 'size_bytes', 'total_hits', 'max_entries', 'db_path'
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS size_bytes, "
+                "COALESCE(SUM(hits), 0) AS total_hits FROM prompt_cache"
+            ).fetchone()
+        return {
+            "entries": row["entries"],
+            "size_bytes": row["size_bytes"],
+            "total_hits": row["total_hits"],
+            "max_entries": self.max_entries,
+            "db_path": str(self.db_path)
+        }
+    
+    def list_entries(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        List most recently used entries for inspection
+        
+        Args:
+            limit: Maximum rows to return
+        
+        Returns:
+            List of dicts with key, provider, model, prompt preview, size, timestamps and hits
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, provider, model, prompt_preview, size_bytes, created_at, last_access, hits "
+                "FROM prompt_cache ORDER BY last_access DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def cached_response(method):
+    """
+    Decorator for a client's generate_response
+    
+    Serves byte-identical requests from the client's `prompt_cache` (if set)
+    and stores successful results. Hits carry `"cached": True`.
+    """
+    @functools.wraps(method)
+    def wrapper(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        cache = getattr(self, "prompt_cache", None)
+        if cache is None:
+            return method(self, prompt, system_prompt, temperature, max_tokens, conversation_history)
+        
+        key = cache.make_key(
+            self.provider_name, self.model_name, prompt,
+            system_prompt, temperature, max_tokens, conversation_history
+        )
+        try:
+            cached = cache.get(key)
+        except Exception as e:
+            print(f"Prompt cache read failed: {e}")
+            cached = None
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+        
+        result = method(self, prompt, system_prompt, temperature, max_tokens, conversation_history)
+        if not result.get("error") and result.get("response"):
+            try:
+                cache.put(key, self.provider_name, self.model_name, prompt, result)
+            except Exception as e:
+                print(f"Prompt cache write failed: {e}")
+        return result
+    
+    return wrapper
+
+
+def cached_streaming_response(method):
+    """
+    Decorator for a client's generate_streaming_response
+    
+    On a hit the cached text is yielded as one chunk (followed by the cached
+    metadata if requested). On a miss chunks pass through unchanged and the
+    assembled text is stored once the stream finishes without error.
+    """
+    @functools.wraps(method)
+    def wrapper(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        include_metadata: bool = False
+    ):
+        cache = getattr(self, "prompt_cache", None)
+        if cache is None:
+            yield from method(
+                self, prompt, system_prompt, temperature, max_tokens,
+                conversation_history, include_metadata
+            )
+            return
+        
+        key = cache.make_key(
+            self.provider_name, self.model_name, prompt,
+            system_prompt, temperature, max_tokens, conversation_history
+        )
+        try:
+            cached = cache.get(key)
+        except Exception as e:
+            print(f"Prompt cache read failed: {e}")
+            cached = None
+        if cached is not None:
+            yield cached["response"]
+            if include_metadata:
+                metadata = {k: v for k, v in cached.items() if k != "response"}
+                metadata["cached"] = True
+                yield metadata
+            return
+        
+        # Always ask for metadata so only successful streams are stored
+        chunks = []
+        for chunk in method(
+            self, prompt, system_prompt, temperature, max_tokens,
+            conversation_history, True
+        ):
+            if isinstance(chunk, dict):
+                if not chunk.get("error") and chunks:
+                    try:
+                        cache.put(key, self.provider_name, self.model_name, prompt,
+                                  dict(chunk, response="".join(chunks)))
+                    except Exception as e:
+                        print(f"Prompt cache write failed: {e}")
+                if include_metadata:
+                    yield chunk
+                elif chunk.get("error") and not chunks:
+                    yield f"\n\n[Error: {chunk.get('error_message')}]"
+                continue
+            chunks.append(chunk)
+            yield chunk
+    
+    return wrapper
+
+
+# Global prompt cache instance
+_prompt_cache_instance = None
+
+def get_prompt_cache() -> PromptCache:
+    """Get or create global prompt cache instance (configured from environment)"""
+    global _prompt_cache_instance
+    if _prompt_cache_instance is None:
+        _prompt_cache_instance = PromptCache(
+            db_path=os.getenv("PROMPT_CACHE_PATH", "data/cache/prompt_cache.sqlite3"),
+            max_entries=int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "2000")),
+            ttl_seconds=float(os.getenv("PROMPT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        )
+    return _prompt_cache_instance
@@ -0,0 +1,228 @@
+"""
+Tokenizer
+Fast offline token counting per model family, memoized for repeated fragments
+"""
+import re
+import math
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+try:
+    import tiktoken
+except ImportError:  # optional: exact counts for OpenAI models
+    tiktoken = None
+
+# Pieces the estimator prices separately: words, digit runs, other symbols
+_PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|\n+", re.UNICODE)
+
+
+def model_family(model_name: Optional[str]) -> str:
+    """
+    Map a model name to its tokenizer family
+    
+    Args:
+        model_name: e.g. 'gemini-1.5-flash', 'gpt-4o-mini' (None = generic)
+    
+    Returns:
+        'gemini', 'openai' or 'generic'
+    """
+    name = (model_name or "").lower()
+    if name.startswith("gemini"):
+        return "gemini"
+    if name.startswith(("gpt", "o1", "o3", "o4", "text-embedding")):
+        return "openai"
+    return "generic"
+
+
+def estimate_tokens(text: str) -> float:
+    """
+    Estimate the token count of a text without a tokenizer
+    
+    Priced per piece the way BPE vocabularies tend to split text: short Latin
+    words are one token and long ones (common in Indonesian) roughly one per
+    four letters, digits go in groups of three, symbols and line breaks are a
+    token each, and non-Latin letters about one per character.
+    
+    Args:
+        text: Any text
+    
+    Returns:
+        Uncalibrated estimate
+    """
+    tokens = 0.0
+    for piece in _PIECE_PATTERN.findall(text):
+        first = piece[0]
+        if first.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif first == "\n":
+            tokens += 1
+        elif first.isalpha():
+            if piece.isascii():
+                tokens += 1 if len(piece) <= 6 else len(piece) / 4
+            else:
+                tokens += len(piece)
+        else:
+            tokens += 1
+    return tokens
+
+
+class TokenCounter:
+    """
+    Token counter for one model family
+    
+    Uses tiktoken for OpenAI models when it is installed, otherwise the
+    estimator scaled by a calibration factor that is learned from the
+    prompt token counts the provider reports. Counts of fragment-sized texts
+    are memoized in an LRU bounded by entries and total characters, so
+    repeated fragments (system prompt, material passages, earlier turns) cost
+    a dictionary lookup. Large texts such as uploaded code are counted
+    directly and never kept.
+    """
+    
+    def __init__(
+        self,
+        family: str = "generic",
+        model_name: Optional[str] = None,
+        max_entries: int = 4096,
+        max_text_chars: int = 16384,
+        max_cached_chars: int = 4 * 1024 * 1024
+    ):
+        """
+        Initialize counter
+        
+        Args:
+            family: Tokenizer family ('gemini', 'openai', 'generic')
+            model_name: Model used to pick the tiktoken encoding
+            max_entries: Memoized texts kept
+            max_text_chars: Longer texts are counted but not memoized
+            max_cached_chars: Total characters of memoized texts
+        """
+        self.family = family
+        self.max_entries = max_entries
+        self.max_text_chars = max_text_chars
+        self.max_cached_chars = max_cached_chars
+        self._cached_chars = 0
+        self.factor = 1.0
+        self.calibration_samples = 0
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._encoding = None
+        if family == "openai" and tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model_name or "gpt-3.5-turbo")
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+    
+    @property
+    def exact(self) -> bool:
+        """Whether counts come from the model's real tokenizer"""
+        return self._encoding is not None
+    
+    def _raw_count(self, text: str) -> float:
+        """Tokenizer count, or uncalibrated estimate"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+    
+    def count(self, text: str) -> int:
+        """
+        Count the tokens of a text
+        
+        Args:
+            text: Any text
+        
+        Returns:
+            Token count (exact with tiktoken, calibrated estimate otherwise)
+        """
+        if not text:
+            return 0
+        
+        memoize = len(text) <= self.max_text_chars
+        raw = None
+        if memoize:
+            with self._lock:
+                raw = self._cache.get(text)
+                if raw is not None:
+                    self._cache.move_to_end(text)
+                    self.hits += 1
+        
+        if raw is None:
+            raw = self._raw_count(text)
+            with self._lock:
+                self.misses += 1
+                if memoize and text not in self._cache:
+                    self._cache[text] = raw
+                    self._cached_chars += len(text)
+                    while len(self._cache) > self.max_entries or self._cached_chars > self.max_cached_chars:
+                        evicted, _ = self._cache.popitem(last=False)
+                        self._cached_chars -= len(evicted)
+        
+        if self._encoding is not None:
+            return int(raw)
+        return max(1, math.ceil(raw * self.factor))
+    
+    def calibrate(self, counted: int, actual: int, weight: float = 0.2):
+        """
+        Adjust the estimator from a provider-reported prompt token count
+        
+        Args:
+            counted: What count() returned for the request (summed over its parts)
+            actual: Prompt tokens reported in the response usage metadata
+            weight: Smoothing weight of the new observation
+        """
+        if self._encoding is not None or counted <= 0 or actual <= 0:
+            return
+        with self._lock:
+            ratio = min(max(actual / counted, 0.5), 2.0)
+            self.factor = min(max(self.factor * (1 + weight * (ratio - 1)), 0.25), 4.0)
+            self.calibration_samples += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get counter statistics
+        
+        Returns:
+            Dict with 'family', 'exact', 'factor', 'calibration_samples',
+            'cached', 'cached_chars', 'hits' and 'misses'
+        """
+        with self._lock:
+            return {
+                "family": self.family,
+                "exact": self.exact,
+                "factor": round(self.factor, 3),
+                "calibration_samples": self.calibration_samples,
+                "cached": len(self._cache),
+                "cached_chars": self._cached_chars,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Global counters (one per model family)
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+def get_token_counter(model_name: Optional[str] = None) -> TokenCounter:
+    """Get or create the token counter of a model's family"""
+    family = model_family(model_name)
+    with _counters_lock:
+        if family not in _counters:
+            _counters[family] = TokenCounter(family, model_name)
+        return _counters[family]
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """
+    Count tokens of a text for a model
+    
+    Args:
+        text: Any text
+        model_name: Target model (None = generic estimate)
+    
+    Returns:
+        Token count
+    """
+    return get_token_counter(model_name).count(text)
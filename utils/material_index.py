@@ -0,0 +1,488 @@
+"""
+Material Index
+Chunked BM25 retrieval index over learning materials
+"""
+import re
+import math
+import time
+import hashlib
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Union, Callable
+
+from .material_store import Segment, write_segment
+
+# Bump when tokenization or the segment layout changes (old segments are then rebuilt)
+INDEX_FORMAT = 2
+
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Words that carry no topic (Indonesian and English), dropped before stemming
+STOPWORDS = frozenset("""
+    ada adalah agar akan aku anda apa apakah atau bagaimana bahwa bisa dalam dan dapat dari
+    dengan di dia dong harus ini itu jadi jika juga kalau kami kamu karena ke kenapa kita mana
+    mau mengapa mohon oleh pada para saja saya sebagai secara seperti sih sudah supaya tapi
+    tentang tersebut tidak tolong untuk yaitu yakni yang ya
+    a about an and are as at be been but by can could do does for from has have how if in
+    into is it its of on or should so than that the their them then there these they this
+    to was were what when where which who why will with would you your
+""".split())
+
+_PARTICLES = ("lah", "kah", "tah", "pun")
+_POSSESSIVES = ("nya", "ku", "mu")
+# "-i" is left out on purpose: too many roots (teori, memori) end in it
+_DERIVATIONAL = ("kan", "an")
+_ENGLISH_SUFFIXES = (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", ""))
+_PREFIX_RULES = [
+    (re.compile(pattern), replacement) for pattern, replacement in (
+        (r"^(?:meng|peng)(?=[aiueogh])", ""),   # mengambil -> ambil, penghitung -> hitung
+        (r"^(?:meny|peny)(?=[aiueo])", "s"),     # menyusun -> susun
+        (r"^(?:mem|pem)(?=[bpf])", ""),          # membaca -> baca
+        (r"^(?:mem|pem)(?=[aiueo])", "p"),       # memakai -> pakai
+        (r"^(?:men|pen)(?=[cdjz])", ""),         # mencari -> cari
+        (r"^(?:men|pen)(?=[aiueo])", "t"),       # menulis -> tulis
+        (r"^(?:ber|ter|per)", ""),               # berjalan -> jalan
+        (r"^(?:me|pe)(?=[lrwymn])", ""),         # melihat -> lihat
+        (r"^(?:di|ke|se)", ""),                  # dihitung -> hitung
+    )
+]
+_MIN_STEM = 3
+
+
+def _strip_suffix(word: str, suffixes) -> str:
+    """Remove the first matching suffix that leaves a long enough stem"""
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """
+    Reduce a lowercase word to a search stem
+    
+    A light affix stripper for Indonesian (particles, possessives, -kan/-an
+    and up to two prefixes) with the common English inflections; it aims to
+    map a question and a passage onto the same stem, not to find the
+    dictionary root.
+    
+    Args:
+        word: Lowercase word
+    
+    Returns:
+        Stem
+    """
+    if len(word) <= 4 or word.isdigit():
+        return word
+    
+    stemmed = word
+    for suffix, replacement in _ENGLISH_SUFFIXES:
+        if word.endswith(suffix) and not word.endswith("ss") and len(word) - len(suffix) >= 4:
+            stemmed = word[:-len(suffix)] + replacement
+            break
+    
+    stemmed = _strip_suffix(stemmed, _PARTICLES)
+    stemmed = _strip_suffix(stemmed, _POSSESSIVES)
+    stemmed = _strip_suffix(stemmed, _DERIVATIONAL)
+    
+    for _ in range(2):
+        for pattern, replacement in _PREFIX_RULES:
+            candidate = pattern.sub(replacement, stemmed, count=1)
+            if candidate != stemmed:
+                if len(candidate) >= _MIN_STEM:
+                    stemmed = candidate
+                break
+    return stemmed
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into stemmed search terms
+    
+    Args:
+        text: Any text (question, passage)
+    
+    Returns:
+        List of terms (single characters and stopwords are dropped)
+    """
+    return [
+        stem(t) for t in _TOKEN_PATTERN.findall(text.lower())
+        if len(t) > 1 and t not in STOPWORDS
+    ]
+
+
+def normalize_whitespace(text: str) -> str:
+    """
+    Clean up whitespace in text extracted from a PDF page
+    
+    Joins words hyphenated across line breaks, collapses runs of spaces/tabs,
+    trims every line and keeps at most one blank line between paragraphs.
+    
+    Args:
+        text: Raw extracted text
+    
+    Returns:
+        Normalized text
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\xa0", " ")
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)
+    text = re.sub(r"[ \t\f\v]+", " ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def chunk_text(text: str, chunk_chars: int = 1200, overlap_chars: int = 200) -> List[str]:
+    """
+    Split a document into overlapping passages on paragraph/word boundaries
+    
+    Args:
+        text: Document text
+        chunk_chars: Target passage length in characters
+        overlap_chars: Characters repeated between consecutive passages
+    
+    Returns:
+        List of passages
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    chunks = []
+    current: List[str] = []
+    current_len = 0
+    
+    for paragraph in paragraphs:
+        # Split very long paragraphs on word boundaries first
+        pieces = [paragraph]
+        if len(paragraph) > chunk_chars:
+            words = paragraph.split()
+            pieces, piece = [], []
+            piece_len = 0
+            for word in words:
+                if piece_len + len(word) + 1 > chunk_chars and piece:
+                    pieces.append(" ".join(piece))
+                    piece, piece_len = [], 0
+                piece.append(word)
+                piece_len += len(word) + 1
+            if piece:
+                pieces.append(" ".join(piece))
+        
+        for piece in pieces:
+            if current_len + len(piece) > chunk_chars and current:
+                chunks.append("\n\n".join(current))
+                # Carry the tail of the previous passage over for context
+                tail = chunks[-1][-overlap_chars:] if overlap_chars else ""
+                tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+                current = [tail] if tail else []
+                current_len = len(tail)
+            current.append(piece)
+            current_len += len(piece) + 2
+    
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def find_excerpt(text: str, query: str, window_chars: int = 400) -> str:
+    """
+    Cut the window of a passage that covers the most query terms
+    
+    Args:
+        text: Passage text
+        query: Search query
+        window_chars: Excerpt length in characters
+    
+    Returns:
+        Excerpt aligned to word boundaries (the passage start when no term occurs)
+    """
+    terms = set(tokenize(query))
+    hits = [
+        (match.start(), match.end(), stem(match.group().lower()))
+        for match in _TOKEN_PATTERN.finditer(text)
+        if stem(match.group().lower()) in terms
+    ]
+    if len(text) <= window_chars:
+        return text.strip()
+    
+    # Slide over the hits: most distinct terms first, then most hits
+    best_start, best_key = 0, (0, 0)
+    counts: Counter = Counter()
+    left = 0
+    for right, (_, end, term) in enumerate(hits):
+        counts[term] += 1
+        while end - hits[left][0] > window_chars:
+            counts[hits[left][2]] -= 1
+            if not counts[hits[left][2]]:
+                del counts[hits[left][2]]
+            left += 1
+        key = (len(counts), right - left + 1)
+        if key > best_key:
+            best_key = key
+            # Center the matched span in the window
+            best_start = max(0, (hits[left][0] + end - window_chars) // 2)
+    
+    start = min(best_start, len(text) - window_chars)
+    end = start + window_chars
+    if start > 0:
+        space = text.find(" ", start)
+        start = space + 1 if 0 <= space < start + 40 else start
+    if end < len(text):
+        space = text.rfind(" ", end - 40, end)
+        end = space if space > start else end
+    return text[start:end].strip()
+
+
+class MaterialIndex:
+    """
+    BM25 inverted index over material passages
+    
+    Each document is split into passages once; queries then only touch the
+    postings of their own terms, so retrieval cost does not depend on how
+    much material is loaded. Every document version is stored as its own
+    immutable, memory-mapped segment (see material_store), so passages and
+    postings live in the OS page cache shared by all processes rather than
+    as Python objects, and reopening an index after a restart reads nothing
+    but segment headers. Documents can be added, replaced or removed one at
+    a time; every change bumps `generation`.
+    """
+    
+    def __init__(
+        self,
+        storage_dir: str = "data/cache/materials/index",
+        k1: float = 1.5,
+        b: float = 0.75,
+        chunk_chars: int = 1200,
+        overlap_chars: int = 200
+    ):
+        """
+        Initialize empty index
+        
+        Args:
+            storage_dir: Directory holding the segment files
+            k1: BM25 term-frequency saturation
+            b: BM25 length normalization
+            chunk_chars: Target passage length in characters
+            overlap_chars: Overlap between consecutive passages
+        """
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+        # filename -> {'segment', 'version', 'generation', 'signature'}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.generation = 0
+        self.lock = threading.RLock()
+    
+    def _segment_path(self, version: str) -> Path:
+        """Segment file of a document version (chunking settings are part of the name)"""
+        return self.storage_dir / f"{version}-v{INDEX_FORMAT}-{self.chunk_chars}-{self.overlap_chars}.seg"
+    
+    def build(self, documents: Dict[str, str]):
+        """
+        (Re)build the index from scratch
+        
+        Args:
+            documents: Mapping of filename -> extracted text
+        """
+        with self.lock:
+            for filename in list(self.documents):
+                self.remove_document(filename)
+            for filename in sorted(documents):
+                self.add_document(filename, documents[filename])
+    
+    def add_document(
+        self,
+        filename: str,
+        text: Union[str, Callable[[], Optional[str]]],
+        signature: Any = None,
+        version: Optional[str] = None
+    ) -> bool:
+        """
+        Add a document, replacing its previous passages if already indexed
+        
+        Args:
+            filename: Document name
+            text: Extracted text, or a callable returning it (only called when
+                no segment exists yet for this version)
+            signature: Opaque marker of the source file state (e.g. size and mtime),
+                stored so callers can detect when the file changed
+            version: Content version (e.g. file hash); required when `text` is a callable,
+                otherwise derived from the text
+        
+        Returns:
+            True if the index changed (False when the same version is already indexed
+            or the text could not be loaded)
+        """
+        if version is None:
+            if callable(text):
+                raise ValueError("version is required when text is loaded lazily")
+            version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        
+        with self.lock:
+            existing = self.documents.get(filename)
+            if existing and existing["version"] == version:
+                existing["signature"] = signature
+                return False
+        
+        # Build the segment outside the lock; searches keep running meanwhile
+        path = self._segment_path(version)
+        if not path.exists():
+            content = text() if callable(text) else text
+            if content is None:
+                return False
+            passages = [
+                (position, passage, Counter(tokenize(passage)))
+                for position, passage in enumerate(chunk_text(content, self.chunk_chars, self.overlap_chars))
+            ]
+            write_segment(path, passages)
+        segment = Segment(path)
+        
+        with self.lock:
+            existing = self.documents.get(filename)
+            self.generation += 1
+            self.documents[filename] = {
+                "segment": segment,
+                "version": version,
+                "generation": self.generation,
+                "signature": signature
+            }
+            if existing:
+                self._release(existing)
+            return True
+    
+    def remove_document(self, filename: str) -> bool:
+        """
+        Remove a document's passages
+        
+        Args:
+            filename: Document name
+        
+        Returns:
+            True if the document was indexed
+        """
+        with self.lock:
+            existing = self.documents.pop(filename, None)
+            if not existing:
+                return False
+            self._release(existing)
+            self.generation += 1
+            return True
+    
+    def _release(self, document: Dict[str, Any]):
+        """Close a replaced/removed document's segment and delete it if unused (lock held)"""
+        segment = document["segment"]
+        segment.close()
+        if not any(doc["version"] == document["version"] for doc in self.documents.values()):
+            segment.path.unlink(missing_ok=True)
+    
+    def prune_segments(self, grace_seconds: float = 24 * 3600) -> int:
+        """
+        Delete segment files no index of this format can use
+        
+        Segments are shared by every process using the same storage
+        directory, and another process may have just written one for a
+        document this process has not seen yet. So only files of another
+        index format or chunking are deleted right away; unused files of the
+        current format are kept until they are older than the grace period
+        (e.g. left by documents changed while the app was not running).
+        
+        Args:
+            grace_seconds: Age before an unused current-format segment is deleted
+        
+        Returns:
+            Number of files deleted
+        """
+        current_suffix = self._segment_path("").name
+        cutoff = time.time() - grace_seconds
+        with self.lock:
+            in_use = {doc["segment"].path.name for doc in self.documents.values()}
+            removed = 0
+            for path in self.storage_dir.glob("*.seg"):
+                if path.name in in_use:
+                    continue
+                try:
+                    if path.name.endswith(current_suffix) and path.stat().st_mtime > cutoff:
+                        continue
+                    path.unlink()
+                    removed += 1
+                except OSError:
+                    continue  # already gone, or still mapped by another process (Windows)
+            return removed
+    
+    def get_document_versions(self) -> Dict[str, str]:
+        """Content version of every indexed document"""
+        with self.lock:
+            return {filename: doc["version"] for filename, doc in self.documents.items()}
+    
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Rank passages for a query with BM25
+        
+        Args:
+            query: Natural-language question
+            top_k: Maximum passages to return
+        
+        Returns:
+            List of dicts with 'filename', 'position', 'text', 'score' and the
+            document 'version', best first
+        """
+        with self.lock:
+            documents = [(filename, doc["segment"]) for filename, doc in self.documents.items()]
+            num_chunks = sum(segment.num_chunks for _, segment in documents)
+            if not num_chunks:
+                return []
+            avg_length = sum(segment.total_length for _, segment in documents) / num_chunks
+            scores: Dict[Tuple[int, int], float] = {}
+            
+            for term in set(tokenize(query)):
+                matches = []
+                for doc_index, (_, segment) in enumerate(documents):
+                    term_index = segment.find_term(term)
+                    if term_index >= 0:
+                        matches.append((doc_index, segment, segment.postings(term_index)))
+                if not matches:
+                    continue
+                
+                df = sum(len(postings) // 2 for _, _, postings in matches)
+                idf = math.log(1 + (num_chunks - df + 0.5) / (df + 0.5))
+                for doc_index, segment, postings in matches:
+                    for i in range(0, len(postings), 2):
+                        chunk_id, tf = postings[i], postings[i + 1]
+                        norm = self.k1 * (1 - self.b + self.b * segment.chunk_length(chunk_id) / (avg_length or 1))
+                        key = (doc_index, chunk_id)
+                        scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                    postings.release()
+            
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            results = []
+            for (doc_index, chunk_id), score in best:
+                filename, segment = documents[doc_index]
+                results.append({
+                    "filename": filename,
+                    "position": segment.chunk_position(chunk_id),
+                    "text": segment.chunk_text(chunk_id),
+                    "score": score,
+                    "version": self.documents[filename]["version"]
+                })
+            return results
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics
+        
+        Returns:
+            Dict with 'documents', 'chunks', 'terms' (summed per document),
+            'bytes' (segment files) and 'generation'
+        """
+        with self.lock:
+            segments = [doc["segment"] for doc in self.documents.values()]
+            return {
+                "documents": len(self.documents),
+                "chunks": sum(segment.num_chunks for segment in segments),
+                "terms": sum(segment.num_terms for segment in segments),
+                "bytes": sum(segment.size for segment in segments),
+                "generation": self.generation
+            }
@@ -0,0 +1,256 @@
+"""
+Material Ingestion
+Parallel PDF extraction, chunking and index building in the background
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Callable
+
+import PyPDF2
+
+from .material_reader import MaterialReader, extract_pdf_pages, get_material_reader
+
+
+class MaterialIngestor:
+    """
+    Ingest learning materials into the text cache and retrieval index
+    
+    Pages of documents missing from the text cache are extracted in a process
+    pool (large PDFs are split into page ranges so one big file still uses
+    every worker), normalized, stored per document, and then the retrieval
+    index is updated for the documents that changed. Runs in a background thread
+    so chat requests keep using the previous index meanwhile.
+    """
+    
+    def __init__(
+        self,
+        reader: MaterialReader,
+        max_workers: Optional[int] = None,
+        pages_per_task: int = 25,
+        min_pages_for_pool: int = 40
+    ):
+        """
+        Initialize ingestor
+        
+        Args:
+            reader: MaterialReader whose cache and index are filled
+            max_workers: Worker processes (default: CPU count)
+            pages_per_task: Pages extracted per worker task
+            min_pages_for_pool: Below this many pages, extract in-process
+                (a process pool costs more than it saves on small jobs)
+        """
+        self.reader = reader
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.min_pages_for_pool = min_pages_for_pool
+        self.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {"state": "idle"}
+    
+    def _update(self, **changes):
+        """Update the progress status"""
+        with self.lock:
+            self.status.update(changes)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """
+        Get ingestion progress
+        
+        Returns:
+            Dict with 'state' ('idle', 'extracting', 'indexing', 'done', 'error'),
+            'files_total', 'files_done', 'pages_total', 'pages_done', 'current_file',
+            'errors', 'changes' (documents added/updated/removed in the index),
+            'started_at', 'finished_at'
+        """
+        with self.lock:
+            return dict(self.status, errors=list(self.status.get("errors", [])))
+    
+    def is_running(self) -> bool:
+        """Whether a background ingestion is in progress"""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, filenames: Optional[List[str]] = None, force: bool = False) -> bool:
+        """
+        Start ingestion in a background thread (no-op if one is running)
+        
+        Args:
+            filenames: Documents to (re)extract (default: every document not yet cached)
+            force: Re-extract even if the text cache is current
+        
+        Returns:
+            True if a new run was started
+        """
+        with self.lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self.ingest,
+                kwargs={"filenames": filenames, "force": force},
+                name="material-ingest",
+                daemon=True
+            )
+            self._thread.start()
+        return True
+    
+    def ingest(
+        self,
+        filenames: Optional[List[str]] = None,
+        force: bool = False,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run ingestion in the calling thread
+        
+        Args:
+            filenames: Documents to (re)extract (default: every document not yet cached)
+            force: Re-extract even if the text cache is current
+            progress_callback: Called with the status dict after every step
+        
+        Returns:
+            Final status dict
+        """
+        def report(**changes):
+            self._update(**changes)
+            if progress_callback:
+                progress_callback(self.get_status())
+        
+        report(
+            state="extracting", files_total=0, files_done=0, pages_total=0, pages_done=0,
+            current_file=None, errors=[], changes=None, started_at=time.time(), finished_at=None
+        )
+        
+        try:
+            candidates = filenames or self.reader.list_materials()
+            pending = [
+                name for name in candidates
+                if (self.reader.materials_dir / name).exists()
+                and (force or not self.reader.has_cached_pages(name))
+            ]
+            
+            # Page counts decide how the work is split
+            page_counts = {}
+            errors = []
+            for name in pending:
+                try:
+                    with open(self.reader.materials_dir / name, 'rb') as f:
+                        page_counts[name] = len(PyPDF2.PdfReader(f).pages)
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+            report(files_total=len(page_counts), pages_total=sum(page_counts.values()), errors=errors)
+            
+            if page_counts:
+                self._extract(page_counts, report)
+            
+            report(state="indexing", current_file=None)
+            changes = self.reader.sync_index()
+            report(state="done", finished_at=time.time(), changes=changes)
+        except Exception as e:
+            errors = self.get_status().get("errors", [])
+            report(state="error", errors=errors + [str(e)], finished_at=time.time())
+        
+        return self.get_status()
+    
+    def _extract(self, page_counts: Dict[str, int], report: Callable):
+        """Extract all pages of the given documents and store them per document"""
+        results: Dict[str, List[Dict[str, Any]]] = {name: [] for name in page_counts}
+        remaining = dict(page_counts)
+        pages_done = files_done = 0
+        errors = self.get_status().get("errors", [])
+        
+        def finish(name: str):
+            nonlocal files_done
+            pages = sorted(results.pop(name), key=lambda p: p["page"])
+            self.reader.store_pages(name, pages)
+            files_done += 1
+        
+        if sum(page_counts.values()) < self.min_pages_for_pool or self.max_workers == 1:
+            for name in page_counts:
+                report(current_file=name)
+                try:
+                    results[name] = extract_pdf_pages(str(self.reader.materials_dir / name))
+                    pages_done += page_counts[name]
+                    finish(name)
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+                    results.pop(name, None)
+                report(pages_done=pages_done, files_done=files_done, errors=errors)
+            return
+        
+        # spawn: forking a threaded Streamlit server is not safe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as pool:
+            futures = {}
+            for name, count in page_counts.items():
+                path = str(self.reader.materials_dir / name)
+                for start in range(0, count, self.pages_per_task):
+                    future = pool.submit(extract_pdf_pages, path, start, start + self.pages_per_task)
+                    futures[future] = (name, min(self.pages_per_task, count - start))
+            
+            failed = set()
+            for future in as_completed(futures):
+                name, task_pages = futures[future]
+                try:
+                    pages = future.result()
+                    if name not in failed:
+                        results[name].extend(pages)
+                except Exception as e:
+                    if name not in failed:
+                        errors.append(f"{name}: {e}")
+                        failed.add(name)
+                        results.pop(name, None)
+                pages_done += task_pages
+                remaining[name] -= task_pages
+                if remaining[name] == 0 and name not in failed:
+                    finish(name)
+                report(current_file=name, pages_done=pages_done, files_done=files_done, errors=errors)
+
+
+# Global ingestor instance (one per reader)
+_ingestors: Dict[int, MaterialIngestor] = {}
+_ingestors_lock = threading.Lock()
+
+def get_ingestor(reader: Optional[MaterialReader] = None) -> MaterialIngestor:
+    """Get or create the ingestor of a reader (default: the global material reader)"""
+    reader = reader or get_material_reader()
+    with _ingestors_lock:
+        if id(reader) not in _ingestors:
+            workers = os.getenv("MATERIALS_INGEST_WORKERS")
+            _ingestors[id(reader)] = MaterialIngestor(reader, max_workers=int(workers) if workers else None)
+        return _ingestors[id(reader)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """CLI entry point: python -m utils.material_ingest"""
+    parser = argparse.ArgumentParser(description="Extract, chunk and index learning materials")
+    parser.add_argument("files", nargs="*", help="PDF filenames to ingest (default: all uncached)")
+    parser.add_argument("--materials-dir", default="data/materials", help="Directory with PDF materials")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-extract even if cached")
+    args = parser.parse_args(argv)
+    
+    reader = MaterialReader(args.materials_dir)
+    ingestor = MaterialIngestor(reader, max_workers=args.workers)
+    
+    def show(status: Dict[str, Any]):
+        total = status.get("pages_total") or 0
+        done = status.get("pages_done") or 0
+        bar = f"{done}/{total} halaman" if total else ""
+        print(f"\r[{status['state']}] {status.get('files_done', 0)}/{status.get('files_total', 0)} file {bar}   ", end="", flush=True)
+    
+    status = ingestor.ingest(filenames=args.files or None, force=args.force, progress_callback=show)
+    print()
+    for error in status.get("errors", []):
+        print(f"Error: {error}", file=sys.stderr)
+    
+    stats = reader.get_index().get_stats()
+    print(f"Selesai dalam {status['finished_at'] - status['started_at']:.1f}s: {stats}")
+    return 0 if status["state"] == "done" and not status.get("errors") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
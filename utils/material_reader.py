@@ -3,18 +3,62 @@ PDF Material Reader
 Reads and extracts text from PDF materials for RAG (Retrieval Augmented Generation)
 """
 import os
+import json
+import hashlib
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any
 import PyPDF2
 
+from .llm.tokenizer import count_tokens
+from .material_index import MaterialIndex, find_excerpt, normalize_whitespace
+
+
+def extract_pdf_pages(path: str, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Extract and normalize the text of a range of PDF pages
+    
+    Module-level so it can run in a worker process.
+    
+    Args:
+        path: Path of the PDF file
+        start: First page index (0-based, inclusive)
+        end: Last page index (exclusive, None = until the end)
+    
+    Returns:
+        List of dicts with 'page' (1-based) and 'text'
+    """
+    pages = []
+    with open(path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        end = len(pdf_reader.pages) if end is None else min(end, len(pdf_reader.pages))
+        for page_num in range(start, end):
+            text = pdf_reader.pages[page_num].extract_text() or ""
+            pages.append({"page": page_num + 1, "text": normalize_whitespace(text)})
+    return pages
+
 
 class MaterialReader:
     """Read and manage learning materials (PDF files)"""
     
-    def __init__(self, materials_dir: str = "data/materials"):
+    def __init__(self, materials_dir: str = "data/materials", cache_dir: Optional[str] = None):
+        """
+        Initialize material reader
+        
+        Args:
+            materials_dir: Directory holding the PDF materials
+            cache_dir: Directory for the extracted-text sidecar cache
+                (default: data/cache/materials next to the materials directory)
+        """
         self.materials_dir = Path(materials_dir)
         self.materials_dir.mkdir(parents=True, exist_ok=True)
-        self._cache = {}
+        self.cache_dir = Path(cache_dir) if cache_dir else self.materials_dir.parent / "cache" / "materials"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = self.cache_dir / "manifest.json"
+        self.lock = threading.Lock()
+        self._index = MaterialIndex(self.cache_dir / "index")
+        self._index_version = None
+        self._sync_lock = threading.Lock()
     
     def list_materials(self) -> List[str]:
         """List all available PDF materials"""
@@ -25,21 +69,175 @@ class MaterialReader:
             print(f"Error listing materials: {e}")
             return []
     
-    def read_pdf(self, filename: str, use_cache: bool = True) -> Optional[str]:
+    def get_materials_version(self) -> str:
         """
-        Read text content from a PDF file
+        Get a version string that changes whenever a material is added, replaced or deleted
+        
+        Returns:
+            Short hash of every PDF's name, size and modification time
+        """
+        try:
+            signature = sorted(
+                (f.name, f.stat().st_size, f.stat().st_mtime_ns)
+                for f in self.materials_dir.glob("*.pdf")
+            )
+        except Exception as e:
+            print(f"Error reading materials version: {e}")
+            signature = []
+        return hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()[:12]
+    
+    @staticmethod
+    def _file_hash(file_path: Path) -> str:
+        """SHA-256 of a file's content"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Filename -> {'size', 'mtime_ns', 'sha256'} of documents in the sidecar cache"""
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    
+    def _write_json(self, path: Path, data):
+        """Write JSON atomically (readers in other processes never see a partial file)"""
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def _extract_pages(self, file_path: Path) -> List[Dict[str, Any]]:
+        """Run PyPDF2 over every page of a file"""
+        return extract_pdf_pages(str(file_path))
+    
+    def _signature(self, filename: str):
+        """(size, mtime_ns) of a material file"""
+        stat = (self.materials_dir / filename).stat()
+        return (stat.st_size, stat.st_mtime_ns)
+    
+    def _content_hash(self, filename: str, signature) -> str:
+        """SHA-256 of a material file, taken from the manifest when size and mtime still match"""
+        entry = self._load_manifest().get(filename)
+        if entry and (entry["size"], entry["mtime_ns"]) == tuple(signature):
+            return entry["sha256"]
+        return self._file_hash(self.materials_dir / filename)
+    
+    def _cached_sidecar(self, filename: str) -> Optional[Path]:
+        """
+        Sidecar holding the current content of a document, without reading it
         
         Args:
             filename: Name of the PDF file
-            use_cache: Whether to use cached content
+        
+        Returns:
+            Path of the sidecar file, or None if the current file content is not cached
+        """
+        file_path = self.materials_dir / filename
+        if not file_path.exists():
+            return None
+        
+        signature = self._signature(filename)
+        with self.lock:
+            entry = self._load_manifest().get(filename)
             
+            # Same size and mtime as when cached: trust the recorded hash
+            if entry and (entry["size"], entry["mtime_ns"]) == signature:
+                sha256 = entry["sha256"]
+            else:
+                sha256 = self._file_hash(file_path)
+            
+            sidecar = self.cache_dir / f"{sha256}.json"
+            if not sidecar.exists():
+                return None
+            
+            if not entry or (entry["size"], entry["mtime_ns"], entry["sha256"]) != (*signature, sha256):
+                self._record_manifest(filename, signature, sha256)
+        return sidecar
+    
+    def has_cached_pages(self, filename: str) -> bool:
+        """
+        Check whether a document's current text is in the sidecar cache
+        
+        Only the manifest and the sidecar's existence are checked, so deciding
+        what to ingest never loads any document text.
+        
+        Args:
+            filename: Name of the PDF file
+        
         Returns:
-            Extracted text content or None if error
+            True if the pages can be read without parsing the PDF
+        """
+        return self._cached_sidecar(filename) is not None
+    
+    def get_cached_pages(self, filename: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get a document's pages from the sidecar cache, never parsing
+        
+        The pages are read from disk on every call and not kept by the reader;
+        the retrieval index holds the chunked text in its own segments.
+        
+        Args:
+            filename: Name of the PDF file
+        
+        Returns:
+            List of page dicts, or None if the current file content is not cached
+        """
+        sidecar = self._cached_sidecar(filename)
+        if sidecar is None:
+            return None
+        try:
+            with open(sidecar, 'r', encoding='utf-8') as f:
+                return json.load(f)["pages"]
+        except Exception as e:
+            print(f"Ignoring unreadable text cache for {filename}: {e}")
+            return None
+    
+    def store_pages(self, filename: str, pages: List[Dict[str, Any]]):
         """
-        # Check cache
-        if use_cache and filename in self._cache:
-            return self._cache[filename]
+        Put a document's extracted pages in the sidecar cache
         
+        Args:
+            filename: Name of the PDF file
+            pages: List of dicts with 'page' and 'text'
+        """
+        file_path = self.materials_dir / filename
+        signature = self._signature(filename)
+        sha256 = self._file_hash(file_path)
+        with self.lock:
+            self._write_json(self.cache_dir / f"{sha256}.json", {"filename": filename, "sha256": sha256, "pages": pages})
+            self._record_manifest(filename, signature, sha256)
+    
+    def _record_manifest(self, filename: str, signature, sha256: str):
+        """Point a filename at its sidecar, dropping a replaced sidecar nobody else uses (lock held)"""
+        manifest = self._load_manifest()
+        entry = manifest.get(filename)
+        if entry and entry.get("sha256") != sha256 and not any(
+            e.get("sha256") == entry["sha256"] for name, e in manifest.items() if name != filename
+        ):
+            (self.cache_dir / f"{entry['sha256']}.json").unlink(missing_ok=True)
+        manifest[filename] = {"size": signature[0], "mtime_ns": signature[1], "sha256": sha256}
+        self._write_json(self.manifest_file, manifest)
+    
+    def read_pdf_pages(self, filename: str, use_cache: bool = True) -> Optional[List[Dict[str, Any]]]:
+        """
+        Read the text of every page of a PDF file
+        
+        Extracted text is kept in a sidecar cache (data/cache/materials/<sha256>.json)
+        keyed by the file's content hash; its size and modification time are
+        recorded so unchanged files are never hashed or parsed again, not even
+        by a freshly started process.
+        
+        Args:
+            filename: Name of the PDF file
+            use_cache: Whether to use cached content
+        
+        Returns:
+            List of dicts with 'page' (1-based) and 'text', or None if error
+        """
         file_path = self.materials_dir / filename
         
         if not file_path.exists():
@@ -47,33 +245,60 @@ class MaterialReader:
             return None
         
         try:
-            text_content = ""
-            
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                num_pages = len(pdf_reader.pages)
-                
-                # Extract text from each page
-                for page_num in range(num_pages):
-                    page = pdf_reader.pages[page_num]
-                    text_content += page.extract_text() + "\n\n"
-            
-            # Cache the content
-            self._cache[filename] = text_content
-            
-            return text_content
+            if use_cache:
+                pages = self.get_cached_pages(filename)
+                if pages is not None:
+                    return pages
             
+            pages = self._extract_pages(file_path)
+            self.store_pages(filename, pages)
+            return pages
+        
         except Exception as e:
             print(f"Error reading PDF {filename}: {e}")
             return None
     
+    def read_pdf(self, filename: str, use_cache: bool = True) -> Optional[str]:
+        """
+        Read text content from a PDF file
+        
+        Args:
+            filename: Name of the PDF file
+            use_cache: Whether to use cached content
+        
+        Returns:
+            Extracted text content or None if error
+        """
+        pages = self.read_pdf_pages(filename, use_cache=use_cache)
+        if pages is None:
+            return None
+        return "".join(page["text"] + "\n\n" for page in pages)
+    
+    def invalidate(self, filename: str):
+        """
+        Forget one document after it was replaced or deleted
+        
+        Args:
+            filename: Name of the PDF file
+        """
+        if not (self.materials_dir / filename).exists():
+            self._index.remove_document(filename)
+        with self.lock:
+            manifest = self._load_manifest()
+            entry = manifest.pop(filename, None)
+            if entry is None:
+                return
+            if not any(e.get("sha256") == entry["sha256"] for e in manifest.values()):
+                (self.cache_dir / f"{entry['sha256']}.json").unlink(missing_ok=True)
+            self._write_json(self.manifest_file, manifest)
+    
     def get_all_materials_text(self, max_chars: int = 10000) -> str:
         """
         Get combined text from all PDF materials
         
         Args:
             max_chars: Maximum characters to return (to avoid token limits)
-            
+        
         Returns:
             Combined text from all materials
         """
@@ -106,50 +331,181 @@ class MaterialReader:
         
         return combined_text if total_chars > 0 else ""
     
-    def search_materials(self, query: str, max_results: int = 3) -> List[Dict[str, str]]:
+    def get_index(self) -> MaterialIndex:
         """
-        Search for relevant content in materials based on query
+        Get the retrieval index without ever waiting for ingestion
+        
+        When the materials changed since the index was last synced, a
+        background ingestion (extract, chunk, index) is started; the index
+        keeps serving the documents it already has until then.
         
-        Args:
-            query: Search query
-            max_results: Maximum number of results to return
-            
         Returns:
-            List of dicts with 'filename', 'excerpt', and 'relevance'
+            Current MaterialIndex (empty until the first sync finishes)
         """
-        materials = self.list_materials()
-        results = []
+        if self._index_version != self.get_materials_version():
+            from .material_ingest import get_ingestor
+            get_ingestor(self).start()
+        return self._index
+    
+    def get_generation(self) -> int:
+        """Index generation, incremented whenever a document is added, replaced or removed"""
+        return self._index.generation
+    
+    def sync_index(self) -> Dict[str, List[str]]:
+        """
+        Bring the index in line with the materials directory, one document at a time
         
-        query_lower = query.lower()
+        Only documents whose file changed are re-chunked; deleted files are
+        removed. A document whose content already has an index segment on
+        disk (e.g. after a restart) is opened without loading its text.
+        Otherwise parses documents missing from the text cache, so run it from
+        a background thread (see MaterialIngestor).
         
-        for material in materials:
-            content = self.read_pdf(material)
-            if not content:
-                continue
+        Returns:
+            Dict with the 'added', 'updated' and 'removed' filenames
+        """
+        with self._sync_lock:
+            version = self.get_materials_version()
+            changes = {"added": [], "updated": [], "removed": []}
             
-            content_lower = content.lower()
+            current = {}
+            for material in self.list_materials():
+                try:
+                    current[material] = self._signature(material)
+                except FileNotFoundError:
+                    continue
             
-            # Simple keyword matching (can be enhanced with embeddings)
-            if query_lower in content_lower:
-                # Find excerpt around the query
-                index = content_lower.find(query_lower)
-                start = max(0, index - 200)
-                end = min(len(content), index + 200)
-                excerpt = content[start:end]
-                
-                # Count occurrences as relevance score
-                relevance = content_lower.count(query_lower)
-                
-                results.append({
-                    "filename": material,
-                    "excerpt": f"...{excerpt}...",
-                    "relevance": relevance
-                })
+            for filename in list(self._index.documents):
+                if filename not in current and self._index.remove_document(filename):
+                    changes["removed"].append(filename)
+            
+            for filename, signature in current.items():
+                indexed = self._index.documents.get(filename)
+                if indexed and indexed["signature"] == signature:
+                    continue
+                try:
+                    version_hash = self._content_hash(filename, signature)
+                except FileNotFoundError:
+                    continue
+                if self._index.add_document(
+                    filename,
+                    lambda filename=filename: self.read_pdf(filename),
+                    signature=signature,
+                    version=version_hash[:16]
+                ):
+                    changes["updated" if indexed else "added"].append(filename)
+            
+            self._index.prune_segments()
+            self._index_version = version
+            return changes
+    
+    def documents_current(self, versions: Dict[str, str], indexed: Optional[List[str]] = None) -> bool:
+        """
+        Check that documents are still indexed at the given content versions
+        
+        Args:
+            versions: Mapping of filename -> version, as returned in
+                get_relevant_materials()['documents']
+            indexed: Every document indexed at the time, as returned in
+                get_relevant_materials()['indexed'] (None skips the check)
+        
+        Returns:
+            True if none of those documents was replaced or removed and no
+            document was added since (an answer built without a material may
+            have used it now, e.g. one given while the first ingestion ran)
+        """
+        current = self._index.get_document_versions()
+        if indexed is not None and not set(current) <= set(indexed):
+            return False
+        return all(current.get(filename) == version for filename, version in versions.items())
+    
+    def get_relevant_materials(self, query: str, max_tokens: int = 1200, top_k: int = 6) -> Dict[str, Any]:
+        """
+        Get the material passages most relevant to a question
+        
+        Args:
+            query: Student question
+            max_tokens: Token budget for the returned passages
+            top_k: Maximum number of passages to consider
+        
+        Returns:
+            Dict with 'text' (formatted passages, best first, or empty string),
+            'sources' (filename, position and score of each included passage),
+            'passages' (each formatted passage, for packing by a PromptBuilder),
+            'documents' (filename -> content version of the documents used) and
+            'indexed' (every document in the index when searched)
+        """
+        index = self.get_index()
+        indexed = sorted(index.get_document_versions())
+        passages = index.search(query, top_k=top_k)
+        
+        sections = []
+        sources = []
+        documents = {}
+        total_tokens = 0
+        for passage in passages:
+            section = f"## {passage['filename']} (bagian {passage['position'] + 1})\n\n{passage['text']}\n\n"
+            tokens = count_tokens(section)
+            if total_tokens + tokens > max_tokens:
+                continue
+            sections.append(section)
+            sources.append({"filename": passage["filename"], "position": passage["position"], "score": passage["score"]})
+            documents[passage["filename"]] = passage["version"]
+            total_tokens += tokens
+        
+        text = ""
+        if sections:
+            text = "=== MATERI PEMBELAJARAN ===\n\n" + "".join(sections) + "=== END MATERI ===\n\n"
+        return {"text": text, "sources": sources, "passages": sections, "documents": documents, "indexed": indexed}
+    
+    def get_relevant_materials_text(self, query: str, max_tokens: int = 1200, top_k: int = 6) -> str:
+        """
+        Get the material passages most relevant to a question as prompt text
+        
+        Args:
+            query: Student question
+            max_tokens: Token budget for the returned passages
+            top_k: Maximum number of passages to consider
         
-        # Sort by relevance
-        results.sort(key=lambda x: x['relevance'], reverse=True)
+        Returns:
+            Formatted passages (best first) or empty string if nothing matches
+        """
+        return self.get_relevant_materials(query, max_tokens=max_tokens, top_k=top_k)["text"]
+    
+    def search_materials(self, query: str, max_results: int = 3, window_chars: int = 400) -> List[Dict[str, Any]]:
+        """
+        Search for relevant content in materials based on query
+        
+        Uses the retrieval index: every query term (stemmed, stopwords removed)
+        is looked up in the precomputed postings, passages are ranked with
+        BM25 and the excerpt is cut around the densest cluster of query terms
+        in each document's best passage.
+        
+        Args:
+            query: Search query (keywords or a full question)
+            max_results: Maximum number of results to return (one per document)
+            window_chars: Excerpt length in characters
+        
+        Returns:
+            List of dicts with 'filename', 'excerpt', 'relevance' (BM25 score)
+            and 'position' (passage number), best first
+        """
+        results = []
+        seen = set()
+        for passage in self.get_index().search(query, top_k=max_results * 4):
+            if passage["filename"] in seen:
+                continue
+            seen.add(passage["filename"])
+            results.append({
+                "filename": passage["filename"],
+                "excerpt": f"...{find_excerpt(passage['text'], query, window_chars)}...",
+                "relevance": round(passage["score"], 3),
+                "position": passage["position"]
+            })
+            if len(results) >= max_results:
+                break
         
-        return results[:max_results]
+        return results
     
     def get_material_summary(self) -> str:
         """Get a summary of available materials"""
@@ -165,8 +521,9 @@ class MaterialReader:
         return summary
     
     def clear_cache(self):
-        """Clear the content cache"""
-        self._cache = {}
+        """Reload the retrieval index from disk"""
+        self._index = MaterialIndex(self.cache_dir / "index")
+        self._index_version = None
 
 
 # Global instance
@@ -0,0 +1,209 @@
+"""
+Material Store
+Compact, memory-mapped on-disk segments holding one document's passages and postings
+"""
+import os
+import mmap
+import struct
+import threading
+from array import array
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+MAGIC = b"MATSEG01"
+
+# Magic, then: num_chunks, num_terms, num_postings, total_length, and the
+# (offset, length) pair of each section in SECTIONS order
+_SECTIONS = (
+    "text_offsets",      # uint64[num_chunks + 1] byte offsets into text
+    "positions",         # uint32[num_chunks] passage position within the document
+    "lengths",           # uint32[num_chunks] passage length in terms
+    "text",              # UTF-8 blob of all passages
+    "term_offsets",      # uint64[num_terms + 1] byte offsets into terms
+    "terms",             # UTF-8 blob of all terms, sorted by their UTF-8 bytes
+    "posting_offsets",   # uint64[num_terms + 1] entry offsets into postings
+    "postings",          # uint32[2 * num_postings] interleaved (chunk, term frequency)
+)
+_HEADER = struct.Struct("<8sQQQQ" + "QQ" * len(_SECTIONS))
+
+
+def _align(offset: int) -> int:
+    """Round up to a multiple of 8 so typed views start aligned"""
+    return (offset + 7) & ~7
+
+
+def write_segment(path: Path, passages: List[Tuple[int, str, Dict[str, int]]]):
+    """
+    Write one document's passages and postings to a segment file
+    
+    Args:
+        path: Target file (written atomically)
+        passages: List of (position, text, {term: frequency}) per passage
+    """
+    text_offsets = array("Q", [0])
+    positions = array("I")
+    lengths = array("I")
+    text_parts = []
+    postings_by_term: Dict[bytes, List[Tuple[int, int]]] = {}
+    total_length = 0
+    
+    for chunk_id, (position, text, terms) in enumerate(passages):
+        encoded = text.encode("utf-8")
+        text_parts.append(encoded)
+        text_offsets.append(text_offsets[-1] + len(encoded))
+        positions.append(position)
+        length = sum(terms.values())
+        lengths.append(length)
+        total_length += length
+        for term, tf in terms.items():
+            postings_by_term.setdefault(term.encode("utf-8"), []).append((chunk_id, tf))
+    
+    term_offsets = array("Q", [0])
+    posting_offsets = array("Q", [0])
+    term_parts = []
+    postings = array("I")
+    for term in sorted(postings_by_term):
+        term_parts.append(term)
+        term_offsets.append(term_offsets[-1] + len(term))
+        for chunk_id, tf in postings_by_term[term]:
+            postings.append(chunk_id)
+            postings.append(tf)
+        posting_offsets.append(len(postings) // 2)
+    
+    sections = {
+        "text_offsets": text_offsets.tobytes(),
+        "positions": positions.tobytes(),
+        "lengths": lengths.tobytes(),
+        "text": b"".join(text_parts),
+        "term_offsets": term_offsets.tobytes(),
+        "terms": b"".join(term_parts),
+        "posting_offsets": posting_offsets.tobytes(),
+        "postings": postings.tobytes(),
+    }
+    
+    layout = []
+    offset = _align(_HEADER.size)
+    for name in _SECTIONS:
+        layout.extend([offset, len(sections[name])])
+        offset = _align(offset + len(sections[name]))
+    
+    header = _HEADER.pack(MAGIC, len(passages), len(term_parts), len(postings) // 2, total_length, *layout)
+    
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for name in _SECTIONS:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(sections[name])
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """
+    Read-only, memory-mapped view of a segment file
+    
+    Nothing is deserialized up front: passages, terms and postings are read
+    straight from the mapping (shared through the OS page cache by every
+    process that opens the same file).
+    """
+    
+    def __init__(self, path: Path):
+        """
+        Open a segment
+        
+        Args:
+            path: Segment file written by write_segment
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        fields = _HEADER.unpack_from(self._mmap, 0)
+        if fields[0] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"Not a material segment: {self.path}")
+        
+        self.num_chunks, self.num_terms, self.num_postings, self.total_length = fields[1:5]
+        self.size = len(self._mmap)
+        self._view = memoryview(self._mmap)
+        layout = fields[5:]
+        self._sections = {}
+        for i, name in enumerate(_SECTIONS):
+            offset, length = layout[2 * i], layout[2 * i + 1]
+            self._sections[name] = self._view[offset:offset + length]
+        
+        self._text_offsets = self._sections["text_offsets"].cast("Q")
+        self._positions = self._sections["positions"].cast("I")
+        self._lengths = self._sections["lengths"].cast("I")
+        self._term_offsets = self._sections["term_offsets"].cast("Q")
+        self._posting_offsets = self._sections["posting_offsets"].cast("Q")
+        self._postings = self._sections["postings"].cast("I")
+        self._text = self._sections["text"]
+        self._terms = self._sections["terms"]
+    
+    def chunk_text(self, chunk_id: int) -> str:
+        """Text of one passage"""
+        return bytes(self._text[self._text_offsets[chunk_id]:self._text_offsets[chunk_id + 1]]).decode("utf-8")
+    
+    def chunk_position(self, chunk_id: int) -> int:
+        """Position of a passage within its document"""
+        return self._positions[chunk_id]
+    
+    def chunk_length(self, chunk_id: int) -> int:
+        """Number of terms in a passage"""
+        return self._lengths[chunk_id]
+    
+    def _term_at(self, index: int) -> bytes:
+        """Term bytes at a position of the sorted term table"""
+        return bytes(self._terms[self._term_offsets[index]:self._term_offsets[index + 1]])
+    
+    def find_term(self, term: str) -> int:
+        """
+        Binary-search the sorted term table
+        
+        Args:
+            term: Search term
+        
+        Returns:
+            Term index, or -1 if the term does not occur in this segment
+        """
+        key = term.encode("utf-8")
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_terms and self._term_at(low) == key:
+            return low
+        return -1
+    
+    def postings(self, term_index: int) -> memoryview:
+        """
+        Postings of a term
+        
+        Args:
+            term_index: Index from find_term
+        
+        Returns:
+            Flat view of interleaved (chunk, term frequency) pairs
+        """
+        start, end = self._posting_offsets[term_index], self._posting_offsets[term_index + 1]
+        return self._postings[2 * start:2 * end]
+    
+    def close(self):
+        """Release the mapping"""
+        for name in ("_text_offsets", "_positions", "_lengths", "_term_offsets",
+                     "_posting_offsets", "_postings", "_text", "_terms"):
+            getattr(self, name).release()
+        for section in self._sections.values():
+            section.release()
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a view; the mapping is freed with it
+            pass
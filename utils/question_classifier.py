@@ -0,0 +1,335 @@
+"""
+Question Classifier
+Small local model for QuestionDetector: hashed n-grams + logistic regression
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import argparse
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy the keyword engine is used
+    np = None
+
+from .question_detector import QuestionDetector, QuestionType
+
+DEFAULT_MODEL_PATH = "data/models/question_classifier.npz"
+
+_WORD_PATTERN = re.compile(r"[\w']+")
+
+
+def extract_ngrams(text: str) -> List[str]:
+    """
+    Features of a question before hashing
+    
+    Word unigrams and bigrams, plus character 3- and 4-grams of every word
+    so inflected Indonesian forms (kodenya, mengurutkan) share features
+    with their stems.
+    
+    Args:
+        text: Question text
+    
+    Returns:
+        Feature strings (duplicates count)
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    features = ["\x00"]  # constant feature: no question has an empty row
+    features.extend("w" + word for word in words)
+    features.extend("b" + words[i] + " " + words[i + 1] for i in range(len(words) - 1))
+    for word in words:
+        padded = f"<{word}>"
+        for n in (3, 4):
+            features.extend("c" + padded[i:i + n] for i in range(len(padded) - n + 1))
+    return features
+
+
+class NgramClassifier:
+    """
+    Multinomial logistic regression over hashed n-gram features
+    
+    Features are hashed with CRC32 into a fixed number of buckets, so the
+    model is a single weight matrix (buckets x labels) and classifying a
+    question is a row gather and a softmax. Trained with mini-batch SGD on
+    labeled questions; no network access at any point.
+    """
+    
+    def __init__(
+        self,
+        labels: List[str],
+        dim: int = 2 ** 16,
+        weights: Optional["np.ndarray"] = None,
+        bias: Optional["np.ndarray"] = None
+    ):
+        """
+        Initialize classifier
+        
+        Args:
+            labels: Class names (QuestionType values)
+            dim: Number of hash buckets
+            weights: Trained weights (dim x labels), zeros if None
+            bias: Trained bias per label, zeros if None
+        """
+        if np is None:
+            raise ImportError("NgramClassifier requires numpy")
+        self.labels = list(labels)
+        self.dim = dim
+        self.weights = weights if weights is not None else np.zeros((dim, len(self.labels)), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(self.labels), dtype=np.float32)
+    
+    def featurize(self, text: str) -> "np.ndarray":
+        """Hash bucket index of every feature of a question"""
+        dim = self.dim
+        return np.fromiter(
+            (zlib.crc32(feature.encode("utf-8")) % dim for feature in extract_ngrams(text)),
+            dtype=np.int64
+        )
+    
+    def _logits(self, indices: "np.ndarray") -> "np.ndarray":
+        """Logits of one featurized question (features scaled by 1/sqrt(count))"""
+        return self.weights[indices].sum(axis=0) / math.sqrt(len(indices)) + self.bias
+    
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """
+        Class probabilities of a question
+        
+        Args:
+            text: Question text
+        
+        Returns:
+            Label -> probability
+        """
+        logits = self._logits(self.featurize(text))
+        exp = np.exp(logits - logits.max())
+        probs = exp / exp.sum()
+        return dict(zip(self.labels, probs.tolist()))
+    
+    def predict(self, text: str) -> str:
+        """Most likely label of a question"""
+        probs = self.predict_proba(text)
+        return max(probs, key=probs.get)
+    
+    def fit(
+        self,
+        texts: List[str],
+        labels: List[str],
+        epochs: int = 10,
+        learning_rate: float = 0.5,
+        l2: float = 1e-6,
+        batch_size: int = 64,
+        seed: int = 0
+    ) -> List[float]:
+        """
+        Train on labeled questions (continues from the current weights)
+        
+        Args:
+            texts: Questions
+            labels: Label per question (must be in self.labels)
+            epochs: Passes over the data
+            learning_rate: SGD step size
+            l2: Weight decay
+            batch_size: Questions per update
+            seed: Shuffle seed
+        
+        Returns:
+            Mean training loss per epoch
+        """
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        rows = [self.featurize(text) for text in texts]
+        targets = np.array([label_index[label] for label in labels], dtype=np.int64)
+        order = list(range(len(rows)))
+        rng = random.Random(seed)
+        history = []
+        
+        for _ in range(epochs):
+            rng.shuffle(order)
+            total_loss = 0.0
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                lengths = np.array([len(rows[i]) for i in batch])
+                indices = np.concatenate([rows[i] for i in batch])
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+                scale = (1.0 / np.sqrt(lengths))[:, None]
+                
+                # Forward: gather rows of the weight matrix and sum per question
+                logits = np.add.reduceat(self.weights[indices], offsets, axis=0) * scale + self.bias
+                logits -= logits.max(axis=1, keepdims=True)
+                probs = np.exp(logits)
+                probs /= probs.sum(axis=1, keepdims=True)
+                y = targets[batch]
+                total_loss += float(-np.log(probs[np.arange(len(batch)), y] + 1e-12).sum())
+                
+                # Backward: softmax gradient scattered back to the hashed rows
+                grad = probs
+                grad[np.arange(len(batch)), y] -= 1.0
+                grad /= len(batch)
+                self.bias -= learning_rate * grad.sum(axis=0)
+                np.add.at(self.weights, indices, -learning_rate * np.repeat(grad * scale, lengths, axis=0))
+                if l2:
+                    touched = np.unique(indices)
+                    self.weights[touched] *= 1.0 - learning_rate * l2
+            history.append(total_loss / max(len(order), 1))
+        return history
+    
+    def save(self, path: str):
+        """Write the model to a .npz file"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            weights=self.weights,
+            bias=self.bias,
+            labels=np.array(self.labels),
+            dim=np.array(self.dim)
+        )
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> "NgramClassifier":
+        """Read a model written by save()"""
+        if np is None:
+            raise ImportError("NgramClassifier requires numpy")
+        with np.load(path) as data:
+            return cls(
+                labels=[str(label) for label in data["labels"]],
+                dim=int(data["dim"]),
+                weights=data["weights"].astype(np.float32),
+                bias=data["bias"].astype(np.float32)
+            )
+
+
+class ModelEngine:
+    """QuestionDetector engine backed by an NgramClassifier"""
+    
+    name = "model"
+    # Probability above which a question is treated as homework
+    homework_threshold = 0.5
+    
+    def __init__(self, classifier: NgramClassifier):
+        """
+        Initialize engine
+        
+        Args:
+            classifier: Trained classifier
+        """
+        self.classifier = classifier
+    
+    def scores(self, question_lower: str) -> Dict[str, float]:
+        """Probability per QuestionType value"""
+        return self.classifier.predict_proba(question_lower)
+
+
+def load_engine(path: Optional[str] = None) -> Optional[ModelEngine]:
+    """
+    Load the model engine if a model file is present
+    
+    Args:
+        path: Model file (default: QUESTION_MODEL_PATH or data/models/question_classifier.npz)
+    
+    Returns:
+        ModelEngine, or None (keyword rules) if NumPy or the model file is missing
+    """
+    path = path or os.getenv("QUESTION_MODEL_PATH", DEFAULT_MODEL_PATH)
+    if np is None or not os.path.exists(path):
+        return None
+    try:
+        return ModelEngine(NgramClassifier.load(path))
+    except Exception as e:
+        print(f"Could not load question model {path}: {e}")
+        return None
+
+
+def iter_labeled_file(path: str) -> Iterable[Dict[str, Any]]:
+    """
+    Read hand-labeled questions
+    
+    Args:
+        path: JSONL file with one {"question": ..., "label": ...} per line
+    
+    Yields:
+        Dicts with 'question' and 'label'
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("question") and record.get("label"):
+                yield {"question": record["question"], "label": record["label"]}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """CLI entry point: python -m utils.question_classifier"""
+    from .question_corpus import iter_analytics_questions, format_confusion
+    
+    parser = argparse.ArgumentParser(description="Train the local question classifier from labeled chat logs")
+    parser.add_argument("--labels", action="append", default=[], help="JSONL file with question/label pairs (repeatable)")
+    parser.add_argument("--analytics", action="store_true",
+                        help="Also train on logged questions labeled with the keyword rules' own types (weak labels: training only, never in the holdout)")
+    parser.add_argument("--events-file", default="logs/analytics_events.jsonl", help="Analytics event log")
+    parser.add_argument("--output", default=os.getenv("QUESTION_MODEL_PATH", DEFAULT_MODEL_PATH), help="Model file to write")
+    parser.add_argument("--dim", type=int, default=2 ** 16, help="Hash buckets")
+    parser.add_argument("--epochs", type=int, default=10, help="Training passes")
+    parser.add_argument("--holdout", type=float, default=0.1, help="Share of questions kept for evaluation")
+    args = parser.parse_args(argv)
+    
+    if np is None:
+        print("numpy is required to train the classifier", file=sys.stderr)
+        return 1
+    
+    known = {qt.value for qt in QuestionType}
+    records = []
+    for path in args.labels:
+        records.extend(r for r in iter_labeled_file(path) if r["label"] in known)
+    # Analytics types were produced by the keyword rules, false positives
+    # included: scoring the rules against them would measure nothing
+    weak_records = []
+    if args.analytics:
+        weak_records = [r for r in iter_analytics_questions(args.events_file) if r["label"] in known]
+    if not records and not weak_records:
+        print("No labeled questions found", file=sys.stderr)
+        return 1
+    
+    random.Random(0).shuffle(records)
+    held = int(len(records) * args.holdout)
+    train, test = records[held:] + weak_records, records[:held]
+    if not test:
+        print("No hand-labeled holdout (--labels): accuracy is not reported")
+    
+    classifier = NgramClassifier([qt.value for qt in QuestionType], dim=args.dim)
+    start = time.perf_counter()
+    losses = classifier.fit([r["question"] for r in train], [r["label"] for r in train], epochs=args.epochs)
+    print(f"Trained on {len(train)} questions ({len(weak_records)} weak labels) in {time.perf_counter() - start:.1f}s (loss {losses[0]:.3f} -> {losses[-1]:.3f})")
+    
+    if test:
+        keyword_detector = QuestionDetector()
+        confusion: Dict[str, Dict[str, int]] = {}
+        correct = keyword_correct = 0
+        start = time.perf_counter()
+        for record in test:
+            predicted = classifier.predict(record["question"])
+            correct += predicted == record["label"]
+            row = confusion.setdefault(record["label"], {})
+            row[predicted] = row.get(predicted, 0) + 1
+        per_question = (time.perf_counter() - start) / len(test)
+        for record in test:
+            keyword_correct += keyword_detector.detect(record["question"])["type"].value == record["label"]
+        print(f"Holdout: {correct / len(test):.1%} accuracy (keyword rules: {keyword_correct / len(test):.1%}), "
+              f"{per_question * 1e6:.0f} us/question")
+        print(format_confusion(confusion, corner="label \\ prediksi"))
+    
+    classifier.save(args.output)
+    print(f"Saved {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
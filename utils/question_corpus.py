@@ -0,0 +1,180 @@
+"""
+Question Corpus
+Re-classify logged student questions offline and compare with earlier labels
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterable, Iterator
+
+from .question_detector import QuestionDetector, QuestionType
+
+
+def iter_chat_history(history_dir: str = "chat_history") -> Iterator[Dict[str, Any]]:
+    """
+    Read student questions from saved chat files (chat_history/*.json)
+    
+    Args:
+        history_dir: Directory written by the chat page's "Simpan" button
+    
+    Yields:
+        Dicts with 'question', 'label' (always None, files keep no type) and 'source'
+    """
+    for path in sorted(Path(history_dir).glob("*.json")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                messages = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+            continue
+        for msg in messages if isinstance(messages, list) else []:
+            if isinstance(msg, dict) and msg.get("role") == "user" and msg.get("content"):
+                yield {"question": msg["content"], "label": None, "source": path.name}
+
+
+def iter_analytics_questions(events_file: str = "logs/analytics_events.jsonl") -> Iterator[Dict[str, Any]]:
+    """
+    Read logged questions and their detected types from the analytics event log
+    
+    Only chat events logged with the question text are returned.
+    
+    Args:
+        events_file: Append-only analytics log
+    
+    Yields:
+        Dicts with 'question', 'label' (QuestionType value at the time) and 'source' (timestamp)
+    """
+    if not os.path.exists(events_file):
+        return
+    with open(events_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # partially written last line
+            if event.get("type") == "chat" and event.get("question"):
+                yield {"question": event["question"], "label": event.get("question_type"), "source": event.get("ts")}
+
+
+def evaluate_corpus(
+    records: Iterable[Dict[str, Any]],
+    detector: Optional[QuestionDetector] = None,
+    workers: int = 1,
+    chunk_size: int = 2000
+) -> Dict[str, Any]:
+    """
+    Classify a corpus and summarize the result
+    
+    Args:
+        records: Dicts with 'question' and optional 'label' (earlier type)
+        detector: Detector to evaluate (default: current keyword rules)
+        workers: Worker processes for detect_batch
+        chunk_size: Questions per worker task
+    
+    Returns:
+        Dict with 'total', 'counts' (per type), 'homework', 'needs_code_analysis',
+        'labeled', 'agreement' (share of labeled questions whose type is
+        unchanged), 'confusion' (earlier label -> new type -> count),
+        'elapsed' and 'per_second'
+    """
+    detector = detector or QuestionDetector()
+    labels = deque()
+    
+    def questions():
+        for record in records:
+            labels.append(record.get("label"))
+            yield record["question"]
+    
+    counts = {qt.value: 0 for qt in QuestionType}
+    confusion: Dict[str, Dict[str, int]] = {}
+    total = homework = needs_code = labeled = agreed = 0
+    
+    start = time.perf_counter()
+    for result in detector.detect_batch(questions(), workers=workers, chunk_size=chunk_size):
+        label = labels.popleft()
+        new_type = result["type"].value
+        total += 1
+        counts[new_type] += 1
+        homework += result["is_homework"]
+        needs_code += result["needs_code_analysis"]
+        if label:
+            labeled += 1
+            agreed += label == new_type
+            row = confusion.setdefault(label, {})
+            row[new_type] = row.get(new_type, 0) + 1
+    elapsed = time.perf_counter() - start
+    
+    return {
+        "total": total,
+        "counts": counts,
+        "homework": homework,
+        "needs_code_analysis": needs_code,
+        "labeled": labeled,
+        "agreement": agreed / labeled if labeled else None,
+        "confusion": confusion,
+        "elapsed": elapsed,
+        "per_second": total / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def format_confusion(confusion: Dict[str, Dict[str, int]], corner: str = "lama \\ baru") -> str:
+    """
+    Render a confusion table (rows: earlier label, columns: new type)
+    
+    Args:
+        confusion: evaluate_corpus()['confusion'] or any label -> type -> count
+        corner: Header of the row label column
+    
+    Returns:
+        Plain-text table
+    """
+    types = [qt.value for qt in QuestionType]
+    rows = [label for label in types if label in confusion] + sorted(set(confusion) - set(types))
+    width = max([len(t) for t in types] + [len(r) for r in rows] + [6])
+    lines = [corner.ljust(width) + " " + " ".join(t.rjust(width) for t in types)]
+    for label in rows:
+        cells = " ".join(str(confusion[label].get(t, 0)).rjust(width) for t in types)
+        lines.append(label.ljust(width) + " " + cells)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """CLI entry point: python -m utils.question_corpus"""
+    parser = argparse.ArgumentParser(description="Re-classify logged questions with the current QuestionDetector rules")
+    parser.add_argument("--source", choices=["all", "chat_history", "analytics"], default="all", help="Where to read questions from")
+    parser.add_argument("--chat-history-dir", default="chat_history", help="Directory with saved chat JSON files")
+    parser.add_argument("--events-file", default="logs/analytics_events.jsonl", help="Analytics event log")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Questions per worker task")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+    
+    def records():
+        if args.source in ("all", "analytics"):
+            yield from iter_analytics_questions(args.events_file)
+        if args.source in ("all", "chat_history"):
+            yield from iter_chat_history(args.chat_history_dir)
+    
+    summary = evaluate_corpus(records(), workers=args.workers, chunk_size=args.chunk_size)
+    
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+    
+    print(f"{summary['total']} pertanyaan dalam {summary['elapsed']:.2f}s ({summary['per_second']:.0f}/s)")
+    for qtype, count in summary["counts"].items():
+        share = count / summary["total"] if summary["total"] else 0
+        print(f"  {qtype:<12} {count:>8} ({share:.1%})")
+    print(f"  homework flag: {summary['homework']}, needs code analysis: {summary['needs_code_analysis']}")
+    if summary["labeled"]:
+        print(f"\nDibandingkan dengan label lama ({summary['labeled']} pertanyaan, sama: {summary['agreement']:.1%}):")
+        print(format_confusion(summary["confusion"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,13 @@ Question Type Detector
 Mendeteksi jenis pertanyaan dari user untuk memberikan respons yang sesuai
 """
 import re
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from typing import Dict, Any, List
+from itertools import islice
+from typing import Dict, Any, List, Tuple, Optional, Iterable, Iterator
 
 
 class QuestionType(Enum):
@@ -17,61 +22,263 @@ class QuestionType(Enum):
     GENERAL = "general"  # Pertanyaan umum
 
 
+# Category names of the keyword rules
+_HOMEWORK = QuestionType.HOMEWORK.value
+_CONCEPT = QuestionType.CONCEPT.value
+_CODE = QuestionType.CODE.value
+_DEBUGGING = QuestionType.DEBUGGING.value
+_SIMULATION = QuestionType.SIMULATION.value
+_GENERAL = QuestionType.GENERAL.value
+
+# Rule syntax: alternatives separated by "|"; an alternative is a sequence of
+# whole words/phrases separated by " ... " (any text in between, in order);
+# "(a|b)" inside a sequence accepts either phrase at that step.
+GAP = " ... "
+
+
+class KeywordMatcher:
+    """
+    All keyword rules compiled into one word-level automaton
+    
+    Every phrase of every rule is indexed by its first word. Matching
+    tokenizes the lowercased text with one regex pass and does a single
+    dictionary lookup per word, so the cost per message does not grow with
+    the number of rules or categories. Only rules that use a phrase that
+    was hit are evaluated afterwards.
+    """
+    
+    WORD_PATTERN = re.compile(r"[\w']+")
+    
+    def __init__(self, categories: Dict[str, List[str]]):
+        """
+        Compile rules
+        
+        Args:
+            categories: Category name -> list of rules (see GAP for the syntax)
+        """
+        self.rule_counts = {name: len(rules) for name, rules in categories.items()}
+        # rules[i] = (category, alternatives); an alternative is a list of steps,
+        # a step is a tuple of accepted phrases
+        self.rules: List[Tuple[str, List[List[Tuple[str, ...]]]]] = []
+        # phrase -> indexes of rules using it
+        self.phrase_rules: Dict[str, List[int]] = {}
+        
+        for name, rules in categories.items():
+            for rule in rules:
+                alternatives = [self._parse_alternative(alt) for alt in re.split(r"\|(?![^(]*\))", rule)]
+                index = len(self.rules)
+                self.rules.append((name, alternatives))
+                for steps in alternatives:
+                    for step in steps:
+                        for phrase in step:
+                            users = self.phrase_rules.setdefault(phrase, [])
+                            if index not in users:
+                                users.append(index)
+        
+        # first word -> [(phrase words, phrase)], longest phrase first
+        self.first_words: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        for phrase in sorted(self.phrase_rules, key=len, reverse=True):
+            words = tuple(self.WORD_PATTERN.findall(phrase))
+            if words:
+                self.first_words.setdefault(words[0], []).append((words, phrase))
+    
+    @staticmethod
+    def _parse_alternative(alternative: str) -> List[Tuple[str, ...]]:
+        """'(a|b) ... c' -> [('a', 'b'), ('c',)]"""
+        steps = []
+        for step in alternative.strip().split(GAP.strip()):
+            step = step.strip()
+            if step.startswith("(") and step.endswith(")"):
+                steps.append(tuple(p.strip() for p in step[1:-1].split("|")))
+            else:
+                steps.append((step,))
+        return steps
+    
+    def scan(self, text: str) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Find phrase hits in one pass
+        
+        Args:
+            text: Lowercased text
+        
+        Returns:
+            Phrase -> list of (start, end) spans, in text order
+        """
+        tokens = list(self.WORD_PATTERN.finditer(text))
+        words = [token.group() for token in tokens]
+        hits: Dict[str, List[Tuple[int, int]]] = {}
+        first_words = self.first_words
+        for i, word in enumerate(words):
+            candidates = first_words.get(word)
+            if not candidates:
+                continue
+            for phrase_words, phrase in candidates:
+                last = i + len(phrase_words) - 1
+                if last < len(words) and (len(phrase_words) == 1 or tuple(words[i:last + 1]) == phrase_words):
+                    hits.setdefault(phrase, []).append((tokens[i].start(), tokens[last].end()))
+        return hits
+    
+    @staticmethod
+    def _sequence_matches(steps: List[Tuple[str, ...]], hits: Dict[str, List[Tuple[int, int]]]) -> bool:
+        """Whether the steps occur in order (earliest possible hit per step)"""
+        position = 0
+        for step in steps:
+            best = None
+            for phrase in step:
+                for start, end in hits.get(phrase, ()):
+                    if start >= position:
+                        if best is None or end < best:
+                            best = end
+                        break
+            if best is None:
+                return False
+            position = best
+        return True
+    
+    def match(self, text: str) -> Dict[str, int]:
+        """
+        Count matched rules per category
+        
+        Args:
+            text: Lowercased text
+        
+        Returns:
+            Category -> number of its rules that matched
+        """
+        hits = self.scan(text)
+        counts = dict.fromkeys(self.rule_counts, 0)
+        candidates = sorted({index for phrase in hits for index in self.phrase_rules[phrase]})
+        for index in candidates:
+            name, alternatives = self.rules[index]
+            for steps in alternatives:
+                if self._sequence_matches(steps, hits):
+                    counts[name] += 1
+                    break
+        return counts
+    
+    def scores(self, text: str) -> Dict[str, float]:
+        """
+        Fraction of each category's rules that matched (0-1)
+        
+        Args:
+            text: Lowercased text
+        
+        Returns:
+            Category -> score
+        """
+        counts = self.match(text)
+        return {
+            name: min(counts[name] / total, 1.0) if total else 0.0
+            for name, total in self.rule_counts.items()
+        }
+
+
 class QuestionDetector:
     """Deteksi jenis pertanyaan dari input user"""
     
-    # Keywords untuk setiap tipe pertanyaan
+    # Keywords untuk setiap tipe pertanyaan (sintaks: lihat GAP)
     CONCEPT_KEYWORDS = [
-        r'\b(apa itu|jelaskan|pengertian|definisi|konsep|cara kerja|prinsip|teori)\b',
-        r'\b(bagaimana.*bekerja|kenapa|mengapa|kapan digunakan)\b',
-        r'\b(perbedaan|perbandingan|kelebihan|kekurangan|vs)\b',
-        r'\b(time complexity|space complexity|big o|kompleksitas)\b',
+        "apa itu|jelaskan|pengertian|definisi|konsep|cara kerja|prinsip|teori",
+        "bagaimana ... bekerja|kenapa|mengapa|kapan digunakan",
+        "perbedaan|perbandingan|kelebihan|kekurangan|vs",
+        "time complexity|space complexity|big o|kompleksitas",
     ]
     
     CODE_KEYWORDS = [
-        r'\b(kode|code|implementasi|program|script|syntax)\b',
-        r'\b(buat|bikin|tulis|write|coding|ngoding)\b',
-        r'\b(contoh.*kode|code.*example|sample.*code)\b',
-        r'\b(gimana.*ngoding|cara.*coding|how.*to.*code)\b',
+        "kode|code|implementasi|program|script|syntax",
+        "buat|bikin|tulis|write|coding|ngoding",
+        "contoh ... kode|code ... example|sample ... code",
+        "gimana ... ngoding|cara ... coding|how ... to ... code",
     ]
     
     DEBUGGING_KEYWORDS = [
-        r'\b(error|bug|salah|tidak jalan|gak jalan|gak bisa)\b',
-        r'\b(perbaiki|fix|benerin|debug|troubleshoot)\b',
-        r'\b(kenapa.*error|why.*error|mengapa.*error)\b',
-        r'\b(stack trace|exception|traceback)\b',
-        r'\b(tidak.*bekerja|doesn\'t work|gak.*work)\b',
+        "error|bug|salah|tidak jalan|gak jalan|gak bisa",
+        "perbaiki|fix|benerin|debug|troubleshoot",
+        "kenapa ... error|why ... error|mengapa ... error",
+        "stack trace|exception|traceback",
+        "tidak ... bekerja|doesn't work|gak ... work",
     ]
     
     HOMEWORK_KEYWORDS = [
-        r'\b(tugas|homework|assignment|pr|pekerjaan rumah)\b',
-        r'\b(ujian|exam|test|quiz|kuis|uts|uas)\b',
-        r'\b(soal|latihan|exercise|problem set)\b',
-        r'\b(deadline|dikumpulkan|submit|kumpul)\b',
-        r'\b(nilai|grade|skor|point)\b',
-        r'\b(tolong.*buatkan|bikinin|jawaban|solution)\b',
+        "tugas|homework|assignment|pr|pekerjaan rumah",
+        "ujian|exam|test|quiz|kuis|uts|uas",
+        "soal|latihan|exercise|problem set",
+        "deadline|dikumpulkan|submit|kumpul",
+        "nilai|grade|skor|point",
+        "tolong ... buatkan|bikinin|jawaban|solution",
     ]
     
     SIMULATION_KEYWORDS = [
-        r'\b(simulasi|simulate|trace|jalankan|run through)\b',
-        r'\b(step.*by.*step|langkah.*demi.*langkah|tahap.*tahap)\b',
-        r'\b(proses|eksekusi|execution|running)\b',
-        r'\b(trace.*tabel|trace.*table|tabel.*trace)\b',
-        r'\b(contoh.*proses|example.*process|show.*how)\b',
+        "simulasi|simulate|trace|jalankan|run through",
+        "step ... by ... step|langkah ... demi ... langkah|tahap ... tahap",
+        "proses|eksekusi|execution|running",
+        "trace ... tabel|trace ... table|tabel ... trace",
+        "contoh ... proses|example ... process|show ... how",
     ]
     
     # Indikator upload file kode
     CODE_UPLOAD_INDICATORS = [
-        r'(file|kode|program|script).*(ini|itu|yang|uploaded)',
-        r'(ini|itu).*kode',
-        r'lihat.*kode',
-        r'analisa.*kode',
-        r'review.*kode',
+        "(file|filenya|kode|kodenya|program|programnya|script) ... (ini|itu|yang|uploaded)",
+        "(ini|itu) ... (kode|kodenya)",
+        "lihat ... (kode|kodenya)",
+        "(analisa|analisis|analisakan) ... (kode|kodenya)",
+        "review ... (kode|kodenya)",
     ]
     
-    def __init__(self):
-        """Initialize detector"""
-        pass
+    # Compiled once per class (see KeywordMatcher); built on first use
+    _default_matcher: Optional[KeywordMatcher] = None
+    
+    @classmethod
+    def keyword_categories(cls) -> Dict[str, List[str]]:
+        """Keyword rules per category name ('upload' = code upload indicators)"""
+        return {
+            _HOMEWORK: cls.HOMEWORK_KEYWORDS,
+            _DEBUGGING: cls.DEBUGGING_KEYWORDS,
+            _SIMULATION: cls.SIMULATION_KEYWORDS,
+            _CODE: cls.CODE_KEYWORDS,
+            _CONCEPT: cls.CONCEPT_KEYWORDS,
+            "upload": cls.CODE_UPLOAD_INDICATORS,
+        }
+    
+    # Keyword score above which a question counts as homework
+    HOMEWORK_THRESHOLD = 0.3
+    
+    def __init__(self, categories: Optional[Dict[str, List[str]]] = None, engine=None):
+        """
+        Initialize detector
+        
+        Args:
+            categories: Custom keyword rules (default: the class keyword lists,
+                compiled once and shared by every detector)
+            engine: Optional classification engine replacing the keyword scores,
+                e.g. question_classifier.ModelEngine. Needs a 'name', a
+                'homework_threshold' and scores(question_lower) returning a
+                score per QuestionType value. None = keyword rules.
+        """
+        self.engine = engine
+        self.categories = categories if categories is not None else self.keyword_categories()
+        if categories is not None:
+            self.matcher = KeywordMatcher(categories)
+        else:
+            cls = type(self)
+            if cls.__dict__.get("_default_matcher") is None:
+                cls._default_matcher = KeywordMatcher(cls.keyword_categories())
+            self.matcher = cls._default_matcher
+    
+    @classmethod
+    def from_env(cls) -> "QuestionDetector":
+        """
+        Create detector using the local question model when one is available
+        
+        Loads QUESTION_MODEL_PATH (default data/models/question_classifier.npz,
+        written by python -m utils.question_classifier). Without NumPy or a
+        model file the keyword rules are used.
+        
+        Returns:
+            Configured QuestionDetector instance
+        """
+        from .question_classifier import load_engine
+        return cls(engine=load_engine())
     
     def detect(self, question: str, has_uploaded_file: bool = False) -> Dict[str, Any]:
         """
@@ -89,17 +296,25 @@ class QuestionDetector:
             - needs_code_analysis: bool
             - reasoning: str (penjelasan deteksi)
         """
+        # One scan scores every category (upload indicators always come from the rules)
         question_lower = question.lower()
+        keyword_scores = self.matcher.scores(question_lower)
+        if self.engine is not None:
+            category_scores = self.engine.scores(question_lower)
+            homework_threshold = self.engine.homework_threshold
+        else:
+            category_scores = keyword_scores
+            homework_threshold = self.HOMEWORK_THRESHOLD
         
         # Check homework first (highest priority)
-        homework_score = self._calculate_score(question_lower, self.HOMEWORK_KEYWORDS)
-        is_homework = homework_score > 0.3
+        homework_score = category_scores.get(_HOMEWORK, 0.0)
+        is_homework = homework_score > homework_threshold
         
         # Check other types
-        concept_score = self._calculate_score(question_lower, self.CONCEPT_KEYWORDS)
-        code_score = self._calculate_score(question_lower, self.CODE_KEYWORDS)
-        debug_score = self._calculate_score(question_lower, self.DEBUGGING_KEYWORDS)
-        simulation_score = self._calculate_score(question_lower, self.SIMULATION_KEYWORDS)
+        concept_score = category_scores.get(_CONCEPT, 0.0)
+        code_score = category_scores.get(_CODE, 0.0)
+        debug_score = category_scores.get(_DEBUGGING, 0.0)
+        simulation_score = category_scores.get(_SIMULATION, 0.0)
         
         # Boost debugging score if file uploaded
         if has_uploaded_file:
@@ -107,7 +322,7 @@ class QuestionDetector:
             code_score += 0.2
         
         # Check if question mentions uploaded code
-        needs_code_analysis = has_uploaded_file or self._check_code_upload_mention(question_lower)
+        needs_code_analysis = has_uploaded_file or keyword_scores.get("upload", 0.0) > 0
         
         # Determine question type
         scores = {
@@ -117,6 +332,9 @@ class QuestionDetector:
             QuestionType.CODE: code_score,
             QuestionType.CONCEPT: concept_score,
         }
+        # Engines that model the general class compete with it directly
+        if _GENERAL in category_scores:
+            scores[QuestionType.GENERAL] = category_scores[_GENERAL]
         
         # Get highest score
         if max(scores.values()) < 0.2:
@@ -126,6 +344,11 @@ class QuestionDetector:
             question_type = max(scores, key=scores.get)
             confidence = scores[question_type]
         
+        # A model's softmax can rank homework first below its threshold; the
+        # top class decides, so a homework-typed question is never answered
+        if self.engine is not None and question_type == QuestionType.HOMEWORK:
+            is_homework = True
+        
         # Build reasoning
         reasoning = self._build_reasoning(
             question_type, 
@@ -140,27 +363,58 @@ class QuestionDetector:
             "is_homework": is_homework,
             "needs_code_analysis": needs_code_analysis,
             "reasoning": reasoning,
-            "scores": {k.value: v for k, v in scores.items()}
+            "scores": {k.value: v for k, v in scores.items()},
+            "engine": self.engine.name if self.engine is not None else "keyword"
         }
     
-    def _calculate_score(self, text: str, keyword_patterns: List[str]) -> float:
-        """Calculate matching score for keyword patterns"""
-        matches = 0
-        for pattern in keyword_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                matches += 1
-        
-        # Normalize to 0-1
-        if len(keyword_patterns) == 0:
-            return 0.0
-        return min(matches / len(keyword_patterns), 1.0)
-    
-    def _check_code_upload_mention(self, text: str) -> bool:
-        """Check if question mentions uploaded code"""
-        for pattern in self.CODE_UPLOAD_INDICATORS:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True
-        return False
+    def detect_batch(
+        self,
+        questions: Iterable[str],
+        has_uploaded_file: bool = False,
+        workers: int = 1,
+        chunk_size: int = 2000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Deteksi banyak pertanyaan sekaligus (mis. re-klasifikasi log)
+        
+        Questions are consumed lazily and results are yielded in input order,
+        so arbitrarily large corpora stream in bounded memory. With workers > 1
+        chunks are classified in worker processes, each compiling the same
+        keyword rules once.
+        
+        Args:
+            questions: Iterable of question texts
+            has_uploaded_file: Passed to detect() for every question
+            workers: Worker processes (1 = classify in this process)
+            chunk_size: Questions per worker task
+            
+        Yields:
+            detect() result per question
+        """
+        if workers <= 1:
+            for question in questions:
+                yield self.detect(question, has_uploaded_file)
+            return
+        
+        iterator = iter(questions)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_batch_worker,
+            initargs=(self.categories, self.engine)
+        ) as pool:
+            pending = deque()
+            while True:
+                # Keep a bounded window of chunks in flight
+                while len(pending) < workers * 2:
+                    chunk = list(islice(iterator, chunk_size))
+                    if not chunk:
+                        break
+                    pending.append(pool.submit(_detect_chunk, chunk, has_uploaded_file))
+                if not pending:
+                    return
+                yield from pending.popleft().result()
     
     def _build_reasoning(
         self, 
@@ -283,8 +537,107 @@ ANALISIS KODE:
         return strategy
 
 
+# Detector of a batch worker process (see QuestionDetector.detect_batch)
+_batch_detector: Optional[QuestionDetector] = None
+
+def _init_batch_worker(categories: Dict[str, List[str]], engine):
+    """Compile the keyword rules once per worker process"""
+    global _batch_detector
+    _batch_detector = QuestionDetector(categories, engine)
+
+
+def _detect_chunk(questions: List[str], has_uploaded_file: bool) -> List[Dict[str, Any]]:
+    """Classify one chunk in a worker process"""
+    return [_batch_detector.detect(question, has_uploaded_file) for question in questions]
+
+
+def _rule_to_regex(rule: str) -> str:
+    """Equivalent standalone regex of a rule (reference for benchmarks)"""
+    alternatives = []
+    for alternative in re.split(r"\|(?![^(]*\))", rule):
+        steps = [
+            "(?:" + "|".join(re.escape(p) for p in step) + ")"
+            for step in KeywordMatcher._parse_alternative(alternative)
+        ]
+        alternatives.append(".*".join(steps))
+    return r"\b(?:" + "|".join(alternatives) + r")\b"
+
+
+def benchmark_detection(
+    messages: Optional[List[str]] = None,
+    repeat: int = 200,
+    scales: Tuple[int, ...] = (1, 4, 16)
+) -> List[Dict[str, Any]]:
+    """
+    Measure per-message scoring cost as the number of rules grows
+    
+    Each scale multiplies every category's rules with synthetic rules of
+    unused words, then times the combined scanner against one re.search
+    per rule (the previous approach) over the same messages.
+    
+    Args:
+        messages: Sample questions (default: a built-in mix)
+        repeat: Passes over the messages per measurement
+        scales: Rule multipliers to measure
+    
+    Returns:
+        List of dicts with 'scale', 'rules', 'combined_us' and 'per_rule_us'
+        (microseconds per message)
+    """
+    messages = [m.lower() for m in (messages or [
+        "Jelaskan apa itu binary search dan kompleksitasnya",
+        "Kenapa kode bubble sort saya error? ada traceback IndexError",
+        "Tolong buatkan jawaban soal ujian UTS, deadline besok",
+        "Simulasikan step by step quicksort dengan array [5, 2, 8, 1]",
+        "Halo, selamat pagi!",
+        "Bagaimana cara kerja dijkstra kalau bobotnya negatif? " * 4,
+    ])]
+    results = []
+    base = QuestionDetector.keyword_categories()
+    for scale in scales:
+        categories = {
+            name: rules + [
+                f"zq{name}{i}a|zq{name}{i}b ... zq{name}{i}c"
+                for i in range(len(rules) * (scale - 1))
+            ]
+            for name, rules in base.items()
+        }
+        matcher = KeywordMatcher(categories)
+        patterns = [re.compile(_rule_to_regex(rule)) for rules in categories.values() for rule in rules]
+        
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for message in messages:
+                matcher.match(message)
+        combined = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for message in messages:
+                for pattern in patterns:
+                    pattern.search(message)
+        per_rule = time.perf_counter() - start
+        
+        calls = repeat * len(messages)
+        results.append({
+            "scale": scale,
+            "rules": len(patterns),
+            "combined_us": combined / calls * 1e6,
+            "per_rule_us": per_rule / calls * 1e6
+        })
+    return results
+
+
 # Example usage and testing
 if __name__ == "__main__":
+    import sys
+    
+    if "--benchmark" in sys.argv:
+        print(f"{'rules':>6} {'combined (us)':>14} {'per rule (us)':>14}")
+        for row in benchmark_detection():
+            print(f"{row['rules']:>6} {row['combined_us']:>14.1f} {row['per_rule_us']:>14.1f}")
+        sys.exit(0)
+    
     detector = QuestionDetector()
     
     # Test cases
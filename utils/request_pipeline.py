@@ -0,0 +1,163 @@
+"""
+Request Pipeline
+Cheap checks that can answer a chat message from templates, and per-stage timings
+"""
+import re
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+
+# Replies produced without retrieval, prompt assembly or an LLM call
+EMPTY_REPLY = """Sepertinya pesanmu kosong 🙂
+
+Tuliskan pertanyaan tentang algoritma atau pemrograman, misalnya:
+- "Jelaskan cara kerja binary search"
+- "Kenapa bubble sort kompleksitasnya O(n²)?"
+"""
+
+GREETING_REPLY = """Halo! 👋 Saya asisten pembelajaran Algoritma & Pemrograman.
+
+Saya bisa membantu kamu:
+- Memahami **konsep** algoritma dan struktur data
+- **Men-trace** jalannya algoritma langkah demi langkah
+- Mencari **letak masalah** di kodemu lewat pertanyaan pemandu
+
+Mau mulai dari topik apa?"""
+
+THANKS_REPLY = """Sama-sama! 😊 Kalau masih ada yang ingin dibahas tentang algoritma atau kodemu, tanyakan saja."""
+
+HOMEWORK_REPLY = """
+🚫 **Maaf, saya tidak bisa membantu mengerjakan tugas atau ujian secara langsung.**
+
+Ini adalah chatbot pembelajaran yang dirancang untuk **membimbing proses berpikir**, bukan memberikan jawaban siap pakai.
+
+**Yang bisa saya lakukan:**
+- Menjelaskan **konsep** yang mendasari tugas kamu
+- Membantu kamu **memahami algoritma** yang relevan
+- Memberikan **pertanyaan pemandu** untuk arahkan cara berpikir
+- Diskusi tentang **pendekatan** yang bisa dicoba
+
+**Coba tanyakan seperti ini:**
+- "Jelaskan konsep [topik] yang dipakai dalam tugas ini"
+- "Bagaimana cara kerja algoritma [nama algoritma]?"
+- "Apa pendekatan yang bisa saya pakai untuk soal seperti ini?"
+
+Mari belajar bersama! 🎓
+"""
+
+# Appended by the chat page when a stream broke midway (such answers are retried, never replayed)
+TRUNCATED_NOTE = "⚠️ *Respons terputus"
+
+DUPLICATE_NOTE = "\n\n<sub>*🔁 Pertanyaan sama dengan sebelumnya, jawaban sebelumnya ditampilkan ulang*</sub>"
+
+# Whole messages (after normalization) that are only a greeting or thanks
+_GREETINGS = {
+    "halo", "hallo", "hai", "hi", "hello", "hey", "pagi", "siang", "sore", "malam",
+    "selamat pagi", "selamat siang", "selamat sore", "selamat malam",
+    "assalamualaikum", "permisi", "halo kak", "hai kak", "halo bot", "halo chatbot", "hai chatbot",
+}
+_THANKS = {
+    "terima kasih", "terimakasih", "makasih", "thanks", "thank you", "thx", "tq",
+    "terima kasih kak", "makasih kak", "makasih ya", "terima kasih ya", "oke makasih", "ok makasih",
+}
+
+# Provider/model footer appended to assistant replies in the chat page
+_FOOTER_PATTERN = re.compile(r"\n*<sub>.*?</sub>\s*$", re.DOTALL)
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, strip punctuation/emoji and collapse whitespace"""
+    return " ".join(re.findall(r"[\w']+", text.lower()))
+
+
+class StageTimer:
+    """
+    Wall-clock duration of each stage of one request
+    
+    Usage:
+        timer = StageTimer()
+        with timer.stage("retrieval"):
+            ...
+        timer.stages  # {'retrieval': 0.012}
+    """
+    
+    def __init__(self):
+        """Initialize timer"""
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block (repeated stages add up)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+    
+    @property
+    def total(self) -> float:
+        """Seconds since the timer was created"""
+        return time.perf_counter() - self.started
+    
+    def describe(self) -> str:
+        """Short summary, e.g. 'retrieval 12ms · llm 1.84s'"""
+        return " · ".join(
+            f"{name} {seconds * 1000:.0f}ms" if seconds < 1 else f"{name} {seconds:.2f}s"
+            for name, seconds in self.stages.items()
+        )
+
+
+def precheck_message(
+    prompt: str,
+    messages: List[Dict[str, str]],
+    has_uploaded_code: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Answer a message without classification or an LLM call, if possible
+    
+    Args:
+        prompt: The new message
+        messages: Conversation before the new message
+        has_uploaded_code: Whether code is attached (a repeated question may
+            be about re-uploaded code, so it is never answered from history)
+    
+    Returns:
+        Dict with 'kind' ('empty', 'duplicate', 'greeting', 'thanks') and
+        'response', or None if the request needs the full pipeline
+    """
+    normalized = normalize_message(prompt)
+    if not normalized:
+        return {"kind": "empty", "response": EMPTY_REPLY}
+    
+    # Same question as the last one (e.g. resubmitted): repeat the earlier answer
+    if not has_uploaded_code and len(messages) >= 2 and messages[-1]["role"] == "assistant" and messages[-2]["role"] == "user":
+        previous_answer = _FOOTER_PATTERN.sub("", messages[-1]["content"])
+        if (
+            normalize_message(messages[-2]["content"]) == normalized
+            and previous_answer.strip()
+            and not previous_answer.lstrip().startswith("⚠️")
+            and TRUNCATED_NOTE not in previous_answer
+        ):
+            return {"kind": "duplicate", "response": previous_answer + DUPLICATE_NOTE}
+    
+    if normalized in _GREETINGS:
+        return {"kind": "greeting", "response": GREETING_REPLY}
+    if normalized in _THANKS:
+        return {"kind": "thanks", "response": THANKS_REPLY}
+    return None
+
+
+def template_reply(response_strategy: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Answer from a template once the question type is known
+    
+    Args:
+        response_strategy: QuestionDetector.get_response_strategy() result
+    
+    Returns:
+        Dict with 'kind' ('homework') and 'response', or None
+    """
+    if response_strategy["should_reject"]:
+        return {"kind": "homework", "response": HOMEWORK_REPLY}
+    return None
@@ -0,0 +1,325 @@
+"""
+Response Cache
+Cache LLM answers for repeated student questions, with optional near-duplicate matching (MinHash LSH)
+"""
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Set, Callable
+
+
+# Filler words that do not change what is being asked
+# (question intent is already part of the key via QuestionType)
+FILLER_WORDS = {
+    "apa", "itu", "ini", "yang", "adalah", "dan", "atau", "dengan", "untuk", "dari", "ke", "di",
+    "tolong", "mohon", "dong", "deh", "ya", "yah", "kak", "pak", "bu", "min", "sih", "nih",
+    "jelaskan", "jelasin", "terangkan", "sebutkan", "bagaimana", "gimana", "saya", "aku", "kamu",
+    "bisakah", "tentang", "mengenai", "secara", "singkat",
+    "what", "is", "are", "the", "a", "an", "of", "please", "explain", "how", "does", "do", "about",
+}
+
+# Words that turn a question into its opposite: a near-duplicate that differs
+# from the cached question in one of these is never a match
+NEGATION_WORDS = {
+    "tidak", "tak", "nggak", "gak", "enggak", "bukan", "belum", "jangan", "tanpa",
+    "not", "no", "without", "never",
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Normalize a question for exact matching
+    
+    Args:
+        text: Raw user question
+    
+    Returns:
+        Lowercased text with punctuation removed and whitespace collapsed
+    """
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def content_tokens(normalized: str) -> Set[str]:
+    """Words of a normalized question that carry meaning (filler words removed)"""
+    tokens = {t for t in normalized.split() if t not in FILLER_WORDS}
+    return tokens or set(normalized.split())
+
+
+def text_hash(text: Optional[str]) -> str:
+    """Stable short hash of a text (system prompt, previous answer, ...)"""
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    In-memory LRU + TTL cache of chatbot answers
+    
+    Entries live in a namespace built from the question type, system prompt hash
+    and conversation context, so a hit is only possible when everything except
+    the wording of the question is the same. Callers can pass `is_valid` to
+    reject entries whose sources changed (e.g. a replaced learning material). Within a
+    namespace the question matches exactly after normalization, or (optionally)
+    as a near-duplicate: MinHash LSH finds candidates and the Jaccard similarity
+    of their content words must reach the threshold.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 500,
+        ttl_seconds: float = 24 * 3600,
+        near_duplicate: bool = True,
+        similarity_threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16
+    ):
+        """
+        Initialize response cache
+        
+        Args:
+            max_entries: Maximum cached answers (least recently used are evicted)
+            ttl_seconds: Seconds before a cached answer expires
+            near_duplicate: Also match differently-worded questions
+            similarity_threshold: Minimum Jaccard similarity of content words for a near match
+            num_perm: Number of MinHash permutations
+            bands: LSH bands (num_perm must be divisible by bands)
+        """
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicate = near_duplicate
+        self.similarity_threshold = similarity_threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        
+        # Fixed seed so signatures are reproducible across processes
+        rng = random.Random(1337)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[Tuple[str, str]]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def make_namespace(
+        question_type: str,
+        system_prompt: Optional[str],
+        context: Optional[str] = None
+    ) -> str:
+        """
+        Build the namespace part of a cache key
+        
+        Args:
+            question_type: Detected QuestionType value
+            system_prompt: Base system prompt (hashed)
+            context: Text the question depends on, e.g. the previous assistant reply
+                (None/empty for a standalone question)
+        
+        Returns:
+            Namespace string
+        """
+        return "|".join([question_type, text_hash(system_prompt), text_hash(context)])
+    
+    def _signature(self, tokens: Set[str]) -> List[int]:
+        """MinHash signature of a token set"""
+        hashes = [
+            int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big")
+            for t in tokens
+        ]
+        return [
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._perms
+        ]
+    
+    def _band_keys(self, namespace: str, signature: List[int]):
+        """LSH bucket keys for a signature"""
+        for band in range(self.bands):
+            start = band * self.rows
+            yield (namespace, band, tuple(signature[start:start + self.rows]))
+    
+    def _remove(self, key: Tuple[str, str]):
+        """Drop an entry and its LSH bucket memberships (lock held)"""
+        entry = self._entries.pop(key, None)
+        if entry and entry.get("signature"):
+            for band_key in self._band_keys(key[0], entry["signature"]):
+                bucket = self._buckets.get(band_key)
+                if bucket:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band_key]
+    
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        """Check whether an entry is older than the TTL"""
+        return now - entry["created_at"] > self.ttl_seconds
+    
+    def get(
+        self,
+        prompt: str,
+        namespace: str,
+        is_valid: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer
+        
+        Args:
+            prompt: User question
+            namespace: Namespace from make_namespace
+            is_valid: Called with an entry's metadata; entries it rejects are
+                dropped and treated as a miss
+        
+        Returns:
+            Dict with 'response', 'metadata', 'match' ('exact' or 'near') and
+            'similarity', or None on a miss
+        """
+        normalized = normalize_prompt(prompt)
+        if not normalized:
+            return None
+        
+        key = (namespace, normalized)
+        now = time.time()
+        
+        def usable(entry_key, entry) -> bool:
+            if self._is_expired(entry, now) or (is_valid and not is_valid(entry["metadata"])):
+                self._remove(entry_key)
+                return False
+            return True
+        
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry and not usable(key, entry):
+                entry = None
+            
+            if entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return {"response": entry["response"], "metadata": entry["metadata"], "match": "exact", "similarity": 1.0}
+            
+            if self.near_duplicate:
+                tokens = content_tokens(normalized)
+                best_key, best_similarity = None, 0.0
+                candidates = set()
+                for band_key in self._band_keys(namespace, self._signature(tokens)):
+                    candidates |= self._buckets.get(band_key, set())
+                
+                for candidate in candidates:
+                    candidate_entry = self._entries.get(candidate)
+                    if not candidate_entry or not usable(candidate, candidate_entry):
+                        continue
+                    other = candidate_entry["tokens"]
+                    if (tokens ^ other) & NEGATION_WORDS:
+                        continue
+                    similarity = len(tokens & other) / len(tokens | other)
+                    if similarity > best_similarity:
+                        best_key, best_similarity = candidate, similarity
+                
+                if best_key and best_similarity >= self.similarity_threshold:
+                    entry = self._entries[best_key]
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    self.near_hits += 1
+                    return {"response": entry["response"], "metadata": entry["metadata"], "match": "near", "similarity": best_similarity}
+            
+            self.misses += 1
+            return None
+    
+    def put(self, prompt: str, namespace: str, response: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Store an answer
+        
+        Args:
+            prompt: User question
+            namespace: Namespace from make_namespace
+            response: Answer text to cache
+            metadata: Extra info to return with hits (model, provider, ...)
+        """
+        normalized = normalize_prompt(prompt)
+        if not normalized or not response:
+            return
+        
+        key = (namespace, normalized)
+        tokens = content_tokens(normalized)
+        signature = self._signature(tokens) if self.near_duplicate else None
+        
+        with self.lock:
+            self._remove(key)
+            self._entries[key] = {
+                "response": response,
+                "metadata": metadata or {},
+                "created_at": time.time(),
+                "tokens": tokens,
+                "signature": signature
+            }
+            if signature:
+                for band_key in self._band_keys(namespace, signature):
+                    self._buckets.setdefault(band_key, set()).add(key)
+            
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+    
+    def clear(self):
+        """Remove all cached answers and reset counters"""
+        with self.lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self.hits = self.near_hits = self.misses = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+        
+        Returns:
+            Dict with 'entries', 'hits', 'near_hits', 'misses', 'hit_rate'
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+# Global response cache instance
+_cache_instance = None
+
+def get_response_cache() -> ResponseCache:
+    """Get or create global response cache instance (configured from environment)"""
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = ResponseCache(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600))),
+            near_duplicate=os.getenv("RESPONSE_CACHE_NEAR_DUPLICATE", "true").lower() == "true",
+            similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.8"))
+        )
+    return _cache_instance
+
+
+if __name__ == "__main__":
+    # Regression checks: a near-duplicate must never answer the opposite question
+    cache = ResponseCache()
+    cache.put("kapan binary search tidak bisa dipakai", "ns", "jawaban: tidak bisa dipakai")
+    assert cache.get("kapan binary search bisa dipakai", "ns") is None
+    cache.put("kenapa rekursi fibonacci lambat sekali", "ns", "jawaban: lambat")
+    assert cache.get("kenapa rekursi fibonacci tidak lambat sekali", "ns") is None
+    cache.put("jelaskan cara kerja quick sort pada array", "ns", "jawaban: quick sort")
+    assert cache.get("tolong jelaskan cara kerja quick sort pada array dong", "ns")["match"] in ("exact", "near")
+    print("Response cache checks passed:", cache.get_stats())